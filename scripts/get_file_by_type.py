@@ -1,7 +1,182 @@
 #!/usr/bin/env python3
 import argparse
+import heapq
+import json
 import os
+import sys
+import time
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from queue import SimpleQueue
+
+
+# Magic bytes at the start of a file, keyed by their first two bytes so that a header
+# is only compared with the few signatures sharing its prefix. Longest come first.
+SIGNATURES = (
+    (b"SQLite format 3\x00", "sqlite"),
+    (b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1", "ole2"),
+    (b"\x89PNG\r\n\x1a\n", "png"),
+    (b"7z\xbc\xaf\x27\x1c", "7z"),
+    (b"\xfd7zXZ\x00", "xz"),
+    (b"Rar!\x1a\x07", "rar"),
+    (b"GIF87a", "gif"),
+    (b"GIF89a", "gif"),
+    (b"%PDF-", "pdf"),
+    (b"{\\rtf", "rtf"),
+    (b"\x7fELF", "elf"),
+    (b"\xfe\xed\xfa\xce", "mach-o"),
+    (b"\xfe\xed\xfa\xcf", "mach-o"),
+    (b"\xce\xfa\xed\xfe", "mach-o"),
+    (b"\xcf\xfa\xed\xfe", "mach-o"),
+    (b"\xca\xfe\xba\xbe", "java-class/mach-o-fat"),
+    (b"\x00asm", "wasm"),
+    (b"PK\x03\x04", "zip"),
+    (b"PK\x05\x06", "zip"),
+    (b"PK\x07\x08", "zip"),
+    (b"\x28\xb5\x2f\xfd", "zstd"),
+    (b"\x1a\x45\xdf\xa3", "matroska"),
+    (b"OggS", "ogg"),
+    (b"RIFF", "riff"),
+    (b"%!PS", "postscript"),
+    (b"\xff\xd8\xff", "jpeg"),
+    (b"BZh", "bzip2"),
+    (b"ID3", "mp3"),
+    (b"\x1f\x8b", "gzip"),
+    (b"MZ", "pe"),
+    (b"#!", "script"),
+)
+SIGNATURES_BY_PREFIX = defaultdict(list)
+for magic, file_type in SIGNATURES:
+    SIGNATURES_BY_PREFIX[magic[:2]].append((magic, file_type))
+# Signatures that do not start at the first byte, as (offset, magic bytes, type)
+OFFSET_SIGNATURES = ((257, b"ustar", "tar"),)
+HEADER_SIZE = 512
+SNAPSHOT_VERSION = 1
+# A directory changed this close to the start of the walk that recorded it may have
+# changed again within the same mtime tick after it was listed, so it is listed again
+RACY_WINDOW_NS = 2_000_000_000
+
+
+def detect_type(header):
+    if not header:
+        return "empty"
+    for magic, file_type in SIGNATURES_BY_PREFIX.get(header[:2], ()):
+        if header.startswith(magic):
+            return file_type
+    for offset, magic, file_type in OFFSET_SIGNATURES:
+        if header.startswith(magic, offset):
+            return file_type
+    if b"\x00" in header:
+        return "data"
+    try:
+        header.decode("utf-8")
+    except UnicodeDecodeError as error:
+        # A character cut off at the end of the header is no reason to call it binary
+        if error.reason != "unexpected end of data":
+            return "data"
+    return "text"
+
+
+def display_extension(ext):
+    return (ext[1:] if ext.startswith(".") else ext) or "(none)"
+
+
+def format_size(size):
+    for unit in ("B", "KiB", "MiB", "GiB", "TiB"):
+        if size < 1024 or unit == "TiB":
+            break
+        size /= 1024
+    return f"{size} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+
+
+def load_snapshot(snapshot_file, folder_path):
+    """Returns the previous snapshot of the folder, or None if it cannot be reused."""
+    try:
+        with open(snapshot_file) as file:
+            snapshot = json.load(file)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        print(f"Ignoring unreadable snapshot {snapshot_file}: {e}", file=sys.stderr)
+        return None
+    if (
+        snapshot.get("version") != SNAPSHOT_VERSION
+        or snapshot.get("root") != os.path.realpath(folder_path)
+        or snapshot.get("excluded") != list(FileCounter.EXCLUDED_FOLDERS)
+    ):
+        return None
+    return snapshot
+
+
+def save_snapshot(snapshot_file, snapshot):
+    # Written aside and renamed, so an interrupted run leaves the previous snapshot
+    temporary_file = f"{snapshot_file}.tmp"
+    with open(temporary_file, "w") as file:
+        json.dump(snapshot, file, separators=(",", ":"))
+    os.replace(temporary_file, snapshot_file)
+
+
+def snapshot_counts(snapshot):
+    counts = defaultdict(int)
+    for entry in (snapshot or {}).get("directories", {}).values():
+        for file_extension, count in entry["counts"].items():
+            counts[file_extension] += count
+    return counts
+
+
+class ExtensionStats:
+    """Count, sizes and largest files of one extension."""
+
+    __slots__ = ("count", "disk_bytes", "apparent_bytes", "largest", "detected")
+
+    def __init__(self):
+        self.count = 0
+        self.disk_bytes = 0
+        self.apparent_bytes = 0
+        # Min-heap of (disk bytes, apparent bytes, path), at most the top largest files
+        self.largest = []
+        self.detected = defaultdict(int)
+
+    def add_size(self, disk_bytes, apparent_bytes, path, top):
+        self.disk_bytes += disk_bytes
+        self.apparent_bytes += apparent_bytes
+        # Most files are smaller than the smallest one kept, skip building their item
+        if len(self.largest) < top or (top and disk_bytes >= self.largest[0][0]):
+            self.keep_largest((disk_bytes, apparent_bytes, path), top)
+
+    def keep_largest(self, item, top):
+        if len(self.largest) < top:
+            heapq.heappush(self.largest, item)
+        elif top and item > self.largest[0]:
+            heapq.heapreplace(self.largest, item)
+
+    def merge(self, other, top):
+        self.count += other.count
+        self.disk_bytes += other.disk_bytes
+        self.apparent_bytes += other.apparent_bytes
+        for item in other.largest:
+            self.keep_largest(item, top)
+        for file_type, count in other.detected.items():
+            self.detected[file_type] += count
+
+    def to_dict(self, extension):
+        return {
+            "extension": extension,
+            "count": self.count,
+            "disk_bytes": self.disk_bytes,
+            "apparent_bytes": self.apparent_bytes,
+            "largest": [
+                {
+                    "path": path,
+                    "disk_bytes": disk_bytes,
+                    "apparent_bytes": apparent_bytes,
+                }
+                for disk_bytes, apparent_bytes, path in sorted(
+                    self.largest, reverse=True
+                )
+            ],
+            "detected": dict(self.detected),
+        }
 
 
 class FileCounter:
@@ -15,27 +190,230 @@ class FileCounter:
         "node_modules",
     )
 
-    def __init__(self, folder_path):
+    # Directory listings mostly wait on the file system, more threads than CPUs pay off
+    DEFAULT_JOBS = min(32, (os.cpu_count() or 1) * 4)
+
+    # Files whose headers are read by one task
+    SNIFF_BATCH = 256
+
+    def __init__(
+        self,
+        folder_path,
+        jobs=None,
+        sizes=False,
+        top=0,
+        sniff=False,
+        previous_snapshot=None,
+        record_snapshot=False,
+    ):
         self.folder_path = folder_path
+        self.jobs = jobs or self.DEFAULT_JOBS
+        self.sizes = sizes or top > 0
+        self.top = top
+        self.sniff = sniff
+        self.previous_snapshot = previous_snapshot
+        # Relative path -> mtime, counts and subdirectories of every directory walked
+        self.directories = {} if record_snapshot or previous_snapshot else None
+        self.started_ns = None
 
-    def count_files_by_extension(self):
-        file_count_by_extension = defaultdict(int)
+    def scan_directory(self, path):
+        """Collects the files directly in a directory and the subdirectories to walk.
+
+        Excluded directories are pruned here, before anything below them is listed,
+        and the type information of the DirEntry objects saves a stat call per entry
+        on most file systems. Like os.walk, symbolic links to directories are neither
+        counted nor followed. Sizes are only read when requested. Files with several
+        hard links are returned apart, their sizes are added once per inode while
+        merging. When sniffing, files without an extension are counted too and the
+        regular files are returned to have their headers read in batches.
+        """
+        stats = defaultdict(ExtensionStats)
+        linked = []
+        subdirectories = []
+        to_sniff = []
+        try:
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    try:
+                        is_dir = entry.is_dir()
+                    except OSError:
+                        is_dir = False
+                    if is_dir:
+                        if (
+                            entry.name not in self.EXCLUDED_FOLDERS
+                            and not entry.is_symlink()
+                        ):
+                            subdirectories.append(entry.path)
+                        continue
+                    _, file_extension = os.path.splitext(entry.name)
+                    if not file_extension and not self.sniff:
+                        continue
+                    extension_stats = stats[file_extension.lower()]
+                    extension_stats.count += 1
+                    if self.sniff:
+                        try:
+                            is_file = entry.is_file(follow_symlinks=False)
+                        except OSError:
+                            is_file = False
+                        if is_file:
+                            to_sniff.append((file_extension.lower(), entry.path))
+                        else:  # Never open FIFOs and devices, they may block
+                            file_type = "symlink" if entry.is_symlink() else "special"
+                            extension_stats.detected[file_type] += 1
+                    if not self.sizes:
+                        continue
+                    try:
+                        stat = entry.stat(follow_symlinks=False)
+                    except OSError:
+                        continue  # Removed since it was listed
+                    # Disk usage counts the allocated blocks like du, Windows has no
+                    # st_blocks
+                    disk_bytes = (
+                        stat.st_blocks * 512
+                        if hasattr(stat, "st_blocks")
+                        else stat.st_size
+                    )
+                    if stat.st_nlink > 1:
+                        linked.append(
+                            (
+                                file_extension.lower(),
+                                (stat.st_dev, stat.st_ino),
+                                disk_bytes,
+                                stat.st_size,
+                                entry.path,
+                            )
+                        )
+                    else:
+                        extension_stats.add_size(
+                            disk_bytes, stat.st_size, entry.path, self.top
+                        )
+        except OSError:
+            pass  # Unreadable directories are skipped, as os.walk does
+        return stats, linked, subdirectories, to_sniff
 
-        for root, _, files in os.walk(self.folder_path):
-            if any(folder in root for folder in self.EXCLUDED_FOLDERS):
+    def visit_directory(self, path):
+        """Scans a directory, or reuses its counts from the previous snapshot.
+
+        A directory's mtime changes whenever an entry is added, removed or renamed in
+        it, so an unchanged directory costs a single stat instead of a listing. Its
+        subdirectories are still visited, as they change independently.
+        """
+        if self.directories is None:
+            return self.scan_directory(path)
+        # Read before listing, so changes made meanwhile make it look modified next time
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except OSError:
+            return {}, [], [], []
+        relative_path = os.path.relpath(path, self.folder_path)
+        previous = self.previous_snapshot or {}
+        entry = previous.get("directories", {}).get(relative_path)
+        if (
+            entry
+            and entry["mtime_ns"] == mtime_ns
+            and mtime_ns < previous["started_ns"] - RACY_WINDOW_NS
+        ):
+            stats = defaultdict(ExtensionStats)
+            for file_extension, count in entry["counts"].items():
+                stats[file_extension].count = count
+            subdirectories = [
+                os.path.join(path, name) for name in entry["subdirectories"]
+            ]
+            result = stats, [], subdirectories, []
+        else:
+            result = self.scan_directory(path)
+            stats, _, subdirectories, _ = result
+            entry = {
+                "mtime_ns": mtime_ns,
+                "counts": {ext: stats[ext].count for ext in stats},
+                "subdirectories": [os.path.basename(sub) for sub in subdirectories],
+            }
+        self.directories[relative_path] = entry
+        return result
+
+    def snapshot(self):
+        return {
+            "version": SNAPSHOT_VERSION,
+            "root": os.path.realpath(self.folder_path),
+            "excluded": list(self.EXCLUDED_FOLDERS),
+            "started_ns": self.started_ns,
+            "directories": self.directories,
+        }
+
+    @staticmethod
+    def sniff_files(files):
+        """Detects the type of each file from its first bytes, returned like a folder.
+
+        Only one file is open at a time, so the open descriptors are bounded by the
+        number of threads.
+        """
+        stats = defaultdict(ExtensionStats)
+        for file_extension, path in files:
+            try:
+                fd = os.open(path, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+            except OSError:
+                stats[file_extension].detected["unreadable"] += 1
                 continue
+            try:
+                header = os.read(fd, HEADER_SIZE)
+            except OSError:
+                header = None
+            finally:
+                os.close(fd)
+            file_type = "unreadable" if header is None else detect_type(header)
+            stats[file_extension].detected[file_type] += 1
+        return stats, [], [], []
+
+    def collect_statistics(self):
+        stats_by_extension = defaultdict(ExtensionStats)
+        seen_inodes = set()
+        self.started_ns = time.time_ns()
+        if self.directories is not None:
+            self.directories = {}
+
+        # Every directory is listed by its own task, so independent subtrees are walked
+        # in parallel while the results are merged here. Finished tasks are queued as
+        # they complete, waiting on the set of pending futures would cost time in its
+        # size.
+        finished = SimpleQueue()
+        with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+
+            def submit(task, argument):
+                future = executor.submit(task, argument)
+                future.add_done_callback(finished.put)
 
-            for file in files:
-                _, file_extension = os.path.splitext(file)
-                if file_extension:
-                    file_count_by_extension[file_extension.lower()] += 1
+            submit(self.visit_directory, self.folder_path)
+            pending = 1
+            while pending:
+                stats, linked, subdirectories, to_sniff = finished.get().result()
+                pending -= 1
+                for file_extension, extension_stats in stats.items():
+                    stats_by_extension[file_extension].merge(extension_stats, self.top)
+                for file_extension, inode, disk_bytes, apparent_bytes, path in linked:
+                    if inode not in seen_inodes:
+                        seen_inodes.add(inode)
+                        stats_by_extension[file_extension].add_size(
+                            disk_bytes, apparent_bytes, path, self.top
+                        )
+                for subdirectory in subdirectories:
+                    submit(self.visit_directory, subdirectory)
+                pending += len(subdirectories)
+                for start in range(0, len(to_sniff), self.SNIFF_BATCH):
+                    submit(self.sniff_files, to_sniff[start : start + self.SNIFF_BATCH])
+                    pending += 1
 
+        return stats_by_extension
+
+    def count_files_by_extension(self):
+        file_count_by_extension = defaultdict(int)
+        for file_extension, extension_stats in self.collect_statistics().items():
+            file_count_by_extension[file_extension] = extension_stats.count
         return file_count_by_extension
 
 
 class SortByCountStrategy:
     def sort(self, results):
-        return sorted(results.items(), key=lambda x: x[1], reverse=True)
+        return sorted(results.items(), key=lambda x: x[1].count, reverse=True)
 
 
 class SortByExtensionStrategy:
@@ -43,23 +421,150 @@ class SortByExtensionStrategy:
         return sorted(results.items(), key=lambda x: x[0][1:].lower())
 
 
+class SortBySizeStrategy:
+    def sort(self, results):
+        return sorted(results.items(), key=lambda x: x[1].disk_bytes, reverse=True)
+
+
 class MainApp:
-    def __init__(self, folder_path, sorting_strategy):
-        self.file_counter = FileCounter(folder_path)
+    def __init__(
+        self,
+        folder_path,
+        sorting_strategy,
+        jobs=None,
+        sizes=False,
+        top=0,
+        as_json=False,
+        sniff=False,
+        snapshot_file=None,
+        diff=False,
+    ):
+        previous_snapshot = None
+        if snapshot_file:
+            previous_snapshot = load_snapshot(snapshot_file, folder_path)
+        self.file_counter = FileCounter(
+            folder_path,
+            jobs,
+            sizes,
+            top,
+            sniff,
+            previous_snapshot,
+            record_snapshot=snapshot_file is not None,
+        )
         self.sorting_strategy = sorting_strategy
+        self.as_json = as_json
+        self.snapshot_file = snapshot_file
+        self.diff = diff
 
     def count_and_sort_files(self):
-        results = self.file_counter.count_files_by_extension()
+        results = self.file_counter.collect_statistics()
+        if self.snapshot_file:
+            save_snapshot(self.snapshot_file, self.file_counter.snapshot())
+        if self.diff:
+            before = snapshot_counts(self.file_counter.previous_snapshot)
+            after = {ext: stats.count for ext, stats in results.items()}
+            self.print_diff(before, after, self.as_json)
+            return
         sorted_results = self.sorting_strategy.sort(results)
-        self.print_results(sorted_results)
+        if self.as_json:
+            self.print_json(
+                sorted_results, self.file_counter.sizes, self.file_counter.sniff
+            )
+            return
+        if self.file_counter.sizes:
+            self.print_size_results(sorted_results)
+        else:
+            self.print_results(sorted_results)
+        if self.file_counter.sniff:
+            self.print_detected_types(sorted_results)
 
     @staticmethod
     def print_results(results):
         print("File Type | Count")
         print("-----------------")
-        for ext, count in results:
-            ext_without_dot = ext[1:] if ext.startswith(".") else ext
-            print(f"{ext_without_dot} | {count}")
+        for ext, stats in results:
+            ext_without_dot = display_extension(ext)
+            print(f"{ext_without_dot} | {stats.count}")
+
+    @staticmethod
+    def print_size_results(results):
+        total = ExtensionStats()
+        print("File Type | Count | Disk Usage | Apparent Size")
+        print("---------------------------------------------")
+        for ext, stats in results:
+            ext_without_dot = display_extension(ext)
+            print(
+                f"{ext_without_dot} | {stats.count} | {format_size(stats.disk_bytes)}"
+                f" | {format_size(stats.apparent_bytes)}"
+            )
+            total.merge(stats, 0)
+        print(
+            f"total | {total.count} | {format_size(total.disk_bytes)}"
+            f" | {format_size(total.apparent_bytes)}"
+        )
+        for ext, stats in results:
+            if not stats.largest:
+                continue
+            ext_without_dot = display_extension(ext)
+            print(f"\nLargest {ext_without_dot} files:")
+            for disk_bytes, _, path in sorted(stats.largest, reverse=True):
+                print(f"{format_size(disk_bytes)} | {path}")
+
+    @staticmethod
+    def print_detected_types(results):
+        print("\nFile Type | Detected Type | Count")
+        print("---------------------------------")
+        for ext, stats in results:
+            ext_without_dot = display_extension(ext)
+            for file_type, count in sorted(
+                stats.detected.items(), key=lambda x: (-x[1], x[0])
+            ):
+                print(f"{ext_without_dot} | {file_type} | {count}")
+
+    @staticmethod
+    def print_diff(before, after, as_json):
+        changes = [
+            (ext, before.get(ext, 0), after.get(ext, 0))
+            for ext in before.keys() | after.keys()
+            if before.get(ext, 0) != after.get(ext, 0)
+        ]
+        changes.sort(key=lambda x: (-abs(x[2] - x[1]), x[0]))
+        if as_json:
+            print(
+                json.dumps(
+                    [
+                        {
+                            "extension": ext[1:],
+                            "before": old,
+                            "after": new,
+                            "change": new - old,
+                        }
+                        for ext, old, new in changes
+                    ],
+                    indent=2,
+                )
+            )
+            return
+        if not changes:
+            print("No changes since the previous snapshot.")
+            return
+        print("File Type | Before | After | Change")
+        print("-----------------------------------")
+        for ext, old, new in changes:
+            print(f"{display_extension(ext)} | {old} | {new} | {new - old:+d}")
+
+    @staticmethod
+    def print_json(results, sizes, sniff):
+        keys = ["extension", "count"]
+        if sizes:
+            keys += ["disk_bytes", "apparent_bytes", "largest"]
+        if sniff:
+            keys.append("detected")
+        extensions = []
+        for ext, stats in results:
+            item = stats.to_dict(ext[1:])
+            extensions.append({key: item[key] for key in keys})
+        print(json.dumps(extensions, indent=2))
 
 
 def main():
@@ -83,16 +588,79 @@ def main():
         action="store_true",
         help="Sort by extension name",
     )
+    group.add_argument(
+        "-S",
+        "--sort-size",
+        action="store_true",
+        help="Sort by disk usage (implies --sizes)",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        help=f"Directories listed in parallel (default: {FileCounter.DEFAULT_JOBS})",
+    )
+    parser.add_argument(
+        "-b",
+        "--sizes",
+        action="store_true",
+        help="Also total the disk usage and apparent size, counting hard links once",
+    )
+    parser.add_argument(
+        "-t",
+        "--top",
+        type=int,
+        default=0,
+        help="List the N largest files by disk usage per extension (implies --sizes)",
+    )
+    parser.add_argument(
+        "-m",
+        "--sniff",
+        action="store_true",
+        help="Also detect the type of every file from its magic bytes, counting "
+        "files without an extension too",
+    )
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON")
+    parser.add_argument(
+        "--snapshot",
+        metavar="FILE",
+        help="Record the counts and mtime of every directory in FILE and only list "
+        "the directories changed since the snapshot already there",
+    )
+    parser.add_argument(
+        "--diff",
+        action="store_true",
+        help="Report the extensions that grew or shrank since the previous snapshot",
+    )
     args = parser.parse_args()
+    if args.diff and not args.snapshot:
+        parser.error("--diff compares with the previous --snapshot")
+    if args.snapshot and (args.sizes or args.sort_size or args.top or args.sniff):
+        parser.error(
+            "--snapshot only records counts, directory mtimes do not change with the "
+            "size or content of the files"
+        )
 
     folder_path = args.directory
 
     if args.sort_extension:
         sorting_strategy = SortByExtensionStrategy()
+    elif args.sort_size:
+        sorting_strategy = SortBySizeStrategy()
     else:
         sorting_strategy = SortByCountStrategy()
 
-    file_counter_app = MainApp(folder_path, sorting_strategy)
+    file_counter_app = MainApp(
+        folder_path,
+        sorting_strategy,
+        args.jobs,
+        args.sizes or args.sort_size,
+        args.top,
+        args.json,
+        args.sniff,
+        args.snapshot,
+        args.diff,
+    )
     file_counter_app.count_and_sort_files()
 
 
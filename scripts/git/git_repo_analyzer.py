@@ -1,10 +1,1234 @@
 #!/usr/bin/env python3
 import subprocess
+import base64
 import collections
+import hashlib
+import heapq
+import json
+import math
 import os
+import posixpath
 import argparse
-from typing import List, Dict
-from datetime import datetime
+import mmap
+import multiprocessing
+import operator
+import queue
+import re
+import struct
+import zlib
+from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import List, Dict, Iterable, Iterator, Tuple
+from array import array
+from datetime import datetime, timedelta, timezone
+
+try:
+    import numpy as np
+except ImportError:  # The activity histograms fall back to pure Python loops
+    np = None
+
+# Fields emitted for every commit by the single `git log` walk, in this order.
+LOG_FIELDS = ("sha", "author", "author_email", "author_date", "committer", "committer_email", "committer_date", "subject")
+LOG_FORMAT = "%x1e%H%x00%an%x00%ae%x00%ad%x00%cn%x00%ce%x00%cd%x00%s"
+RECORD_SEPARATOR = "\x1e"
+EPOCH = datetime(1970, 1, 1)
+CACHE_VERSION = 4
+HOTSPOT_LIMIT = 20
+BACKENDS = ("git", "objects")
+# Sharded walks split the history into more ranges than workers so uneven shards balance out.
+SHARDS_PER_JOB = 4
+
+
+def _parse_raw_date(value: str) -> Tuple[int, int]:
+    """Splits a raw "<unix timestamp> <+|-hhmm>" date into the timestamp and the UTC offset in minutes."""
+    timestamp, offset = value.split(" ")
+    minutes = int(offset[1:3]) * 60 + int(offset[3:5])
+    return int(timestamp), -minutes if offset[0] == "-" else minutes
+
+
+def _raw_date_to_datetime(timestamp: int, offset: int) -> datetime:
+    return datetime.fromtimestamp(timestamp, timezone(timedelta(minutes=offset)))
+
+
+def _email_domain(email: str) -> str:
+    return email.rpartition("@")[2].lower() if "@" in email else "(none)"
+
+
+class CommitRecord:
+    """A single commit of the stream yielded by GitRepoAnalyzer.iter_commits.
+
+    Attributes:
+        sha (str): The hexadecimal commit id.
+        author, author_email, committer, committer_email (str): The commit identities.
+        author_time, committer_time (int): Unix timestamps of the author and committer dates.
+        author_offset, committer_offset (int): UTC offsets of those dates in minutes.
+        subject (str): The first paragraph of the commit message as a single line.
+        numstat (List[Tuple[int, int, str]]): Lines added, lines deleted and path of every changed file. Binary files
+            have None line counts and the "objects" backend, which does not diff trees, leaves the list empty.
+        author_date, committer_date (datetime): The dates in their original time zone."""
+
+    __slots__ = (
+        "sha",
+        "author",
+        "author_email",
+        "author_time",
+        "author_offset",
+        "committer",
+        "committer_email",
+        "committer_time",
+        "committer_offset",
+        "subject",
+        "numstat",
+    )
+
+    def __init__(
+        self,
+        sha: str,
+        author: str,
+        author_email: str,
+        author_time: int,
+        author_offset: int,
+        committer: str,
+        committer_email: str,
+        committer_time: int,
+        committer_offset: int,
+        subject: str,
+        numstat: List[Tuple[int, int, str]] = None,
+    ):
+        self.sha = sha
+        self.author = author
+        self.author_email = author_email
+        self.author_time = author_time
+        self.author_offset = author_offset
+        self.committer = committer
+        self.committer_email = committer_email
+        self.committer_time = committer_time
+        self.committer_offset = committer_offset
+        self.subject = subject
+        self.numstat = numstat if numstat is not None else []
+
+    @classmethod
+    def from_log(cls, values: List[str]) -> "CommitRecord":
+        """Builds a record from the LOG_FIELDS values of a commit, dates in the raw format."""
+        sha, author, author_email, author_date, committer, committer_email, committer_date, subject = values
+        author_time, author_offset = _parse_raw_date(author_date)
+        committer_time, committer_offset = _parse_raw_date(committer_date)
+        return cls(sha, author, author_email, author_time, author_offset, committer, committer_email, committer_time, committer_offset, subject)
+
+    @property
+    def author_date(self) -> datetime:
+        return _raw_date_to_datetime(self.author_time, self.author_offset)
+
+    @property
+    def committer_date(self) -> datetime:
+        return _raw_date_to_datetime(self.committer_time, self.committer_offset)
+
+    def __repr__(self) -> str:
+        return f"CommitRecord({self.sha[:12]} {self.author!r} {self.subject!r})"
+
+
+class CommitReducer(ABC):
+    """Folds a stream of CommitRecord objects into a mergeable aggregate.
+
+    A reducer only sees one record at a time, so it never needs the whole history in memory, and
+    reducers built over disjoint parts of a history (shards, cached runs, repositories) merge into
+    the reducer of the whole. HistoryStats and ApproximateHistoryStats are the reducers behind
+    `analyze()`; library consumers plug their own in through reduce_commits.
+
+    Methods:
+        update(record: CommitRecord):
+            Folds a single commit into the aggregate.
+
+        merge(other: CommitReducer):
+            Folds another aggregate of the same type into this one."""
+
+    @abstractmethod
+    def update(self, record: CommitRecord):
+        pass
+
+    @abstractmethod
+    def merge(self, other: "CommitReducer"):
+        pass
+
+
+def reduce_commits(records: Iterable[CommitRecord], *reducers: CommitReducer) -> Tuple[CommitReducer, ...]:
+    """Feeds every record of a single pass over `records` to all the reducers and returns them."""
+    for record in records:
+        for reducer in reducers:
+            reducer.update(record)
+    return reducers
+
+
+class HistoryStats(CommitReducer):
+    """Mergeable aggregate of everything `analyze()` derives from the commit history.
+
+    Attributes:
+        authors, author_emails, committers, committer_emails (collections.Counter): Commit counts per identity.
+        commit_count (int): Number of commits folded in.
+        message_length_total (int): Sum of the subject lengths.
+        additions, deletions (int): Total lines added and deleted.
+        author_additions, author_deletions (collections.Counter): Lines added and deleted per author name.
+        domain_additions, domain_deletions (collections.Counter): Lines added and deleted per author email domain.
+        file_churn (Dict[str, list]): Per touched path, the number of changes, the lines touched (added plus deleted),
+            the Unix timestamp of the last change, the set of author indexes and the set of domain indexes.
+        author_names (List[str]): Author names indexed by the values of author_ids.
+        domain_names (List[str]): Email domains indexed by the domain indexes of file_churn.
+        author_times, author_offsets, author_ids (array): Per commit Unix author timestamp, UTC offset in minutes
+            and author index, kept in compact typed buffers for vectorized bucketing (see compute_activity).
+        earliest, latest (datetime): Dates of the oldest and newest commits, or None when empty.
+
+    Methods:
+        update(record: CommitRecord):
+            Folds a single commit into the aggregate.
+
+        merge(other: HistoryStats):
+            Folds another aggregate into this one.
+
+        to_dict() / from_dict(data: Dict):
+            Converts the aggregate to and from a JSON-serializable dictionary.
+
+        summarize(branch_count: int, files_changed: int = None) -> Dict[str, Dict]:
+            Turns the aggregate into the data dictionary consumed by GitRepoReporter."""
+
+    def __init__(self):
+        self.authors = collections.Counter()
+        self.author_emails = collections.Counter()
+        self.committers = collections.Counter()
+        self.committer_emails = collections.Counter()
+        self.commit_count = 0
+        self.message_length_total = 0
+        self.additions = 0
+        self.deletions = 0
+        self.author_additions = collections.Counter()
+        self.author_deletions = collections.Counter()
+        self.domain_additions = collections.Counter()
+        self.domain_deletions = collections.Counter()
+        self.file_churn = {}
+        self.author_names = []
+        self.author_times = array("q")
+        self.author_offsets = array("h")
+        self.author_ids = array("I")
+        self.domain_names = []
+        self._author_index = {}
+        self._domain_index = {}
+
+    def _author_id(self, name: str) -> int:
+        author_id = self._author_index.get(name)
+        if author_id is None:
+            author_id = self._author_index[name] = len(self.author_names)
+            self.author_names.append(name)
+        return author_id
+
+    def _domain_id(self, domain: str) -> int:
+        domain_id = self._domain_index.get(domain)
+        if domain_id is None:
+            domain_id = self._domain_index[domain] = len(self.domain_names)
+            self.domain_names.append(domain)
+        return domain_id
+
+    def _date_at(self, index: int) -> datetime:
+        return _raw_date_to_datetime(self.author_times[index], self.author_offsets[index])
+
+    @property
+    def earliest(self) -> datetime:
+        if not self.author_times:
+            return None
+        if np is not None:
+            return self._date_at(int(np.argmin(np.frombuffer(self.author_times, dtype=np.int64))))
+        return self._date_at(min(range(len(self.author_times)), key=self.author_times.__getitem__))
+
+    @property
+    def latest(self) -> datetime:
+        if not self.author_times:
+            return None
+        if np is not None:
+            return self._date_at(int(np.argmax(np.frombuffer(self.author_times, dtype=np.int64))))
+        return self._date_at(max(range(len(self.author_times)), key=self.author_times.__getitem__))
+
+    @property
+    def contributor_count(self) -> int:
+        return len(self.authors)
+
+    @property
+    def file_count(self) -> int:
+        return len(self.file_churn)
+
+    def update(self, record: CommitRecord):
+        self.commit_count += 1
+        self.authors[record.author] += 1
+        self.author_emails[record.author_email] += 1
+        self.committers[record.committer] += 1
+        self.committer_emails[record.committer_email] += 1
+        self.message_length_total += len(record.subject)
+
+        timestamp = record.author_time
+        author_id = self._author_id(record.author)
+        self.author_times.append(timestamp)
+        self.author_offsets.append(record.author_offset)
+        self.author_ids.append(author_id)
+        if not record.numstat:
+            return
+
+        domain = _email_domain(record.author_email)
+        domain_id = self._domain_id(domain)
+        added_total = deleted_total = 0
+        for added, deleted, filename in record.numstat:
+            lines = 0
+            if added is not None:
+                added_total += added
+                deleted_total += deleted
+                lines = added + deleted
+            churn = self.file_churn.get(filename)
+            if churn is None:
+                churn = self.file_churn[filename] = [0, 0, timestamp, set(), set()]
+            churn[0] += 1
+            churn[1] += lines
+            churn[2] = max(churn[2], timestamp)
+            churn[3].add(author_id)
+            churn[4].add(domain_id)
+        self.additions += added_total
+        self.deletions += deleted_total
+        self.author_additions[record.author] += added_total
+        self.author_deletions[record.author] += deleted_total
+        self.domain_additions[domain] += added_total
+        self.domain_deletions[domain] += deleted_total
+
+    def merge(self, other: "HistoryStats"):
+        self.authors.update(other.authors)
+        self.author_emails.update(other.author_emails)
+        self.committers.update(other.committers)
+        self.committer_emails.update(other.committer_emails)
+        self.commit_count += other.commit_count
+        self.message_length_total += other.message_length_total
+        self.additions += other.additions
+        self.deletions += other.deletions
+        self.author_additions.update(other.author_additions)
+        self.author_deletions.update(other.author_deletions)
+        self.domain_additions.update(other.domain_additions)
+        self.domain_deletions.update(other.domain_deletions)
+
+        mapping = array("I", [self._author_id(name) for name in other.author_names])
+        domain_mapping = [self._domain_id(domain) for domain in other.domain_names]
+        for filename, (changes, lines, last_touched, author_ids, domain_ids) in other.file_churn.items():
+            churn = self.file_churn.get(filename)
+            if churn is None:
+                churn = self.file_churn[filename] = [0, 0, last_touched, set(), set()]
+            churn[0] += changes
+            churn[1] += lines
+            churn[2] = max(churn[2], last_touched)
+            churn[3].update(mapping[author_id] for author_id in author_ids)
+            churn[4].update(domain_mapping[domain_id] for domain_id in domain_ids)
+        if np is not None:
+            remapped = np.frombuffer(mapping, dtype=np.uint32)[np.frombuffer(other.author_ids, dtype=np.uint32)]
+            self.author_ids.frombytes(remapped.tobytes())
+        else:
+            self.author_ids.extend(mapping[author_id] for author_id in other.author_ids)
+        self.author_times.extend(other.author_times)
+        self.author_offsets.extend(other.author_offsets)
+
+    def to_dict(self) -> Dict:
+        return {
+            "authors": dict(self.authors),
+            "author_emails": dict(self.author_emails),
+            "committers": dict(self.committers),
+            "committer_emails": dict(self.committer_emails),
+            "commit_count": self.commit_count,
+            "message_length_total": self.message_length_total,
+            "additions": self.additions,
+            "deletions": self.deletions,
+            "author_additions": dict(self.author_additions),
+            "author_deletions": dict(self.author_deletions),
+            "domain_additions": dict(self.domain_additions),
+            "domain_deletions": dict(self.domain_deletions),
+            "file_churn": {
+                filename: [changes, lines, last, sorted(author_ids), sorted(domain_ids)]
+                for filename, (changes, lines, last, author_ids, domain_ids) in self.file_churn.items()
+            },
+            "author_names": self.author_names,
+            "domain_names": self.domain_names,
+            "author_times": base64.b64encode(self.author_times.tobytes()).decode("ascii"),
+            "author_offsets": base64.b64encode(self.author_offsets.tobytes()).decode("ascii"),
+            "author_ids": base64.b64encode(self.author_ids.tobytes()).decode("ascii"),
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "HistoryStats":
+        stats = cls()
+        for name in ("authors", "author_emails", "committers", "committer_emails"):
+            getattr(stats, name).update(data[name])
+        for name in ("author_additions", "author_deletions", "domain_additions", "domain_deletions"):
+            getattr(stats, name).update(data[name])
+        for name in ("commit_count", "message_length_total", "additions", "deletions"):
+            setattr(stats, name, data[name])
+        stats.file_churn = {
+            filename: [changes, lines, last, set(author_ids), set(domain_ids)]
+            for filename, (changes, lines, last, author_ids, domain_ids) in data["file_churn"].items()
+        }
+        for name in data["author_names"]:
+            stats._author_id(name)
+        for domain in data["domain_names"]:
+            stats._domain_id(domain)
+        for name in ("author_times", "author_offsets", "author_ids"):
+            getattr(stats, name).frombytes(base64.b64decode(data[name]))
+        return stats
+
+    def summarize(self, branch_count: int, files_changed: int = None) -> Dict[str, Dict]:
+        """Builds the dictionary described in GitRepoAnalyzer.analyze; files_changed overrides the distinct path count."""
+        earliest, latest = self.earliest, self.latest
+        repo_age = latest - earliest
+        return {
+            "authors": dict(self.authors),
+            "author_emails": dict(self.author_emails),
+            "committers": dict(self.committers),
+            "committer_emails": dict(self.committer_emails),
+            "commit_count": self.commit_count,
+            "date_range": {"earliest": earliest, "latest": latest, "duration": repo_age},
+            "file_changes": {
+                "additions": self.additions,
+                "deletions": self.deletions,
+                "files_changed": self.file_count if files_changed is None else files_changed,
+                **compute_attribution(self),
+            },
+            "branch_count": branch_count,
+            "commits_per_day": self.commit_count / (repo_age.days + 1),
+            "avg_message_length": self.message_length_total / self.commit_count,
+            "activity": compute_activity(self),
+            "hotspots": compute_hotspots(self),
+        }
+
+
+def compute_hotspots(stats: HistoryStats, limit: int = HOTSPOT_LIMIT) -> Dict[str, List[Dict]]:
+    """
+    Ranks the most changed files and directories of an aggregate.
+
+    Every directory rolls up the churn of all files below it. Only the `limit` entries with the
+    most changes (then lines touched) are selected, through bounded heaps rather than a full sort.
+
+    Args:
+        stats (HistoryStats): The aggregate holding the per-file churn index.
+        limit (int, optional): The number of files and directories to keep. Defaults to HOTSPOT_LIMIT.
+
+    Returns:
+        Dict[str, List[Dict]]: "files" and "directories" entries with their "path", "changes" (file changes),
+        "lines_touched", "authors" (distinct), "last_touched" (UTC datetime) and, for directories, "files".
+    """
+    directories = {}
+    for filename, (changes, lines, last_touched, author_ids, _) in stats.file_churn.items():
+        directory = posixpath.dirname(filename)
+        while directory:
+            rollup = directories.get(directory)
+            if rollup is None:
+                rollup = directories[directory] = [0, 0, last_touched, set(), 0]
+            rollup[0] += changes
+            rollup[1] += lines
+            rollup[2] = max(rollup[2], last_touched)
+            rollup[3].update(author_ids)
+            rollup[4] += 1
+            directory = posixpath.dirname(directory)
+
+    def describe(path: str, churn: list, rollup: bool) -> Dict:
+        entry = {"path": path, "changes": churn[0], "lines_touched": churn[1], "authors": len(churn[3])}
+        entry["last_touched"] = datetime.fromtimestamp(churn[2], timezone.utc)
+        if rollup:
+            entry["files"] = churn[4]
+        return entry
+
+    def rank(index: Dict[str, list], rollup: bool = False) -> List[Dict]:
+        top = heapq.nlargest(limit, index.items(), key=lambda x: (x[1][0], x[1][1], x[0]))
+        return [describe(path, churn, rollup) for path, churn in top]
+
+    return {"files": rank(stats.file_churn), "directories": rank(directories, rollup=True)}
+
+
+def compute_attribution(stats: HistoryStats) -> Dict[str, Dict]:
+    """
+    Attributes the line changes and touched files of an aggregate to authors and email domains.
+
+    Line counts are summed while the history is walked; the distinct files of every author and
+    domain come from the identity sets of the per-file churn index, so no extra walk is needed.
+
+    Args:
+        stats (HistoryStats): The aggregate to attribute.
+
+    Returns:
+        Dict[str, Dict]: "by_author" and "by_domain" dictionaries with author names and email domains as keys
+        and their "additions", "deletions" and "files" (distinct paths touched) as values.
+    """
+    author_files = collections.Counter()
+    domain_files = collections.Counter()
+    for _, _, _, author_ids, domain_ids in stats.file_churn.values():
+        author_files.update(author_ids)
+        domain_files.update(domain_ids)
+
+    def attribute(additions: collections.Counter, deletions: collections.Counter, names: List[str], files: collections.Counter) -> Dict:
+        touched = {names[index]: count for index, count in files.items()}
+        return {name: {"additions": additions[name], "deletions": deletions[name], "files": touched.get(name, 0)} for name in additions}
+
+    return {
+        "by_author": attribute(stats.author_additions, stats.author_deletions, stats.author_names, author_files),
+        "by_domain": attribute(stats.domain_additions, stats.domain_deletions, stats.domain_names, domain_files),
+    }
+
+
+def _month_table(first_day: int, day_span: int) -> Tuple[List[int], List[str]]:
+    """Maps every day since `first_day` (days since the Unix epoch) to a month index and lists the month labels."""
+    start = EPOCH + timedelta(days=first_day)
+    month_of_day, labels = [], []
+    for offset in range(day_span):
+        day = start + timedelta(days=offset)
+        label = f"{day.year:04d}-{day.month:02d}"
+        if not labels or labels[-1] != label:
+            labels.append(label)
+        month_of_day.append(len(labels) - 1)
+    return month_of_day, labels
+
+
+def compute_activity(stats: HistoryStats) -> Dict[str, Dict]:
+    """
+    Buckets the author timestamps of an aggregate into activity histograms.
+
+    Timestamps are shifted to the author's local time first, so the heatmap shows when people
+    actually worked. With NumPy every histogram is a single bincount over the typed buffers;
+    without it the same buckets are filled by a plain loop.
+
+    Args:
+        stats (HistoryStats): The aggregate to bucket.
+
+    Returns:
+        Dict[str, Dict]: A dictionary containing:
+            - "per_day", "per_week", "per_month": Commit counts keyed by day, week (its Monday) and month, gaps omitted.
+            - "heatmap": A 7x24 list of commit counts per day of week (Monday first) and hour of day.
+            - "authors": Per author name, the "first" and "last" commit day and the commit counts "per_month".
+    """
+    if not stats.author_times:
+        return None
+
+    if np is not None:
+        offsets = np.frombuffer(stats.author_offsets, dtype=np.int16).astype(np.int64)
+        local = np.frombuffer(stats.author_times, dtype=np.int64) + offsets * 60
+        author_ids = np.frombuffer(stats.author_ids, dtype=np.uint32).astype(np.int64)
+        days = local // 86400
+        first_day = int(days.min())
+        relative = days - first_day
+        day_span = int(relative.max()) + 1
+        month_of_day, month_labels = _month_table(first_day, day_span)
+        months = np.asarray(month_of_day, dtype=np.int64)[relative]
+
+        day_counts = np.bincount(relative, minlength=day_span).tolist()
+        heatmap = np.bincount(((days + 3) % 7) * 24 + (local % 86400) // 3600, minlength=7 * 24).reshape(7, 24).tolist()
+        author_months = np.bincount(author_ids * len(month_labels) + months, minlength=len(stats.author_names) * len(month_labels))
+        author_months = author_months.reshape(len(stats.author_names), len(month_labels))
+        first_seen = np.full(len(stats.author_names), day_span, dtype=np.int64)
+        last_seen = np.zeros(len(stats.author_names), dtype=np.int64)
+        np.minimum.at(first_seen, author_ids, relative)
+        np.maximum.at(last_seen, author_ids, relative)
+        labels = np.asarray(month_labels)
+        author_per_month = []
+        for row in author_months:
+            active = np.flatnonzero(row)
+            author_per_month.append(dict(zip(labels[active].tolist(), row[active].tolist())))
+        first_seen, last_seen = first_seen.tolist(), last_seen.tolist()
+    else:
+        first_day = min(t + o * 60 for t, o in zip(stats.author_times, stats.author_offsets)) // 86400
+        day_span = max(t + o * 60 for t, o in zip(stats.author_times, stats.author_offsets)) // 86400 - first_day + 1
+        month_of_day, month_labels = _month_table(first_day, day_span)
+        day_counts = [0] * day_span
+        heatmap = [[0] * 24 for _ in range(7)]
+        author_per_month = [{} for _ in stats.author_names]
+        first_seen = [day_span] * len(stats.author_names)
+        last_seen = [0] * len(stats.author_names)
+        for timestamp, offset, author_id in zip(stats.author_times, stats.author_offsets, stats.author_ids):
+            local = timestamp + offset * 60
+            day = local // 86400
+            relative = day - first_day
+            day_counts[relative] += 1
+            heatmap[(day + 3) % 7][(local % 86400) // 3600] += 1  # The Unix epoch was a Thursday
+            month = month_labels[month_of_day[relative]]
+            author_per_month[author_id][month] = author_per_month[author_id].get(month, 0) + 1
+            first_seen[author_id] = min(first_seen[author_id], relative)
+            last_seen[author_id] = max(last_seen[author_id], relative)
+
+    start = EPOCH + timedelta(days=first_day)
+    per_day, per_week, per_month = {}, collections.Counter(), collections.Counter()
+    for offset, count in enumerate(day_counts):
+        if count:
+            day = start + timedelta(days=offset)
+            per_day[day.strftime("%Y-%m-%d")] = count
+            per_week[(day - timedelta(days=day.weekday())).strftime("%Y-%m-%d")] += count
+            per_month[month_labels[month_of_day[offset]]] += count
+
+    authors = {
+        name: {
+            "first": (start + timedelta(days=first_seen[author_id])).strftime("%Y-%m-%d"),
+            "last": (start + timedelta(days=last_seen[author_id])).strftime("%Y-%m-%d"),
+            "per_month": dict(sorted(author_per_month[author_id].items())),
+        }
+        for author_id, name in enumerate(stats.author_names)
+    }
+
+    return {"per_day": per_day, "per_week": dict(per_week), "per_month": dict(per_month), "heatmap": heatmap, "authors": authors}
+
+
+def _hash64(value: str) -> int:
+    """Stable 64-bit hash; Python's hash() is salted per process and cannot be merged across workers."""
+    return int.from_bytes(hashlib.blake2b(value.encode("utf-8", errors="replace"), digest_size=8).digest(), "little")
+
+
+class HyperLogLog:
+    """Distinct count estimator using 2**precision one-byte registers (standard error 1.04 / sqrt(2**precision))."""
+
+    def __init__(self, precision: int = 14):
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    def add(self, hashed: int):
+        index = hashed >> (64 - self.precision)
+        remainder = hashed & ((1 << (64 - self.precision)) - 1)
+        rank = 64 - self.precision - remainder.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other: "HyperLogLog"):
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def count(self) -> int:
+        size = len(self.registers)
+        estimate = 0.7213 / (1 + 1.079 / size) * size * size / sum(2.0**-register for register in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * size and zeros:
+            estimate = size * math.log(size / zeros)  # Linear counting is more accurate for small cardinalities
+        return round(estimate)
+
+    @property
+    def relative_error(self) -> float:
+        return 1.04 / math.sqrt(len(self.registers))
+
+
+class CountMinSketch:
+    """Frequency estimator which never underestimates and overestimates by at most e / width * total
+    with probability 1 - e ** -depth."""
+
+    def __init__(self, width: int = 16384, depth: int = 4):
+        self.width = width
+        self.depth = depth
+        self.total = 0
+        self.rows = [array("Q", bytes(8 * width)) for _ in range(depth)]
+
+    def _columns(self, hashed: int) -> Iterator[int]:
+        low, high = hashed & 0xFFFFFFFF, hashed >> 32
+        return ((low + row * high) % self.width for row in range(self.depth))
+
+    def add(self, hashed: int, count: int = 1) -> int:
+        self.total += count
+        estimate = None
+        for row, column in zip(self.rows, self._columns(hashed)):
+            row[column] += count
+            if estimate is None or row[column] < estimate:
+                estimate = row[column]
+        return estimate
+
+    def estimate(self, hashed: int) -> int:
+        return min(row[column] for row, column in zip(self.rows, self._columns(hashed)))
+
+    def merge(self, other: "CountMinSketch"):
+        self.total += other.total
+        self.rows = [array("Q", map(operator.add, mine, theirs)) for mine, theirs in zip(self.rows, other.rows)]
+
+    @property
+    def epsilon(self) -> float:
+        return math.e / self.width
+
+    @property
+    def delta(self) -> float:
+        return math.exp(-self.depth)
+
+
+class TopK:
+    """The k items with the highest estimated counts, tracked with a lazily cleaned min-heap."""
+
+    def __init__(self, k: int = 100):
+        self.k = k
+        self.counts = {}
+        self._heap = []
+
+    def offer(self, item: str, count: int):
+        if item not in self.counts and len(self.counts) >= self.k:
+            while self._heap and self.counts.get(self._heap[0][1]) != self._heap[0][0]:
+                heapq.heappop(self._heap)  # Stale entry of an item whose count has grown since
+            if count <= self._heap[0][0]:
+                return
+            del self.counts[heapq.heappop(self._heap)[1]]
+        self.counts[item] = count
+        heapq.heappush(self._heap, (count, item))
+        if len(self._heap) > 4 * self.k:
+            self._heap = [(count, item) for item, count in self.counts.items()]
+            heapq.heapify(self._heap)
+
+    def items(self) -> List[Tuple[str, int]]:
+        return sorted(self.counts.items(), key=lambda x: (-x[1], x[0]))
+
+
+class FrequencySketch:
+    """Fixed-size summary of a stream of strings: distinct count, per-item frequency and the heaviest items."""
+
+    def __init__(self, precision: int = 14, width: int = 16384, depth: int = 4, top_k: int = 100):
+        self.distinct = HyperLogLog(precision)
+        self.frequencies = CountMinSketch(width, depth)
+        self.top = TopK(top_k)
+
+    def add(self, item: str, count: int = 1):
+        hashed = _hash64(item)
+        self.distinct.add(hashed)
+        self.top.offer(item, self.frequencies.add(hashed, count))
+
+    def merge(self, other: "FrequencySketch"):
+        self.distinct.merge(other.distinct)
+        self.frequencies.merge(other.frequencies)
+        candidates = set(self.top.counts) | set(other.top.counts)
+        self.top = TopK(self.top.k)
+        for item in candidates:
+            self.top.offer(item, self.frequencies.estimate(_hash64(item)))
+
+    @property
+    def memory_bytes(self) -> int:
+        return len(self.distinct.registers) + 8 * self.frequencies.width * self.frequencies.depth
+
+    def to_dict(self) -> Dict:
+        return {
+            "registers": base64.b64encode(self.distinct.registers).decode("ascii"),
+            "total": self.frequencies.total,
+            "rows": [base64.b64encode(row.tobytes()).decode("ascii") for row in self.frequencies.rows],
+            "top": self.top.counts,
+        }
+
+    def load(self, data: Dict):
+        self.distinct.registers = bytearray(base64.b64decode(data["registers"]))
+        self.frequencies.total = data["total"]
+        for row, encoded in zip(self.frequencies.rows, data["rows"]):
+            row[:] = array("Q", base64.b64decode(encoded))
+        for item, count in data["top"].items():
+            self.top.offer(item, count)
+
+
+class ApproximateHistoryStats(CommitReducer):
+    """Bounded-memory counterpart of HistoryStats for histories too large to keep every identity and path.
+
+    Authors, committers, their emails and touched files are each summarized by a FrequencySketch:
+    a HyperLogLog for the distinct count, a Count-Min sketch for frequencies and a top-k heap of the
+    heaviest items. The footprint is fixed by the sketch parameters no matter how long the history is,
+    and the aggregate stays mergeable for sharded, cached and multi-repository runs.
+
+    Attributes:
+        sketch (Dict[str, int]): The precision, width, depth and top_k parameters of every sketch.
+        sketches (Dict[str, FrequencySketch]): The sketches keyed by SKETCHED name.
+        commit_count, message_length_total, additions, deletions (int): Exact totals.
+        earliest, latest (datetime): Dates of the oldest and newest commits, or None when empty."""
+
+    SKETCHED = ("authors", "author_emails", "committers", "committer_emails", "files")
+
+    def __init__(self, precision: int = 14, width: int = 16384, depth: int = 4, top_k: int = 100):
+        self.sketch = {"precision": precision, "width": width, "depth": depth, "top_k": top_k}
+        self.sketches = {name: FrequencySketch(**self.sketch) for name in self.SKETCHED}
+        self.commit_count = 0
+        self.message_length_total = 0
+        self.additions = 0
+        self.deletions = 0
+        self._earliest = None
+        self._latest = None
+
+    @property
+    def earliest(self) -> datetime:
+        return _raw_date_to_datetime(*self._earliest) if self._earliest else None
+
+    @property
+    def latest(self) -> datetime:
+        return _raw_date_to_datetime(*self._latest) if self._latest else None
+
+    @property
+    def contributor_count(self) -> int:
+        return self.sketches["authors"].distinct.count()
+
+    @property
+    def file_count(self) -> int:
+        return self.sketches["files"].distinct.count()
+
+    def _update_dates(self, earliest: Tuple[int, int], latest: Tuple[int, int]):
+        if earliest and (self._earliest is None or earliest[0] < self._earliest[0]):
+            self._earliest = earliest
+        if latest and (self._latest is None or latest[0] > self._latest[0]):
+            self._latest = latest
+
+    def update(self, record: CommitRecord):
+        self.commit_count += 1
+        self.sketches["authors"].add(record.author)
+        self.sketches["author_emails"].add(record.author_email)
+        self.sketches["committers"].add(record.committer)
+        self.sketches["committer_emails"].add(record.committer_email)
+        self.message_length_total += len(record.subject)
+        date = (record.author_time, record.author_offset)
+        self._update_dates(date, date)
+
+        for added, deleted, filename in record.numstat:
+            if added is not None:
+                self.additions += added
+                self.deletions += deleted
+            self.sketches["files"].add(filename)
+
+    def merge(self, other: "ApproximateHistoryStats"):
+        if other.sketch != self.sketch:
+            raise ValueError("Cannot merge sketches created with different parameters")
+        for name, sketch in self.sketches.items():
+            sketch.merge(other.sketches[name])
+        self.commit_count += other.commit_count
+        self.message_length_total += other.message_length_total
+        self.additions += other.additions
+        self.deletions += other.deletions
+        self._update_dates(other._earliest, other._latest)
+
+    def to_dict(self) -> Dict:
+        return {
+            "sketch": self.sketch,
+            "sketches": {name: sketch.to_dict() for name, sketch in self.sketches.items()},
+            "commit_count": self.commit_count,
+            "message_length_total": self.message_length_total,
+            "additions": self.additions,
+            "deletions": self.deletions,
+            "earliest": self._earliest,
+            "latest": self._latest,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "ApproximateHistoryStats":
+        stats = cls(**data["sketch"])
+        for name, sketch in stats.sketches.items():
+            sketch.load(data["sketches"][name])
+        for name in ("commit_count", "message_length_total", "additions", "deletions"):
+            setattr(stats, name, data[name])
+        stats._earliest = tuple(data["earliest"]) if data["earliest"] else None
+        stats._latest = tuple(data["latest"]) if data["latest"] else None
+        return stats
+
+    def summarize(self, branch_count: int, files_changed: int = None) -> Dict[str, Dict]:
+        """Same keys as HistoryStats.summarize with estimated top-k identities, plus "contributor_count"
+        and an "approximation" section describing the sketches and their error bounds."""
+        earliest, latest = self.earliest, self.latest
+        repo_age = latest - earliest
+        frequencies = self.sketches["authors"].frequencies
+        return {
+            "authors": dict(self.sketches["authors"].top.items()),
+            "author_emails": dict(self.sketches["author_emails"].top.items()),
+            "committers": dict(self.sketches["committers"].top.items()),
+            "committer_emails": dict(self.sketches["committer_emails"].top.items()),
+            "contributor_count": self.contributor_count,
+            "commit_count": self.commit_count,
+            "date_range": {"earliest": earliest, "latest": latest, "duration": repo_age},
+            "file_changes": {
+                "additions": self.additions,
+                "deletions": self.deletions,
+                "files_changed": self.file_count if files_changed is None else files_changed,
+            },
+            "branch_count": branch_count,
+            "commits_per_day": self.commit_count / (repo_age.days + 1),
+            "avg_message_length": self.message_length_total / self.commit_count,
+            "activity": None,
+            "hotspots": None,
+            "approximation": {
+                "memory_bytes": sum(sketch.memory_bytes for sketch in self.sketches.values()),
+                "distinct_relative_error": self.sketches["authors"].distinct.relative_error,
+                "frequency_epsilon": frequencies.epsilon,
+                "frequency_confidence": 1 - frequencies.delta,
+                "hottest_files": self.sketches["files"].top.items(),
+                "file_touches": self.sketches["files"].frequencies.total,
+            },
+        }
+
+
+def new_stats(sketch: Dict[str, int] = None):
+    """Creates an empty exact aggregate, or an approximate one when sketch parameters are given."""
+    return ApproximateHistoryStats(**sketch) if sketch else HistoryStats()
+
+
+def stats_from_dict(data: Dict, sketch: Dict[str, int] = None):
+    return ApproximateHistoryStats.from_dict(data) if sketch else HistoryStats.from_dict(data)
+
+
+PACK_OBJECT_TYPES = {1: "commit", 2: "tree", 3: "blob", 4: "tag"}
+OFS_DELTA, REF_DELTA = 6, 7
+GRAPH_NO_PARENT = 0x70000000
+GRAPH_EXTRA_EDGES = 0x80000000
+IDENTITY_PATTERN = re.compile(rb"^(.*) <(.*)> (\d+) ([+-])(\d\d)(\d\d)$")
+
+
+def _mmap_file(path: str) -> memoryview:
+    with open(path, "rb") as file:
+        return memoryview(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ))
+
+
+def _fanout_search(buffer: memoryview, fanout: Tuple[int, ...], names_offset: int, sha: bytes) -> int:
+    """Binary searches a sorted table of 20-byte object names narrowed by a 256-entry fanout."""
+    low = fanout[sha[0] - 1] if sha[0] else 0
+    high = fanout[sha[0]]
+    while low < high:
+        middle = (low + high) // 2
+        name = bytes(buffer[names_offset + middle * 20 : names_offset + middle * 20 + 20])
+        if name == sha:
+            return middle
+        if name < sha:
+            low = middle + 1
+        else:
+            high = middle
+    return None
+
+
+def _read_varint(data: bytes, pos: int) -> Tuple[int, int]:
+    value, shift = 0, 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        shift += 7
+        if not byte & 0x80:
+            return value, pos
+
+
+def _apply_delta(base: bytes, delta: bytes) -> bytes:
+    _, pos = _read_varint(delta, 0)  # source size
+    target_size, pos = _read_varint(delta, pos)
+    target = bytearray()
+    while pos < len(delta):
+        opcode = delta[pos]
+        pos += 1
+        if opcode & 0x80:
+            offset, size = 0, 0
+            for bit in range(4):
+                if opcode & (1 << bit):
+                    offset |= delta[pos] << (8 * bit)
+                    pos += 1
+            for bit in range(3):
+                if opcode & (0x10 << bit):
+                    size |= delta[pos] << (8 * bit)
+                    pos += 1
+            target += base[offset : offset + (size or 0x10000)]
+        elif opcode:
+            target += delta[pos : pos + opcode]
+            pos += opcode
+        else:
+            raise ValueError("Invalid delta opcode")
+    if len(target) != target_size:
+        raise ValueError("Delta produced an object of unexpected size")
+    return bytes(target)
+
+
+class PackFile:
+    """Random access to the objects of a pack through its memory-mapped version 2 index."""
+
+    def __init__(self, index_path: str):
+        self.index = _mmap_file(index_path)
+        self.pack = _mmap_file(index_path[: -len(".idx")] + ".pack")
+        if bytes(self.index[:8]) != b"\xfftOc\x00\x00\x00\x02":
+            raise ValueError(f"Unsupported pack index format: {index_path}")
+        self.fanout = struct.unpack_from(">256I", self.index, 8)
+        count = self.fanout[255]
+        self._names = 8 + 256 * 4
+        self._offsets = self._names + count * 24  # object names followed by CRC32 values
+        self._large_offsets = self._offsets + count * 4
+
+    def find(self, sha: bytes) -> int:
+        index = _fanout_search(self.index, self.fanout, self._names, sha)
+        if index is None:
+            return None
+        (offset,) = struct.unpack_from(">I", self.index, self._offsets + index * 4)
+        if offset & 0x80000000:
+            (offset,) = struct.unpack_from(">Q", self.index, self._large_offsets + (offset & 0x7FFFFFFF) * 8)
+        return offset
+
+    def inflate(self, pos: int, size: int) -> bytes:
+        decompressor = zlib.decompressobj()
+        chunks, step = [], max(size, 4096)
+        while not decompressor.eof and pos < len(self.pack):
+            chunks.append(decompressor.decompress(self.pack[pos : pos + step]))
+            pos += step
+        return b"".join(chunks)
+
+
+class CommitGraph:
+    """Parent lookups from the memory-mapped `objects/info/commit-graph` file without inflating commits."""
+
+    def __init__(self, path: str):
+        self.data = _mmap_file(path)
+        if bytes(self.data[:4]) != b"CGPH" or self.data[4] != 1 or self.data[5] != 1:
+            raise ValueError(f"Unsupported commit-graph format: {path}")
+        chunks = {}
+        for index in range(self.data[6]):
+            chunk_id, offset = struct.unpack_from(">4sQ", self.data, 8 + index * 12)
+            chunks[chunk_id] = offset
+        self.fanout = struct.unpack_from(">256I", self.data, chunks[b"OIDF"])
+        self._names = chunks[b"OIDL"]
+        self._commits = chunks[b"CDAT"]
+        self._edges = chunks.get(b"EDGE")
+
+    def _name(self, index: int) -> bytes:
+        return bytes(self.data[self._names + index * 20 : self._names + index * 20 + 20])
+
+    def parents(self, sha: bytes) -> List[bytes]:
+        index = _fanout_search(self.data, self.fanout, self._names, sha)
+        if index is None:
+            return None
+        first, second = struct.unpack_from(">II", self.data, self._commits + index * 36 + 20)
+        parents = [] if first == GRAPH_NO_PARENT else [self._name(first)]
+        if second == GRAPH_NO_PARENT:
+            return parents
+        if not second & GRAPH_EXTRA_EDGES:
+            return parents + [self._name(second)]
+        edge = second & ~GRAPH_EXTRA_EDGES
+        while True:
+            (value,) = struct.unpack_from(">I", self.data, self._edges + edge * 4)
+            parents.append(self._name(value & ~GRAPH_EXTRA_EDGES))
+            if value & GRAPH_EXTRA_EDGES:
+                return parents
+            edge += 1
+
+
+class GitObjectReader:
+    """Reads commits straight from the object database of a repository, without the `git` binary.
+
+    Loose objects are inflated with zlib, packed objects are located through the memory-mapped
+    pack indexes and rebuilt from their delta chains, and the commit-graph file (when present)
+    answers parent lookups for commits that only need to be excluded from a walk.
+
+    Attributes:
+        git_dir (str): The `.git` directory of the repository.
+
+    Methods:
+        read_object(sha: bytes) -> Tuple[str, bytes]:
+            Returns the type and the content of an object.
+
+        resolve(revision: str) -> bytes:
+            Resolves HEAD, a ref name or a full hexadecimal object name.
+
+        iter_commits(revision_range: List[str]) -> Iterator[CommitRecord]:
+            Walks the commits like `git log` and yields them without numstat entries.
+
+        is_ancestor(commit: str, head: str) -> bool:
+            Checks whether a commit is reachable from another one.
+
+        count_remote_branches() -> int:
+            Counts the refs listed by `git branch -r`."""
+
+    DELTA_BASE_CACHE_SIZE = 256
+
+    def __init__(self, git_dir: str):
+        self.git_dir = git_dir
+        self.object_dirs = [os.path.join(git_dir, "objects")]
+        alternates = os.path.join(git_dir, "objects", "info", "alternates")
+        if os.path.isfile(alternates):
+            with open(alternates, "r") as file:
+                self.object_dirs += [os.path.join(self.object_dirs[0], line.strip()) for line in file if line.strip()]
+        self.packs = [
+            PackFile(os.path.join(object_dir, "pack", name))
+            for object_dir in self.object_dirs
+            if os.path.isdir(os.path.join(object_dir, "pack"))
+            for name in sorted(os.listdir(os.path.join(object_dir, "pack")))
+            if name.endswith(".idx")
+        ]
+        graph_path = os.path.join(self.object_dirs[0], "info", "commit-graph")
+        self.commit_graph = CommitGraph(graph_path) if os.path.isfile(graph_path) else None
+        self.shallow = set()
+        shallow_path = os.path.join(git_dir, "shallow")
+        if os.path.isfile(shallow_path):
+            with open(shallow_path, "r") as file:
+                self.shallow = {bytes.fromhex(line.strip()) for line in file if line.strip()}
+        self._delta_bases = collections.OrderedDict()
+
+    def read_object(self, sha: bytes) -> Tuple[str, bytes]:
+        name = sha.hex()
+        for object_dir in self.object_dirs:
+            path = os.path.join(object_dir, name[:2], name[2:])
+            if os.path.isfile(path):
+                with open(path, "rb") as file:
+                    header, _, content = zlib.decompress(file.read()).partition(b"\0")
+                return header.split(b" ")[0].decode("ascii"), content
+        for pack in self.packs:
+            offset = pack.find(sha)
+            if offset is not None:
+                return self._read_packed(pack, offset)
+        raise RuntimeError(f"Object {name} not found in {self.git_dir}")
+
+    def _read_packed(self, pack: PackFile, offset: int) -> Tuple[str, bytes]:
+        key = (id(pack), offset)
+        if key in self._delta_bases:
+            self._delta_bases.move_to_end(key)
+            return self._delta_bases[key]
+
+        data = pack.pack
+        byte = data[offset]
+        object_type, size, shift, pos = (byte >> 4) & 7, byte & 0x0F, 4, offset + 1
+        while byte & 0x80:
+            byte = data[pos]
+            size |= (byte & 0x7F) << shift
+            shift += 7
+            pos += 1
+
+        if object_type == OFS_DELTA:
+            byte = data[pos]
+            distance = byte & 0x7F
+            pos += 1
+            while byte & 0x80:
+                byte = data[pos]
+                distance = ((distance + 1) << 7) | (byte & 0x7F)
+                pos += 1
+            base_type, base = self._read_packed(pack, offset - distance)
+            result = base_type, _apply_delta(base, pack.inflate(pos, size))
+        elif object_type == REF_DELTA:
+            base_type, base = self.read_object(bytes(data[pos : pos + 20]))
+            result = base_type, _apply_delta(base, pack.inflate(pos + 20, size))
+        else:
+            result = PACK_OBJECT_TYPES[object_type], pack.inflate(pos, size)
+
+        self._delta_bases[key] = result
+        if len(self._delta_bases) > self.DELTA_BASE_CACHE_SIZE:
+            self._delta_bases.popitem(last=False)
+        return result
+
+    def _read_ref(self, ref: str) -> str:
+        path = os.path.join(self.git_dir, ref)
+        if os.path.isfile(path):
+            with open(path, "r") as file:
+                return file.read().strip()
+        packed_refs = os.path.join(self.git_dir, "packed-refs")
+        if os.path.isfile(packed_refs):
+            with open(packed_refs, "r") as file:
+                for line in file:
+                    parts = line.split()
+                    if len(parts) == 2 and parts[1] == ref:
+                        return parts[0]
+        return None
+
+    def resolve(self, revision: str) -> bytes:
+        value = revision
+        for _ in range(10):  # Bounded to survive symbolic ref loops
+            if re.fullmatch(r"[0-9a-f]{40}", value):
+                return bytes.fromhex(value)
+            if value.startswith("ref: "):
+                value = value[5:]
+            for candidate in (value, f"refs/heads/{value}", f"refs/tags/{value}", f"refs/remotes/{value}"):
+                target = self._read_ref(candidate)
+                if target:
+                    value = target
+                    break
+            else:
+                break
+        raise RuntimeError(f"Cannot resolve {revision} in {self.git_dir}")
+
+    def _parse_commit(self, sha: bytes) -> Tuple[List[bytes], Dict[str, bytes], bytes]:
+        object_type, content = self.read_object(sha)
+        if object_type == "tag":
+            return self._parse_commit(bytes.fromhex(content.split(b"\n", 1)[0][len(b"object ") :].decode("ascii")))
+        headers, _, message = content.partition(b"\n\n")
+        parents, identities = [], {}
+        for line in headers.split(b"\n"):
+            key, _, value = line.partition(b" ")
+            if key == b"parent":
+                parents.append(bytes.fromhex(value.decode("ascii")))
+            elif key in (b"author", b"committer"):
+                identities[key] = value
+        return parents, identities, message
+
+    def _parents(self, sha: bytes) -> List[bytes]:
+        if sha in self.shallow:
+            return []
+        parents = self.commit_graph.parents(sha) if self.commit_graph else None
+        return parents if parents is not None else self._parse_commit(sha)[0]
+
+    def _ancestry(self, tips: List[bytes]) -> set:
+        seen, stack = set(), list(tips)
+        while stack:
+            sha = stack.pop()
+            if sha not in seen:
+                seen.add(sha)
+                stack.extend(self._parents(sha))
+        return seen
+
+    @staticmethod
+    def _format_identity(value: bytes) -> Tuple[str, str, str]:
+        match = IDENTITY_PATTERN.match(value)
+        if not match:
+            return value.decode("utf-8", errors="replace"), "", ""
+        name, email, timestamp, sign, hours, minutes = match.groups()
+        formatted = (timestamp + b" " + sign + hours + minutes).decode("ascii")  # Same as `git log --date=raw`
+        return name.decode("utf-8", errors="replace"), email.decode("utf-8", errors="replace"), formatted
+
+    @staticmethod
+    def _format_subject(message: bytes) -> str:
+        lines = []
+        for line in message.lstrip(b"\n").split(b"\n"):
+            line = line.rstrip()
+            if not line:
+                break
+            lines.append(line)
+        return b" ".join(lines).decode("utf-8", errors="replace")
+
+    def iter_commits(self, revision_range: List[str] = None) -> Iterator[CommitRecord]:
+        """
+        Walks every commit reachable from the included revisions and not from the excluded ones.
+
+        Accepts the revision syntax GitRepoAnalyzer passes to `git log`: plain revisions, `^excluded`
+        revisions and `excluded..included` ranges. Commits are yielded in traversal order rather than
+        by date, which does not matter for aggregates.
+
+        Args:
+            revision_range (List[str], optional): The revisions to walk. Defaults to HEAD.
+
+        Yields:
+            CommitRecord: Every commit of the range, with an empty numstat list.
+        """
+        includes, excludes = [], []
+        for revision in revision_range or ["HEAD"]:
+            if ".." in revision:
+                excluded, included = revision.split("..", 1)
+                excludes.append(self.resolve(excluded or "HEAD"))
+                includes.append(self.resolve(included or "HEAD"))
+            elif revision.startswith("^"):
+                excludes.append(self.resolve(revision[1:]))
+            else:
+                includes.append(self.resolve(revision))
+
+        seen, stack = self._ancestry(excludes), includes
+        while stack:
+            sha = stack.pop()
+            if sha in seen:
+                continue
+            seen.add(sha)
+            parents, identities, message = self._parse_commit(sha)
+            if sha not in self.shallow:  # Parents of shallow boundary commits are not in the clone
+                stack.extend(parents)
+            author = self._format_identity(identities.get(b"author", b""))
+            committer = self._format_identity(identities.get(b"committer", b""))
+            yield CommitRecord.from_log([sha.hex(), *author, *committer, self._format_subject(message)])
+
+    def is_ancestor(self, commit: str, head: str) -> bool:
+        try:
+            return self.resolve(commit) in self._ancestry([self.resolve(head)])
+        except RuntimeError:
+            return False
+
+    def count_remote_branches(self) -> int:
+        remote_refs = set()
+        remotes_dir = os.path.join(self.git_dir, "refs", "remotes")
+        for current, _, files in os.walk(remotes_dir):
+            remote_refs.update(os.path.relpath(os.path.join(current, name), remotes_dir) for name in files)
+        packed_refs = os.path.join(self.git_dir, "packed-refs")
+        if os.path.isfile(packed_refs):
+            with open(packed_refs, "r") as file:
+                for line in file:
+                    parts = line.split()
+                    if len(parts) == 2 and parts[1].startswith("refs/remotes/"):
+                        remote_refs.add(parts[1][len("refs/remotes/") :])
+        return len(remote_refs)
+
+
+def default_cache_dir() -> str:
+    return os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"), "git_repo_analyzer")
 
 
 class GitRepoAnalyzer:
@@ -12,9 +1236,14 @@ class GitRepoAnalyzer:
 
     Attributes:
         repo_path (str): The absolute path to the Git repository.
+        cache_dir (str): Directory holding the incremental analysis cache, or None to always scan the full history.
+        jobs (int): Number of worker processes walking disjoint shards of the history.
+        backend (str): "git" to parse the output of the `git` binary, or "objects" to read the object database
+            directly with GitObjectReader (no line change statistics, always a serial walk).
+        sketch (Dict[str, int]): ApproximateHistoryStats parameters for the bounded-memory mode, or None for exact stats.
 
     Methods:
-        __init__(repo_path: str):
+        __init__(repo_path: str, cache_dir: str = None, jobs: int = 1, backend: str = "git", sketch: Dict[str, int] = None):
             Initializes the GitRepoAnalyzer with the given repository path.
 
         _is_valid_git_repo() -> bool:
@@ -23,16 +1252,38 @@ class GitRepoAnalyzer:
         _run_git_command(args: List[str]) -> str:
             Runs a Git command with the specified arguments and returns the output.
 
-        get_commit_data(format_string: str) -> List[str]:
-            Retrieves commit data based on the given format string.
+        _stream_git_command(args: List[str]) -> Iterator[str]:
+            Runs a Git command and yields its NUL-delimited output tokens while it is still running.
+
+        iter_commits(revision_range: List[str] = None) -> Iterator[CommitRecord]:
+            Walks the history once and yields every commit while `git log` is still running.
+
+        shard_ranges(tip: str, excludes: List[str], shards: int) -> List[List[str]]:
+            Splits the history into disjoint revision ranges along the first-parent chain.
+
+        iter_stats(batch_size: int = None) -> Iterator[HistoryStats]:
+            Yields mergeable partial aggregates of the history, reusing the cached state of the last analyzed commit.
+
+        collect_stats() -> HistoryStats:
+            Merges the partial aggregates of iter_stats into a single one.
+
+        count_branches() -> int:
+            Counts the remote branches.
 
         analyze() -> Dict[str, Dict]:
             Analyzes the Git repository and returns various statistics."""
 
-    def __init__(self, repo_path: str):
+    def __init__(self, repo_path: str, cache_dir: str = None, jobs: int = 1, backend: str = "git", sketch: Dict[str, int] = None):
         self.repo_path = os.path.abspath(repo_path)
+        self.cache_dir = cache_dir
+        self.jobs = jobs
+        self.backend = backend
+        self.sketch = sketch
         if not self._is_valid_git_repo():
             raise ValueError(f"{self.repo_path} is not a valid Git repository")
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown backend {backend}, expected one of: {', '.join(BACKENDS)}")
+        self._objects = GitObjectReader(os.path.join(self.repo_path, ".git")) if backend == "objects" else None
 
     def _is_valid_git_repo(self) -> bool:
         return os.path.isdir(os.path.join(self.repo_path, ".git"))
@@ -43,9 +1294,214 @@ class GitRepoAnalyzer:
         except subprocess.CalledProcessError:
             raise RuntimeError(f"Error running git command in {self.repo_path}")
 
-    def get_commit_data(self, format_string: str) -> List[str]:
-        output = self._run_git_command(["log", f"--pretty=format:{format_string}"])
-        return output.split("\n")
+    def _stream_git_command(self, args: List[str], separator: bytes = b"\0", chunk_size: int = 1 << 16) -> Iterator[str]:
+        process = subprocess.Popen(["git", "-C", self.repo_path] + args, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        pending = b""
+        try:
+            for chunk in iter(lambda: process.stdout.read(chunk_size), b""):
+                tokens = (pending + chunk).split(separator)
+                pending = tokens.pop()
+                for token in tokens:
+                    yield token.decode("utf-8", errors="replace")
+            if pending:
+                yield pending.decode("utf-8", errors="replace")
+        finally:
+            process.stdout.close()
+            returncode = process.wait()
+        if returncode != 0:
+            raise RuntimeError(f"Error running git command in {self.repo_path}")
+
+    def iter_commits(self, revision_range: List[str] = None) -> Iterator[CommitRecord]:
+        """
+        Walks the history with a single `git log --numstat -z` and yields one commit at a time.
+        Dates are requested in the raw "<unix timestamp> <+|-hhmm>" format.
+
+        Every commit header starts with a record separator followed by the NUL-separated LOG_FIELDS.
+        Numstat entries follow as "added\tdeleted\tpath" tokens; renames carry an empty path and
+        are followed by the old and the new path tokens. A record is yielded as soon as the header
+        of the next one arrives, so consumers start working while `git log` is still running and
+        only the current commit is held in memory.
+
+        Args:
+            revision_range (List[str], optional): Revisions passed to `git log`. Defaults to HEAD.
+
+        Yields:
+            CommitRecord: Every commit of the range, newest first with the "git" backend.
+        """
+        if self._objects:
+            yield from self._objects.iter_commits(revision_range)
+            return
+
+        args = ["log", "--numstat", "-z", "--date=raw", f"--format={LOG_FORMAT}"] + (revision_range or [])
+        tokens = self._stream_git_command(args)
+        record = None
+        for token in tokens:
+            if token.startswith(RECORD_SEPARATOR):
+                if record is not None:
+                    yield record
+                record = CommitRecord.from_log([token[1:]] + [next(tokens) for _ in LOG_FIELDS[1:]])
+                continue
+            token = token.lstrip("\n")
+            if not token:
+                continue
+            added, deleted, filename = token.split("\t", 2)
+            if not filename:
+                next(tokens)  # rename source
+                filename = next(tokens)
+            if added == "-":  # Binary files report "-" instead of line counts
+                record.numstat.append((None, None, filename))
+            else:
+                record.numstat.append((int(added), int(deleted), filename))
+        if record is not None:
+            yield record
+
+    def shard_ranges(self, tip: str, excludes: List[str], shards: int) -> List[List[str]]:
+        """
+        Splits the commits reachable from `tip` (and not from `excludes`) into disjoint revision ranges.
+
+        Boundaries are picked at even distances along the first-parent chain b0 = tip, b1, ..., bk.
+        Every boundary is an ancestor of the previous one, so the ranges `b1..b0`, `b2..b1`, ..., `bk`
+        never overlap and together cover the whole history, merged side branches included.
+
+        Args:
+            tip (str): The newest commit of the history to split.
+            excludes (List[str]): Commits whose ancestry is left out of every range.
+            shards (int): The maximum number of ranges.
+
+        Returns:
+            List[List[str]]: The revision arguments of every range, newest first.
+        """
+        excludes = [f"^{commit}" for commit in excludes]
+        count = int(self._run_git_command(["rev-list", "--first-parent", "--count", tip] + excludes))
+        shards = min(shards, count)
+        if shards <= 1:
+            return [[tip] + excludes]
+
+        picks = {round(index * count / shards) for index in range(1, shards)}
+        boundaries = [tip]
+        for index, commit in enumerate(self._stream_git_command(["rev-list", "--first-parent", tip] + excludes, separator=b"\n")):
+            if index in picks:
+                boundaries.append(commit)
+                if len(boundaries) == shards:
+                    break
+
+        ranges = [[newer, f"^{older}"] + excludes for newer, older in zip(boundaries, boundaries[1:])]
+        ranges.append([boundaries[-1]] + excludes)
+        return ranges
+
+    def _iter_batches(self, revision_range: List[str], batch_size: int = None) -> Iterator[HistoryStats]:
+        batch = new_stats(self.sketch)
+        for record in self.iter_commits(revision_range):
+            batch.update(record)
+            if batch_size and batch.commit_count >= batch_size:
+                yield batch
+                batch = new_stats(self.sketch)
+        yield batch
+
+    def _iter_shards(self, tip: str, excludes: List[str]) -> Iterator[HistoryStats]:
+        ranges = self.shard_ranges(tip, excludes, self.jobs * SHARDS_PER_JOB)
+        with ProcessPoolExecutor(max_workers=self.jobs) as executor:
+            futures = [executor.submit(_collect_shard, self.repo_path, revision_range, self.sketch) for revision_range in ranges]
+            for future in as_completed(futures):
+                yield future.result()
+
+    def _resolve_head(self) -> str:
+        if self._objects:
+            return self._objects.resolve("HEAD").hex()
+        return self._run_git_command(["rev-parse", "HEAD"]).strip()
+
+    def _is_ancestor(self, commit: str, head: str) -> bool:
+        if self._objects:
+            return self._objects.is_ancestor(commit, head)
+        result = subprocess.run(
+            ["git", "-C", self.repo_path, "merge-base", "--is-ancestor", commit, head], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        return result.returncode == 0
+
+    def _cache_file(self) -> str:
+        key = hashlib.sha256(self.repo_path.encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def _load_cache(self) -> Tuple[str, HistoryStats]:
+        try:
+            with open(self._cache_file(), "r") as file:
+                cache = json.load(file)
+            if (cache.get("version"), cache.get("repo_path"), cache.get("backend"), cache.get("sketch")) != (
+                CACHE_VERSION,
+                self.repo_path,
+                self.backend,
+                self.sketch,
+            ):
+                return None, None
+            return cache["head"], stats_from_dict(cache["stats"], self.sketch)
+        except (OSError, ValueError, KeyError, TypeError):
+            return None, None
+
+    def _save_cache(self, head: str, stats: HistoryStats):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        cache_file = self._cache_file()
+        temp_file = f"{cache_file}.{os.getpid()}.tmp"
+        with open(temp_file, "w") as file:
+            cache = {"version": CACHE_VERSION, "repo_path": self.repo_path, "backend": self.backend, "sketch": self.sketch}
+            json.dump(dict(cache, head=head, stats=stats.to_dict()), file)
+        os.replace(temp_file, cache_file)
+
+    def iter_stats(self, batch_size: int = None) -> Iterator[HistoryStats]:
+        """
+        Aggregates the commit history reachable from HEAD into mergeable partial results.
+
+        Without a cache directory the whole history is walked. Otherwise the state saved for the
+        previously analyzed tip is yielded first and only `last_sha..HEAD` is walked on top of it.
+        When the cached tip is no longer an ancestor of HEAD (history was rewritten) the cache is
+        discarded and the full history is scanned again. The cache is updated once the generator
+        is exhausted. With more than one job the walk is split into shards (see shard_ranges) which
+        are aggregated in parallel worker processes.
+
+        Args:
+            batch_size (int, optional): Number of commits per yielded aggregate of a serial walk. Defaults to a single aggregate.
+
+        Yields:
+            HistoryStats: Disjoint partial aggregates which merged together cover every commit reachable from HEAD.
+        """
+        head = self._resolve_head()
+        cached_head, base = self._load_cache() if self.cache_dir else (None, None)
+
+        if cached_head == head:
+            yield base
+            return
+        # The state to cache is gathered in its own aggregate: a yielded object may still be pickled by a queue's
+        # feeder thread after it was handed over, so it must never be modified afterwards
+        total = new_stats(self.sketch) if self.cache_dir else None
+        if cached_head and self._is_ancestor(cached_head, head):
+            excludes = [cached_head]
+            total.merge(base)
+            yield base
+        else:
+            excludes = []
+
+        if self.jobs > 1 and not self._objects:
+            partials = self._iter_shards(head, excludes)
+        else:
+            partials = self._iter_batches([head] + [f"^{commit}" for commit in excludes], batch_size)
+        for partial in partials:
+            if total is not None:
+                total.merge(partial)
+            yield partial
+
+        if total is not None:
+            self._save_cache(head, total)
+
+    def collect_stats(self) -> HistoryStats:
+        stats = new_stats(self.sketch)
+        for partial in self.iter_stats():
+            stats.merge(partial)
+        return stats
+
+    def count_branches(self) -> int:
+        if self._objects:
+            return self._objects.count_remote_branches()
+        branches = self._run_git_command(["branch", "-r"]).split("\n")
+        return len([b for b in branches if b.strip()])
 
     def analyze(self) -> Dict[str, Dict]:
         """
@@ -66,58 +1522,166 @@ class GitRepoAnalyzer:
                     - "additions": The total number of lines added.
                     - "deletions": The total number of lines deleted.
                     - "files_changed": The number of unique files changed.
+                    - "by_author", "by_domain": Lines added, deleted and files touched per author and email domain
+                      (see compute_attribution).
+                  None with the "objects" backend, which does not diff trees.
                 - "branch_count": The number of remote branches.
                 - "commits_per_day": The average number of commits per day.
                 - "avg_message_length": The average length of commit messages.
+                - "activity": Commit histograms, heatmap and per-author timelines (see compute_activity).
+                - "hotspots": The most changed files and directories (see compute_hotspots).
+            In the approximate mode the identity dictionaries only hold the estimated top-k entries and the
+            extra keys described in ApproximateHistoryStats.summarize are added.
         """
-        authors = self.get_commit_data("%an")
-        author_emails = self.get_commit_data("%ae")
-        committers = self.get_commit_data("%cn")
-        committer_emails = self.get_commit_data("%ce")
-        dates = self.get_commit_data("%ad")
-        messages = self.get_commit_data("%s")
-
-        author_counts = collections.Counter(authors)
-        committer_counts = collections.Counter(committers)
-        author_email_counts = collections.Counter(author_emails)
-        committer_email_counts = collections.Counter(committer_emails)
-
-        date_objects = [datetime.strptime(date, "%a %b %d %H:%M:%S %Y %z") for date in dates]
-        earliest_commit = min(date_objects)
-        latest_commit = max(date_objects)
-
-        file_changes = self._run_git_command(["log", "--numstat", "--format="])
-        additions, deletions = 0, 0
-        files_changed = set()
-        for line in file_changes.split("\n"):
-            if line.strip():
-                add, delete, filename = line.split("\t")
-                if add != "-" and delete != "-":  # Check if the values are numeric
-                    additions += int(add)
-                    deletions += int(delete)
-                files_changed.add(filename)
+        stats = self.collect_stats()
+        if not stats.commit_count:
+            raise RuntimeError(f"No commits found in {self.repo_path}")
 
-        branches = self._run_git_command(["branch", "-r"]).split("\n")
-        branch_count = len([b for b in branches if b.strip()])
+        data = stats.summarize(self.count_branches())
+        if self._objects:
+            data["file_changes"] = None
+        return data
 
-        repo_age = latest_commit - earliest_commit
-        commits_per_day = len(authors) / (repo_age.days + 1)
 
-        message_lengths = [len(msg) for msg in messages]
-        avg_message_length = sum(message_lengths) / len(message_lengths)
+def _collect_shard(repo_path: str, revision_range: List[str], sketch: Dict[str, int] = None) -> HistoryStats:
+    """Aggregates one shard of the history inside a worker process."""
+    return reduce_commits(GitRepoAnalyzer(repo_path).iter_commits(revision_range), new_stats(sketch))[0]
 
-        return {
-            "authors": dict(author_counts),
-            "author_emails": dict(author_email_counts),
-            "committers": dict(committer_counts),
-            "committer_emails": dict(committer_email_counts),
-            "commit_count": len(authors),
-            "date_range": {"earliest": earliest_commit, "latest": latest_commit, "duration": repo_age},
-            "file_changes": {"additions": additions, "deletions": deletions, "files_changed": len(files_changed)},
-            "branch_count": branch_count,
-            "commits_per_day": commits_per_day,
-            "avg_message_length": avg_message_length,
-        }
+
+_result_queue = None
+
+
+def _init_worker(result_queue):
+    global _result_queue
+    _result_queue = result_queue
+
+
+def _analyze_repo_worker(repo_path: str, cache_dir: str, batch_size: int, backend: str, sketch: Dict[str, int]):
+    """Streams partial aggregates of one repository to the parent process through the result queue."""
+    try:
+        analyzer = GitRepoAnalyzer(repo_path, cache_dir=cache_dir, backend=backend, sketch=sketch)
+        for partial in analyzer.iter_stats(batch_size):
+            _result_queue.put(("partial", repo_path, partial))
+        _result_queue.put(("done", repo_path, analyzer.count_branches()))
+    except Exception as e:
+        _result_queue.put(("failed", repo_path, str(e)))
+
+
+class MultiRepoAnalyzer:
+    """Analyzes many Git repositories in a process pool and aggregates them into a single report.
+
+    Every worker walks one repository and streams bounded partial aggregates back through a queue,
+    so a long history never travels between processes as one object and a slow repository only
+    occupies its own worker while the rest of the batch keeps going.
+
+    Attributes:
+        repo_paths (List[str]): Absolute paths of the repositories to analyze.
+        jobs (int): Number of worker processes.
+        cache_dir (str): Directory holding the incremental analysis cache, or None.
+        batch_size (int): Number of commits per partial aggregate sent by a worker.
+        backend (str): How the workers read each history, see GitRepoAnalyzer.
+        sketch (Dict[str, int]): ApproximateHistoryStats parameters for the bounded-memory mode, or None.
+
+    Methods:
+        discover(root: str) -> List[str]:
+            Finds the Git repositories below a root directory such as the `ghq` root.
+
+        analyze() -> Dict[str, Dict]:
+            Analyzes every repository and returns the org-wide statistics with per-repository breakdowns."""
+
+    def __init__(
+        self, repo_paths: List[str], jobs: int = None, cache_dir: str = None, batch_size: int = 10000, backend: str = "git", sketch: Dict[str, int] = None
+    ):
+        self.repo_paths = sorted({os.path.abspath(path) for path in repo_paths})
+        self.root = os.path.commonpath(self.repo_paths) if self.repo_paths else os.sep
+        if self.root in self.repo_paths:
+            self.root = os.path.dirname(self.root)
+        self.jobs = jobs or os.cpu_count()
+        self.cache_dir = cache_dir
+        self.batch_size = batch_size
+        self.backend = backend
+        self.sketch = sketch
+
+    @staticmethod
+    def discover(root: str) -> List[str]:
+        repo_paths = []
+        for current, dirs, _ in os.walk(os.path.abspath(root)):
+            if ".git" in dirs:
+                repo_paths.append(current)
+                dirs.clear()  # Do not descend into the working tree of a repository
+            else:
+                dirs.sort()
+        return repo_paths
+
+    def analyze(self) -> Dict[str, Dict]:
+        """
+        Analyzes every repository and returns the org-wide statistics.
+
+        Returns:
+            Dict[str, Dict]: The keys described in GitRepoAnalyzer.analyze, aggregated over all repositories
+            ("files_changed" and "branch_count" are summed per repository), plus:
+                - "repositories": A dictionary with repository paths as keys and their commit count, contributors,
+                  additions, deletions, files changed, branch count and date range as values.
+                - "failures": A dictionary with repository paths as keys and the error message as values.
+        """
+        org_stats = new_stats(self.sketch)
+        repo_stats = {path: new_stats(self.sketch) for path in self.repo_paths}
+        repositories, failures = {}, {}
+        files_changed, branch_count = 0, 0
+
+        result_queue = multiprocessing.Queue()
+        with ProcessPoolExecutor(max_workers=self.jobs, initializer=_init_worker, initargs=(result_queue,)) as executor:
+            futures = {
+                executor.submit(_analyze_repo_worker, path, self.cache_dir, self.batch_size, self.backend, self.sketch): path for path in self.repo_paths
+            }
+            while repo_stats:
+                try:
+                    kind, repo_path, payload = result_queue.get(timeout=1)
+                except queue.Empty:
+                    for future, repo_path in futures.items():
+                        if repo_path in repo_stats and future.done() and future.exception():
+                            failures[repo_path] = str(future.exception())
+                            del repo_stats[repo_path]
+                    continue
+
+                if kind == "partial":
+                    repo_stats[repo_path].merge(payload)
+                    continue
+
+                stats = repo_stats.pop(repo_path)
+                if kind == "failed":
+                    failures[repo_path] = payload
+                    continue
+                if not stats.commit_count:
+                    failures[repo_path] = "No commits found"
+                    continue
+
+                repositories[repo_path] = {
+                    "commit_count": stats.commit_count,
+                    "contributors": stats.contributor_count,
+                    "additions": stats.additions,
+                    "deletions": stats.deletions,
+                    "files_changed": stats.file_count,
+                    "branch_count": payload,
+                    "earliest": stats.earliest,
+                    "latest": stats.latest,
+                }
+                files_changed += stats.file_count
+                branch_count += payload
+                if isinstance(stats, HistoryStats):  # Keep paths apart so org-wide hotspots name their repository
+                    label = os.path.relpath(repo_path, self.root)
+                    stats.file_churn = {posixpath.join(label, filename): churn for filename, churn in stats.file_churn.items()}
+                org_stats.merge(stats)
+
+        if not org_stats.commit_count:
+            raise RuntimeError(f"None of the {len(self.repo_paths)} repositories could be analyzed")
+
+        data = org_stats.summarize(branch_count, files_changed)
+        if self.backend == "objects":
+            data["file_changes"] = None
+        data["repositories"] = repositories
+        data["failures"] = failures
+        return data
 
 
 class GitRepoReporter:
@@ -143,8 +1707,15 @@ class GitRepoReporter:
         print_time_stats():
             Prints the time-related statistics of the repository including repository age, first commit date, latest commit date, and average commits per day.
 
-        print_code_change_stats():
-            Prints the statistics related to code changes including total lines added, total lines deleted, total files changed, and average lines per commit.
+        print_activity_stats(top_n: int = 5):
+            Prints the commit histograms, the weekly heatmap and the activity timelines of the top authors.
+
+        print_hotspot_stats(top_n: int = 5):
+            Prints the most changed files and directories.
+
+        print_code_change_stats(top_n: int = 5):
+            Prints the statistics related to code changes including total lines added, total lines deleted, total files changed,
+            average lines per commit and the authors and email domains with the most changed lines.
 
         print_repo_structure():
             Prints the structure of the repository including the number of branches.
@@ -155,26 +1726,39 @@ class GitRepoReporter:
         print_author_committer_diff():
             Prints the differences between authors and committers, showing individuals with different numbers of authored and committed commits.
 
+        print_approximation_stats(top_n: int = 5):
+            Prints the sketch footprint, error bounds and hottest files of an approximate analysis.
+
+        print_repository_breakdown():
+            Prints the per-repository statistics of a multi-repository analysis.
+
+        print_failures():
+            Prints the repositories which could not be analyzed.
+
         print_summary(top_n: int = 5):
-            Prints a summary of the repository analysis including various statistics and information about the repository."""
+            Prints a summary of the repository analysis including various statistics and information about the repository.
+
+        print_json():
+            Prints the whole analysis as JSON."""
 
     def __init__(self, data: Dict[str, Dict]):
         self.data = data
 
     def print_contribution_stats(self):
         print("\nContribution Statistics:")
-        print(f"Total Contributors: {len(self.data['authors'])}")
+        contributors = self.data.get("contributor_count", len(self.data["authors"]))
+        print(f"Total Contributors: {contributors}")
         print(f"Total Commits: {self.data['commit_count']}")
-        print(f"Average Commits per Contributor: {self.data['commit_count'] / len(self.data['authors']):.2f}")
+        print(f"Average Commits per Contributor: {self.data['commit_count'] / contributors:.2f}")
 
     def print_top_contributors(self, n: int):
         print(f"\nTop {n} Contributors:")
-        for author, count in sorted(self.data["authors"].items(), key=lambda x: x[1], reverse=True)[:n]:
+        for author, count in sorted(self.data["authors"].items(), key=lambda x: (-x[1], x[0]))[:n]:
             print(f"  {author}: {count} commits")
 
     def print_email_domain_stats(self):
         print("\nEmail Domain Statistics:")
-        email_domains = collections.Counter([email.split("@")[1] for email in self.data["author_emails"]])
+        email_domains = collections.Counter([email.split("@")[1] for email in sorted(self.data["author_emails"])])
         for domain, count in email_domains.most_common(5):
             print(f"  {domain}: {count} commits")
 
@@ -185,12 +1769,77 @@ class GitRepoReporter:
         print(f"Latest Commit: {self.data['date_range']['latest'].strftime('%Y-%m-%d')}")
         print(f"Average Commits per Day: {self.data['commits_per_day']:.2f}")
 
-    def print_code_change_stats(self):
+    def print_activity_stats(self, top_n: int = 5):
+        """
+        Print the activity histograms computed from the author timestamps.
+
+        Shows the commits of the last 12 months as a bar chart, the busiest days and weeks, a day of
+        week by hour of day heatmap in the authors' local time, and the timelines of the top authors.
+
+        Args:
+            top_n (int, optional): The number of busiest days, weeks and authors to display. Defaults to 5.
+        """
+        activity = self.data["activity"]
+        print("\nActivity Statistics:")
+        print("Commits per Month (last 12 months):")
+        months = sorted(activity["per_month"].items())[-12:]
+        peak = max(count for _, count in months)
+        for month, count in months:
+            print(f"  {month}: {'#' * max(1, round(40 * count / peak)):<40} {count}")
+
+        print("Busiest Days:")
+        for day, count in sorted(activity["per_day"].items(), key=lambda x: (-x[1], x[0]))[:top_n]:
+            print(f"  {day}: {count} commits")
+        print("Busiest Weeks:")
+        for week, count in sorted(activity["per_week"].items(), key=lambda x: (-x[1], x[0]))[:top_n]:
+            print(f"  Week of {week}: {count} commits")
+
+        print("Commits by Day and Hour (local time):")
+        print(f"       {''.join(f'{hour:<3}' for hour in range(0, 24, 3))}".rstrip())
+        shades = " .:-=+*#%@"
+        peak = max(max(row) for row in activity["heatmap"]) or 1
+        for day, row in zip(("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"), activity["heatmap"]):
+            cells = "".join(shades[0 if not count else max(1, round((len(shades) - 1) * count / peak))] for count in row)
+            print(f"  {day}  {cells}  {sum(row)}")
+
+        print("Author Timelines:")
+        for author, _ in sorted(self.data["authors"].items(), key=lambda x: (-x[1], x[0]))[:top_n]:
+            timeline = activity["authors"][author]
+            peak_month, peak_count = max(timeline["per_month"].items(), key=lambda x: (x[1], x[0]))
+            print(
+                f"  {author}: {timeline['first']} - {timeline['last']}, active in {len(timeline['per_month'])} months, "
+                f"busiest {peak_month} ({peak_count} commits)"
+            )
+
+    def print_hotspot_stats(self, top_n: int = 5):
+        print("\nHotspots:")
+        for title, key in (("Most Changed Files", "files"), ("Most Changed Directories", "directories")):
+            if not self.data["hotspots"][key]:
+                continue
+            print(f"{title}:")
+            for entry in self.data["hotspots"][key][:top_n]:
+                files = f"{entry['files']} files, " if "files" in entry else ""
+                print(
+                    f"  {entry['path']}: {entry['changes']} changes, {entry['lines_touched']} lines, {files}"
+                    f"{entry['authors']} authors, last {entry['last_touched'].strftime('%Y-%m-%d')}"
+                )
+
+    def print_code_change_stats(self, top_n: int = 5):
         print("\nCode Change Statistics:")
+        if self.data["file_changes"] is None:
+            print("  Not available with the objects backend")
+            return
         print(f"Total Lines Added: {self.data['file_changes']['additions']}")
         print(f"Total Lines Deleted: {self.data['file_changes']['deletions']}")
         print(f"Total Files Changed: {self.data['file_changes']['files_changed']}")
         print(f"Average Lines per Commit: {(self.data['file_changes']['additions'] + self.data['file_changes']['deletions']) / self.data['commit_count']:.2f}")
+        for title, key in (("Authors", "by_author"), ("Email Domains", "by_domain")):
+            if key not in self.data["file_changes"]:
+                continue
+            changes = self.data["file_changes"][key]
+            print(f"Top {top_n} {title} by Lines Changed:")
+            for name, change in sorted(changes.items(), key=lambda x: (-x[1]["additions"] - x[1]["deletions"], x[0]))[:top_n]:
+                print(f"  {name}: +{change['additions']} -{change['deletions']}, {change['files']} files")
 
     def print_repo_structure(self):
         print("\nRepository Structure:")
@@ -213,17 +1862,70 @@ class GitRepoReporter:
         """
         print("\nDifferences between Authors and Committers:")
         all_names = set(self.data["authors"].keys()) | set(self.data["committers"].keys())
+        if "approximation" in self.data:  # Names outside either top-k list have unknown counts
+            all_names = set(self.data["authors"].keys()) & set(self.data["committers"].keys())
         differences = [
             (name, self.data["authors"].get(name, 0), self.data["committers"].get(name, 0))
             for name in all_names
             if self.data["authors"].get(name, 0) != self.data["committers"].get(name, 0)
         ]
         if differences:
-            for name, author_count, committer_count in sorted(differences, key=lambda x: abs(x[1] - x[2]), reverse=True):
+            for name, author_count, committer_count in sorted(differences, key=lambda x: (-abs(x[1] - x[2]), x[0])):
                 print(f"  {name}: Authored {author_count}, Committed {committer_count}")
         else:
             print("  No differences found between authors and committers")
 
+    def print_approximation_stats(self, top_n: int = 5):
+        """
+        Print how the approximate mode summarized the history and how far its numbers can be off.
+
+        Contributor and file totals come from HyperLogLog sketches, per-item counts (top contributors,
+        hottest files) from Count-Min sketches which never underestimate. Only the top-k heaviest
+        identities are kept, so email domain and author/committer statistics cover those only.
+
+        Args:
+            top_n (int, optional): The number of hottest files to display. Defaults to 5.
+        """
+        approximation = self.data["approximation"]
+        print("\nApproximation Statistics:")
+        print(f"Sketch Memory: {approximation['memory_bytes'] / (1 << 20):.2f} MiB")
+        print(f"Distinct Counts (contributors, files): +/-{100 * approximation['distinct_relative_error']:.2f}% (one standard error)")
+        print(
+            f"Commit and Touch Counts: overestimated by at most {100 * approximation['frequency_epsilon']:.4f}% of the total "
+            f"with {100 * approximation['frequency_confidence']:.2f}% confidence"
+        )
+        print(f"Hottest Files (of {approximation['file_touches']} file changes):")
+        for filename, count in approximation["hottest_files"][:top_n]:
+            print(f"  {filename}: ~{count} changes")
+
+    def print_repository_breakdown(self):
+        print("\nRepository Breakdown:")
+        for repo_path, repo in sorted(self.data["repositories"].items(), key=lambda x: x[1]["commit_count"], reverse=True):
+            changes = "" if self.data["file_changes"] is None else f"+{repo['additions']}/-{repo['deletions']} lines, {repo['files_changed']} files, "
+            print(
+                f"  {repo_path}: {repo['commit_count']} commits, {repo['contributors']} contributors, {changes}"
+                f"{repo['earliest'].strftime('%Y-%m-%d')} - {repo['latest'].strftime('%Y-%m-%d')}"
+            )
+
+    def print_failures(self):
+        print("\nFailed Repositories:")
+        if self.data["failures"]:
+            for repo_path, error in sorted(self.data["failures"].items()):
+                print(f"  {repo_path}: {error}")
+        else:
+            print("  None")
+
+    @staticmethod
+    def _json_default(value):
+        if isinstance(value, datetime):
+            return value.isoformat()
+        if isinstance(value, timedelta):
+            return value.days
+        raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+    def print_json(self):
+        print(json.dumps(self.data, default=self._json_default, indent=2, sort_keys=True))
+
     def print_summary(self, top_n: int = 5):
         """
         Prints a summary of the repository analysis.
@@ -242,10 +1944,19 @@ class GitRepoReporter:
         self.print_top_contributors(top_n)
         self.print_email_domain_stats()
         self.print_time_stats()
-        self.print_code_change_stats()
+        if self.data["activity"]:
+            self.print_activity_stats(top_n)
+        self.print_code_change_stats(top_n)
+        if self.data["hotspots"] and self.data["hotspots"]["files"]:
+            self.print_hotspot_stats(top_n)
         self.print_repo_structure()
         self.print_commit_message_stats()
         self.print_author_committer_diff()
+        if "approximation" in self.data:
+            self.print_approximation_stats(top_n)
+        if "repositories" in self.data:
+            self.print_repository_breakdown()
+            self.print_failures()
 
 
 def main():
@@ -256,9 +1967,21 @@ def main():
     initializes a GitRepoAnalyzer to analyze the repository, and uses a
     GitRepoReporter to print a summary of the analysis.
 
+    Passing several repositories or --root switches to the multi-repository mode, which analyzes
+    the repositories in a process pool and prints an aggregated report.
+
     Command-line Arguments:
-    - repo_path (str): Path to the Git repository (default: current directory).
+    - repo_path (str): Path(s) to the Git repository (default: current directory).
+    - root (str): Directory to search for Git repositories, e.g. the `ghq` root.
+    - backend (str): Read the history through the `git` binary or directly from the object database (default: git).
+    - jobs (int): Number of worker processes; shards the history walk of a single repository (default: 1)
+      or analyzes repositories concurrently in the multi-repository mode (default: CPU count).
     - top_contributors (int): Number of top contributors to display (default: 5).
+    - approximate (bool): Summarize identities and files with fixed-size sketches (see ApproximateHistoryStats).
+    - hll_precision, cms_width, cms_depth, top_k (int): Sketch parameters of the approximate mode.
+    - cache (bool): Reuse and update the incremental analysis cache.
+    - json (bool): Print the whole analysis as JSON instead of the summary.
+    - cache_dir (str): Directory of the incremental analysis cache (default: $XDG_CACHE_HOME/git_repo_analyzer).
 
     Raises:
     - ValueError: If there is an issue with the provided arguments.
@@ -266,15 +1989,42 @@ def main():
     - Exception: For any other unexpected errors.
     """
     parser = argparse.ArgumentParser(description="Analyze Git repository for detailed contribution statistics")
-    parser.add_argument("repo_path", nargs="?", default=".", help="Path to the Git repository (default: current directory)")
+    parser.add_argument("repo_path", nargs="*", default=["."], help="Path(s) to the Git repository (default: current directory)")
+    parser.add_argument("--root", help="Analyze every Git repository found below this directory, e.g. $(ghq root)")
+    parser.add_argument("-j", "--jobs", type=int, help="Number of worker processes (default: 1 for a single repository, CPU count for several)")
+    parser.add_argument(
+        "--backend", choices=BACKENDS, default="git", help="Read history via the git binary or directly from .git/objects (default: %(default)s)"
+    )
     parser.add_argument("-n", "--top_contributors", type=int, default=5, help="Number of top contributors to display (default: 5)")
+    sketch_group = parser.add_argument_group("approximate mode")
+    sketch_group.add_argument("--approximate", action="store_true", help="Use fixed-size sketches instead of exact counters and path sets")
+    sketch_group.add_argument("--hll-precision", type=int, default=14, help="HyperLogLog registers as a power of two (default: %(default)s)")
+    sketch_group.add_argument("--cms-width", type=int, default=16384, help="Count-Min sketch counters per row (default: %(default)s)")
+    sketch_group.add_argument("--cms-depth", type=int, default=4, help="Count-Min sketch rows (default: %(default)s)")
+    sketch_group.add_argument("--top-k", type=int, default=100, help="Heaviest contributors and files kept per sketch (default: %(default)s)")
+    parser.add_argument("--json", action="store_true", help="Print the whole analysis as JSON instead of the summary")
+    parser.add_argument("--cache", action="store_true", help="Only analyze commits added since the previous cached run")
+    parser.add_argument("--cache-dir", default=default_cache_dir(), help="Directory of the incremental analysis cache (default: %(default)s)")
     args = parser.parse_args()
 
     try:
-        analyzer = GitRepoAnalyzer(args.repo_path)
+        cache_dir = args.cache_dir if args.cache else None
+        sketch = None
+        if args.approximate:
+            if not 4 <= args.hll_precision <= 18 or args.cms_width < 1 or args.cms_depth < 1 or args.top_k < 1:
+                raise ValueError("Invalid sketch parameters")
+            sketch = {"precision": args.hll_precision, "width": args.cms_width, "depth": args.cms_depth, "top_k": args.top_k}
+        if args.root or len(args.repo_path) > 1:
+            repo_paths = MultiRepoAnalyzer.discover(args.root) if args.root else args.repo_path
+            analyzer = MultiRepoAnalyzer(repo_paths, jobs=args.jobs, cache_dir=cache_dir, backend=args.backend, sketch=sketch)
+        else:
+            analyzer = GitRepoAnalyzer(args.repo_path[0], cache_dir=cache_dir, jobs=args.jobs or 1, backend=args.backend, sketch=sketch)
         data = analyzer.analyze()
         reporter = GitRepoReporter(data)
-        reporter.print_summary(args.top_contributors)
+        if args.json:
+            reporter.print_json()
+        else:
+            reporter.print_summary(args.top_contributors)
     except (ValueError, RuntimeError) as e:
         print(f"Error: {str(e)}")
     except Exception as e:
@@ -3,58 +3,437 @@
 import os
 import re
 import argparse
+import bisect
+import ctypes
+import ctypes.util
+import hashlib
+import json
 import logging
+import selectors
+import shlex
+import shutil
+import signal
+import socket
+import sqlite3
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from difflib import SequenceMatcher
 from pathlib import Path
-from typing import Dict, List
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+try:
+    from re import _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_parse
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
+SHELL_SUFFIXES = (".sh", ".bash")
+INDEX_SCHEMA_VERSION = "2"
+FUZZY_LIMIT = 10
+FUZZY_MIN_SHARED = 0.2
+FUZZY_SHORTLIST_FACTOR = 5
+KIND_LABELS = {"functions": "function", "aliases": "alias"}
+POLL_INTERVAL = 1.0
+CLIENT_TIMEOUT = 1.0
+MAX_REQUEST = 4096
+FUNCTION_DEFINITION = re.compile(r"^(\s*)(?:function\s+(\w+)|(\w+)\s*\(\))")
+ALIAS_DEFINITION = re.compile(r"^\s*alias\s+(\w+)=")
+IDENTIFIER = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+# Top-level lines the autoload generator can leave to the first call of a function: blank lines, comments, plain aliases
+# (copied into the autoload file) and the library's include preamble, which sources another library file next to the
+# file itself in either shell and then calls prevent_to_execute_directly. Any other statement (assignments, export,
+# complete, shopt, other sources, eval, aliases defined conditionally...) is a side effect of sourcing the file, so
+# the whole file is sourced at startup.
+LAZY_STATEMENT = re.compile(
+    r"^\s*(?:#.*)?$"
+    r"|^alias\s+\w+="
+    r'|^if \[\[ -n "\$ZSH_VERSION" \]\]; then$|^else$|^fi$'
+    r'|^\s*(?:source|\.) "\$\(dirname "(?:\$0|\$\{BASH_SOURCE\[0\]\})"\)/[\w./-]+\.(?:sh|bash)"$'
+    r"|^prevent_to_execute_directly$"
+)
+
+
+def trigrams(text: str) -> Set[str]:
+    return {text[i : i + 3] for i in range(len(text) - 2)}
+
+
+def padded_trigrams(text: str) -> Set[str]:
+    # Padding gives the first and last characters their own trigrams, so short names and typos near the ends still
+    # share enough of them with the query
+    return trigrams(f"  {text.lower()} ")
+
+
+def required_literals(pattern: str) -> List[str]:
+    # Literal runs that every match of the pattern contains. Only the top-level sequence is inspected: alternations,
+    # groups, repeats and classes end a run, and case-insensitive patterns give none at all.
+    parsed = sre_parse.parse(pattern)
+    if parsed.state.flags & re.IGNORECASE:
+        return []
+    literals, run = [], []
+    for op, argument in parsed:
+        if op is sre_parse.LITERAL:
+            run.append(chr(argument))
+        elif op is not sre_parse.AT:  # Anchors do not consume characters, the run goes on past them
+            literals.append("".join(run))
+            run = []
+    literals.append("".join(run))
+    return [literal for literal in literals if len(literal) >= 3]
+
+
+def shared_trigrams(query: str, names: Iterable[str]) -> Iterator[Tuple[str, int]]:
+    query_trigrams = padded_trigrams(query)
+    for name in names:
+        yield name, len(query_trigrams & padded_trigrams(name))
+
+
+def rank_similar(query: str, shared_counts: Iterable[Tuple[str, int]], limit: int = FUZZY_LIMIT) -> List[Tuple[float, str]]:
+    # Shortlists the names by the share of the query's padded trigrams they contain, a typo only costs the few
+    # trigrams around it, then ranks the shortlist by the more precise but slower SequenceMatcher ratio. Best first,
+    # then the shortest and alphabetical among equals.
+    query_size = len(padded_trigrams(query))
+    shortlist = [(shared / query_size, name) for name, shared in shared_counts if shared >= FUZZY_MIN_SHARED * query_size]
+    shortlist.sort(key=lambda item: (-item[0], len(item[1]), item[1]))
+    ranked = [(round(SequenceMatcher(None, query.lower(), name.lower()).ratio(), 3), name) for _, name in shortlist[: limit * FUZZY_SHORTLIST_FACTOR]]
+    ranked.sort(key=lambda item: (-item[0], len(item[1]), item[1]))
+    return ranked[:limit]
+
+
+def ranked_matches(ranked: List[Tuple[float, str]], locations: Iterable[Tuple[str, str, str]]) -> List[Tuple[float, str, str, str]]:
+    # Expands the ranked names to one (similarity, name, kind, key) match per definition, keeping the rank order
+    positions = {name: (position, similarity) for position, (similarity, name) in enumerate(ranked)}
+    matches = sorted((positions[name], kind, key, name) for name, kind, key in locations)
+    return [(similarity, name, kind, key) for (_, similarity), kind, key, name in matches]
+
+
+# Postings of the padded, case-folded trigrams of symbol names. Regex searches only run on the names containing every
+# trigram of the pattern's required literals, fuzzy searches count the trigrams each name shares with the query
+# straight from the postings.
+class TrigramIndex:
+    def __init__(self, names: Iterable[str]):
+        self.names = sorted(set(names))
+        self.postings = defaultdict(set)
+        for name in self.names:
+            for trigram in padded_trigrams(name):
+                self.postings[trigram].add(name)
+
+    def candidates(self, pattern: str) -> Optional[List[str]]:
+        required = {trigram for literal in required_literals(pattern) for trigram in trigrams(literal.lower())}
+        if not required:  # Nothing to narrow down, every name is a candidate
+            return None
+        postings = sorted((self.postings.get(trigram, set()) for trigram in required), key=len)
+        return sorted(set.intersection(*postings))
+
+    def similar(self, query: str, limit: int = FUZZY_LIMIT, keep: Optional[Callable[[str], bool]] = None) -> List[Tuple[float, str]]:
+        shared_counts = Counter()
+        for trigram in padded_trigrams(query):
+            shared_counts.update(self.postings.get(trigram, ()))
+        return rank_similar(query, ((name, shared) for name, shared in shared_counts.items() if not keep or keep(name)), limit)
+
+    def add(self, name: str):
+        bisect.insort(self.names, name)
+        for trigram in padded_trigrams(name):
+            self.postings[trigram].add(name)
+
+    def discard(self, name: str):
+        position = bisect.bisect_left(self.names, name)
+        if position < len(self.names) and self.names[position] == name:
+            del self.names[position]
+        for trigram in padded_trigrams(name):
+            postings = self.postings.get(trigram)
+            if postings is not None:
+                postings.discard(name)
+                if not postings:
+                    del self.postings[trigram]
+
+
+def default_index_file(root_dir: str) -> str:
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    root_hash = hashlib.sha1(os.path.realpath(root_dir).encode()).hexdigest()[:16]
+    return os.path.join(cache_home, "lookup_shell_functions", f"{root_hash}.sqlite")
+
+
+def default_socket_file(root_dir: str) -> str:
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir()
+    root_hash = hashlib.sha1(os.path.realpath(root_dir).encode()).hexdigest()[:16]
+    return os.path.join(runtime_dir, f"lookup_shell_functions-{os.getuid()}-{root_hash}.sock")
+
+
+# Persistent SQLite index of the functions and aliases below a directory. Files are only rescanned when their
+# mtime or size changed since the last refresh.
+class SymbolIndex:
+    def __init__(self, index_file: str, root_dir: str):
+        os.makedirs(os.path.dirname(os.path.abspath(index_file)), exist_ok=True)
+        self.connection = sqlite3.connect(index_file)
+        self.connection.create_function("regexp", 2, self._regexp, deterministic=True)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        identity = {"schema": INDEX_SCHEMA_VERSION, "root": os.path.realpath(root_dir)}
+        stored = dict(self.connection.execute("SELECT key, value FROM meta"))
+        if stored != identity:  # Another root or an older layout, start over
+            self.connection.executescript(
+                "DROP TABLE IF EXISTS symbol_names; DROP TABLE IF EXISTS name_trigrams; "
+                "DROP TABLE IF EXISTS symbols; DROP TABLE IF EXISTS files; DELETE FROM meta;"
+            )
+            with self.connection:
+                self.connection.executemany("INSERT INTO meta (key, value) VALUES (?, ?)", identity.items())
+        # symbol_names is a trigram full-text index over the symbol names, kept in sync with symbols by the triggers.
+        # name_trigrams holds the padded trigrams of every distinct name, the postings of the fuzzy search.
+        self.connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, key TEXT, mtime_ns INTEGER, size INTEGER);
+            CREATE TABLE IF NOT EXISTS symbols (id INTEGER PRIMARY KEY, path TEXT, kind TEXT, name TEXT, line INTEGER);
+            CREATE INDEX IF NOT EXISTS symbols_path ON symbols (path);
+            CREATE INDEX IF NOT EXISTS symbols_name ON symbols (name);
+            CREATE VIRTUAL TABLE IF NOT EXISTS symbol_names USING fts5 (name, content='symbols', content_rowid='id', tokenize='trigram');
+            CREATE TRIGGER IF NOT EXISTS symbols_insert AFTER INSERT ON symbols BEGIN
+                INSERT INTO symbol_names (rowid, name) VALUES (new.id, new.name);
+            END;
+            CREATE TRIGGER IF NOT EXISTS symbols_delete AFTER DELETE ON symbols BEGIN
+                INSERT INTO symbol_names (symbol_names, rowid, name) VALUES ('delete', old.id, old.name);
+            END;
+            CREATE TABLE IF NOT EXISTS name_trigrams (trigram TEXT, name TEXT, PRIMARY KEY (trigram, name)) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS name_trigrams_name ON name_trigrams (name);
+            """
+        )
+        self._patterns = {}
+
+    def _regexp(self, pattern: str, name: str) -> bool:
+        regex = self._patterns.get(pattern)
+        if regex is None:
+            regex = self._patterns[pattern] = re.compile(pattern)
+        return regex.search(name) is not None
+
+    def refresh(self, scanner: "ShellScriptScanner") -> int:
+        indexed = {path: (mtime_ns, size) for path, mtime_ns, size in self.connection.execute("SELECT path, mtime_ns, size FROM files")}
+        rescanned = 0
+        added, removed = set(), set()
+        with self.connection:
+            for file_path, stat in scanner.iter_files():
+                path = str(file_path)
+                fingerprint = indexed.pop(path, None)
+                if fingerprint == (stat.st_mtime_ns, stat.st_size):
+                    continue
+                symbols = list(scanner.scan_symbols(file_path))
+                added.update(name for _, name, _ in symbols)
+                removed.update(name for (name,) in self.connection.execute("SELECT name FROM symbols WHERE path = ?", (path,)))
+                self.connection.execute("DELETE FROM symbols WHERE path = ?", (path,))
+                self.connection.executemany(
+                    "INSERT INTO symbols (path, kind, name, line) VALUES (?, ?, ?, ?)", ((path, kind, name, line) for kind, name, line in symbols)
+                )
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO files (path, key, mtime_ns, size) VALUES (?, ?, ?, ?)",
+                    (path, scanner.result_key(file_path), stat.st_mtime_ns, stat.st_size),
+                )
+                rescanned += 1
+            for path in indexed:  # Deleted or excluded since the last run
+                removed.update(name for (name,) in self.connection.execute("SELECT name FROM symbols WHERE path = ?", (path,)))
+                self.connection.execute("DELETE FROM symbols WHERE path = ?", (path,))
+                self.connection.execute("DELETE FROM files WHERE path = ?", (path,))
+            for name in removed - added:
+                self.connection.execute("DELETE FROM name_trigrams WHERE name = ? AND NOT EXISTS (SELECT 1 FROM symbols WHERE name = ?)", (name, name))
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO name_trigrams (trigram, name) VALUES (?, ?)", ((trigram, name) for name in added for trigram in padded_trigrams(name))
+            )
+        return rescanned
+
+    @staticmethod
+    def _match_expression(literals: Iterable[str], operator: str) -> str:
+        return f" {operator} ".join('"' + literal.replace('"', '""') + '"' for literal in literals)
+
+    def search(self, pattern: str, search_type: str = "all") -> Dict[str, Dict[str, List[str]]]:
+        re.compile(pattern)  # Raise re.error for an invalid pattern before SQLite wraps it
+        query = "SELECT files.key, symbols.kind, symbols.name FROM symbols JOIN files USING (path) WHERE symbols.name REGEXP ?"
+        parameters = [pattern]
+        literals = required_literals(pattern)
+        if literals:
+            query += " AND symbols.id IN (SELECT rowid FROM symbol_names WHERE symbol_names MATCH ?)"
+            parameters.append(self._match_expression(literals, "AND"))
+        if search_type != "all":
+            query += " AND symbols.kind = ?"
+            parameters.append(search_type)
+        filtered_result = {}
+        for key, kind, name in self.connection.execute(query + " ORDER BY files.key, symbols.line", parameters):
+            filtered_result.setdefault(key, {"functions": [], "aliases": []})[kind].append(name)
+        return filtered_result
+
+    def search_fuzzy(self, query: str, search_type: str = "all", limit: int = FUZZY_LIMIT) -> List[Tuple[float, str, str, str]]:
+        kinds = ["functions", "aliases"] if search_type == "all" else [search_type, search_type]
+        query_trigrams = sorted(padded_trigrams(query))
+        # The kind filter applies to the grouped names, inside the grouping it would turn the trigram lookup into a
+        # scan over the names
+        shared_counts = self.connection.execute(
+            f"SELECT name, shared FROM (SELECT name, COUNT(*) AS shared FROM name_trigrams WHERE trigram IN ({', '.join('?' * len(query_trigrams))}) "
+            "GROUP BY name HAVING shared >= ?) WHERE name IN (SELECT name FROM symbols WHERE kind IN (?, ?))",
+            query_trigrams + [FUZZY_MIN_SHARED * len(query_trigrams)] + kinds,
+        )
+        ranked = rank_similar(query, shared_counts, limit)
+        locations = self.connection.execute(
+            "SELECT symbols.name, symbols.kind, files.key FROM symbols JOIN files USING (path) "
+            f"WHERE symbols.name IN ({', '.join('?' * len(ranked))}) AND kind IN (?, ?)",
+            [name for _, name in ranked] + kinds,
+        )
+        return ranked_matches(ranked, locations)
+
+    def close(self):
+        self.connection.close()
+
 
 class ShellScriptScanner:
-    def __init__(self, root_dir: str, exclude_patterns: List[str] = None):
+    def __init__(self, root_dir: str, exclude_patterns: List[str] = None, index_file: Optional[str] = None):
         self.root_dir = root_dir
         self.exclude_patterns = exclude_patterns or []
         self.result = {}
+        self.index = SymbolIndex(index_file, root_dir) if index_file else None
+        self.trigram_index = None
+        self.locations = defaultdict(list)
 
     def is_excluded(self, path: Path) -> bool:
         for pattern in self.exclude_patterns:
             if path.match(pattern):
-                logging.info(f"Excluding path: {path}")
+                logging.debug(f"Excluding path: {path}")
                 return True
         return False
 
-    def scan_file(self, file_path: Path) -> Dict[str, List[str]]:
-        functions = []
-        aliases = []
+    def scan_symbols(self, file_path: Path) -> Iterator[Tuple[str, str, int]]:
         try:
             with open(file_path, "r") as file:
-                for line in file:
-                    func_match = re.match(r"^\s*function\s+(\w+)", line) or re.match(r"^\s*(\w+)\s*\(\)", line)
-                    alias_match = re.match(r"^\s*alias\s+(\w+)=", line)
+                for line_number, line in enumerate(file, 1):
+                    func_match = FUNCTION_DEFINITION.match(line)
+                    alias_match = ALIAS_DEFINITION.match(line)
                     if func_match:
-                        functions.append(func_match.group(1))
+                        yield "functions", func_match.group(2) or func_match.group(3), line_number
                     if alias_match:
-                        aliases.append(alias_match.group(1))
+                        yield "aliases", alias_match.group(1), line_number
         except Exception as e:
             logging.error(f"Error reading file {file_path}: {e}")
-        return {"functions": functions, "aliases": aliases}
 
-    def scan_directory(self):
-        for root, _, files in os.walk(self.root_dir):
+    def scan_function_bodies(self, file_path: Path) -> Tuple[Dict[str, Set[str]], List[str]]:
+        # Returns the identifiers used by each function and the lines outside of all functions. A body ends at the
+        # first closing brace indented like its definition, or on the definition line for one-liners.
+        bodies, top_level = {}, []
+        try:
+            with open(file_path, "r") as file:
+                lines = file.read().splitlines()
+        except Exception as e:
+            logging.error(f"Error reading file {file_path}: {e}")
+            return bodies, top_level
+        index = 0
+        while index < len(lines):
+            func_match = FUNCTION_DEFINITION.match(lines[index])
+            if not func_match:
+                top_level.append(lines[index])
+                index += 1
+                continue
+            rest = lines[index][func_match.end() :]
+            end = index
+            if not (rest.count("{") and rest.count("{") == rest.count("}")):
+                closing = re.compile(rf"^{func_match.group(1)}\}}")
+                end = next((number for number in range(index + 1, len(lines)) if closing.match(lines[number])), len(lines) - 1)
+            body = [rest] + [line for line in lines[index + 1 : end + 1] if not line.lstrip().startswith("#")]
+            bodies[func_match.group(2) or func_match.group(3)] = {identifier for line in body for identifier in IDENTIFIER.findall(line)}
+            index = end + 1
+        return bodies, top_level
+
+    def scan_file(self, file_path: Path) -> Dict[str, List[str]]:
+        symbols = {"functions": [], "aliases": []}
+        for kind, name, _ in self.scan_symbols(file_path):
+            symbols[kind].append(name)
+        return symbols
+
+    def iter_files(self, top: Optional[str] = None) -> Iterator[Tuple[Path, os.stat_result]]:
+        for root, _, files in os.walk(top or self.root_dir):
             for file_name in files:
                 file_path = Path(root) / file_name
-                if self.is_excluded(file_path):
+                if file_path.suffix not in SHELL_SUFFIXES or self.is_excluded(file_path):
                     continue
-                if file_path.suffix in [".sh", ".bash"]:
-                    self.process_file(file_path)
+                try:
+                    yield file_path, file_path.stat()
+                except OSError as e:
+                    logging.error(f"Error reading file {file_path}: {e}")
 
-    def process_file(self, file_path: Path):
+    def scan_directory(self):
+        if self.index:
+            rescanned = self.index.refresh(self)
+            logging.debug(f"Rescanned {rescanned} changed files into the index")
+            return
+        for file_path, _ in self.iter_files():
+            self.process_file(file_path)
+        self.build_trigram_index()
+
+    def build_trigram_index(self):
+        self.locations = defaultdict(list)
+        for key, value in self.result.items():
+            for kind, names in value.items():
+                for name in names:
+                    self.locations[name].append((key, kind))
+        self.trigram_index = TrigramIndex(self.locations)
+
+    def result_key(self, file_path: Path) -> str:
         relative_path = file_path.relative_to(self.root_dir)
         dir_name = relative_path.parent.as_posix()
         base_name = file_path.stem
-        self.result[f"{dir_name}/{base_name}"] = self.scan_file(file_path)
+        return f"{dir_name}/{base_name}"
+
+    def process_file(self, file_path: Path):
+        self.result[self.result_key(file_path)] = self.scan_file(file_path)
+
+    def update_file(self, file_path: Path):
+        # Rescans one file into the result map, the locations and the trigram index without rebuilding them
+        key = self.result_key(file_path)
+        self.forget(key)
+        if not file_path.is_file():
+            return
+        self.process_file(file_path)
+        for kind, names in self.result[key].items():
+            for name in names:
+                if name not in self.locations:
+                    self.trigram_index.add(name)
+                self.locations[name].append((key, kind))
+
+    def forget(self, key: str):
+        for kind, names in self.result.pop(key, {}).items():
+            for name in names:
+                locations = self.locations.get(name, [])
+                if (key, kind) in locations:
+                    locations.remove((key, kind))
+                if not locations:
+                    self.locations.pop(name, None)
+                    self.trigram_index.discard(name)
+
+    def forget_directory(self, dir_path: Path):
+        prefix = f"{dir_path.relative_to(self.root_dir).as_posix()}/"
+        for key in [key for key in self.result if key.startswith(prefix) or prefix == "./"]:
+            self.forget(key)
 
     def search(self, pattern: str, search_type: str = "all") -> Dict[str, Dict[str, List[str]]]:
+        if self.index:
+            return self.index.search(pattern, search_type)
+        candidates = self.trigram_index.candidates(pattern) if self.trigram_index else None
+        if candidates is None:
+            return self.search_linear(pattern, search_type)
+        regex = re.compile(pattern)
+        filtered_result = {}
+        for name in candidates:
+            if not regex.search(name):
+                continue
+            for key, kind in self.locations[name]:
+                if search_type in ("all", kind):
+                    filtered_result.setdefault(key, {"functions": [], "aliases": []})[kind].append(name)
+        return {key: filtered_result[key] for key in self.result if key in filtered_result}
+
+    def search_fuzzy(self, query: str, search_type: str = "all", limit: int = FUZZY_LIMIT) -> List[Tuple[float, str, str, str]]:
+        if self.index:
+            return self.index.search_fuzzy(query, search_type, limit)
+        keep = None if search_type == "all" else lambda name: any(kind == search_type for _, kind in self.locations[name])
+        ranked = self.trigram_index.similar(query, limit, keep)
+        return ranked_matches(ranked, ((name, kind, key) for _, name in ranked for key, kind in self.locations[name] if search_type in ("all", kind)))
+
+    def search_linear(self, pattern: str, search_type: str = "all") -> Dict[str, Dict[str, List[str]]]:
         regex = re.compile(pattern)
         filtered_result = {}
 
@@ -80,9 +459,425 @@ class ShellScriptScanner:
         return filtered_result
 
 
+AUTOLOAD_LOADER = """\
+_AUTOLOAD_ROOT_={root}
+_AUTOLOAD_LOADED_=
+
+# Usage: _autoload_load NAME FILE... - sources the files not loaded yet, dependencies first, then checks that they
+# replaced the stub of NAME with its real definition
+_autoload_load() {{
+  local name="$1" stub file
+  shift
+  stub=$(typeset -f "$name")
+  unset -f "$name"
+  for file in "$@"; do
+    case ":$_AUTOLOAD_LOADED_:" in
+      *":$file:"*) continue ;;
+    esac
+    # shellcheck disable=SC1090
+    if ! source "$_AUTOLOAD_ROOT_/$file"; then
+      eval "$stub"  # A file that failed is not marked as loaded, the stub retries it on the next call
+      return 1
+    fi
+    _AUTOLOAD_LOADED_="$_AUTOLOAD_LOADED_:$file"
+  done
+  if ! typeset -f "$name" >/dev/null; then
+    echo "autoload: $name is not defined by $_AUTOLOAD_ROOT_/$file, regenerate the autoload file" >&2
+    return 127
+  fi
+}}
+"""
+
+
+# Emits a file that replaces sourcing the whole library at shell startup: every function gets a stub that sources its
+# defining file, after the files of the functions it calls, on first use and then re-dispatches to the real
+# definition. Top-level aliases are copied as they are, files with any other top-level statement are sourced eagerly.
+class AutoloadGenerator:
+    def __init__(self, scanner: ShellScriptScanner):
+        self.scanner = scanner
+        self.defined_in = {}
+        self.calls = {}
+        self.aliases = []
+        self.eager_files = []
+
+    def scan(self):
+        for file_path, _ in sorted(self.scanner.iter_files()):
+            relative_path = file_path.relative_to(self.scanner.root_dir).as_posix()
+            bodies, top_level = self.scanner.scan_function_bodies(file_path)
+            if not all(LAZY_STATEMENT.match(line) for line in top_level):
+                self.eager_files.append(relative_path)
+            else:
+                self.aliases += [line for line in top_level if ALIAS_DEFINITION.match(line)]
+            for name, identifiers in bodies.items():
+                if name in self.defined_in:
+                    logging.warning(f"{name} is defined in {self.defined_in[name]} and {relative_path}, the stub loads the latter")
+                self.defined_in[name] = relative_path
+                self.calls[name] = identifiers
+
+    def dependency_files(self, name: str) -> List[str]:
+        # Defining files of the library functions called by name, transitively, in the order they have to be sourced
+        ordered, seen = [], {name}
+
+        def visit(function):
+            for callee in sorted(self.calls[function] & self.defined_in.keys()):
+                if callee not in seen:
+                    seen.add(callee)
+                    visit(callee)
+                    ordered.append(self.defined_in[callee])
+
+        visit(name)
+        own_file = self.defined_in[name]
+        return [file for file in dict.fromkeys(ordered) if file != own_file and file not in self.eager_files]
+
+    def render(self) -> str:
+        lines = [f"# Generated by lookup_shell_functions.py --autoload from {os.path.realpath(self.scanner.root_dir)}, do not edit.", ""]
+        lines.append(AUTOLOAD_LOADER.format(root=shlex.quote(os.path.realpath(self.scanner.root_dir))))
+        for relative_path in self.eager_files:
+            lines.append(f'source "$_AUTOLOAD_ROOT_"/{shlex.quote(relative_path)} && _AUTOLOAD_LOADED_="$_AUTOLOAD_LOADED_:{relative_path}"')
+        for name, relative_path in sorted(self.defined_in.items()):
+            if relative_path in self.eager_files:
+                continue
+            files = " ".join(shlex.quote(file) for file in self.dependency_files(name) + [relative_path])
+            lines.append(f'{name}() {{ _autoload_load {name} {files} && {name} "$@"; }}')
+        lines += self.aliases
+        return "\n".join(lines) + "\n"
+
+
+# Sources one file with xtrace on, every traced command starts with PS4: its start time, the file and line it comes
+# from and the function it runs in. The profiled file is $1, the trace goes to the file $2.
+PROFILE_RUNNERS = {
+    "bash": (
+        ["bash", "--noprofile", "--norc", "-c"],
+        """\
+exec 3>"$2"
+BASH_XTRACEFD=3
+PS4=$'+\\x1f${EPOCHREALTIME}\\x1f${BASH_SOURCE[0]}\\x1f${LINENO}\\x1f${FUNCNAME[0]}\\x1f'
+printf 'start %s\\n' "$EPOCHREALTIME" >&3
+set -x
+source "$1"
+set +x
+printf 'end %s\\n' "$EPOCHREALTIME" >&3
+""",
+    ),
+    "zsh": (
+        ["zsh", "-f", "-c"],
+        """\
+zmodload zsh/datetime
+exec 3>"$2"
+setopt prompt_subst
+PS4=$'+\\x1f${EPOCHREALTIME}\\x1f%x\\x1f%I\\x1f%N\\x1f'
+print -r -- "start $EPOCHREALTIME" >&3
+exec 4>&2 2>&3
+set -x
+source "$1"
+set +x
+exec 2>&4
+print -r -- "end $EPOCHREALTIME" >&3
+""",
+    ),
+}
+TRACE_EVENT = re.compile(r"^(\++)\x1f(\d+\.\d+)\x1f([^\x1f]*)\x1f(\d+)\x1f([^\x1f]*)\x1f(.*)$")
+TRACE_MARK = re.compile(r"^(start|end) (\d+\.\d+)$")
+
+
+# Measures what sourcing each file of the library costs in a clean shell. The time between two traced commands is
+# charged to the top-level command of the file that was running, so the functions, subshells and files it runs are
+# included in its cost.
+class StartupProfiler:
+    def __init__(self, scanner: ShellScriptScanner, shell: str = "bash", repeat: int = 1):
+        self.scanner = scanner
+        self.shell = shell
+        self.repeat = repeat
+
+    def run(self, file_path: str) -> Tuple[List[Tuple[float, str, int, str, int, str]], Optional[float], Optional[float], int]:
+        command, script = PROFILE_RUNNERS[self.shell]
+        environment = {"PATH": os.environ.get("PATH", ""), "HOME": os.environ.get("HOME", ""), "LC_ALL": "C"}
+        with tempfile.NamedTemporaryFile(mode="r", errors="replace", suffix=".trace") as trace:
+            completed = subprocess.run(
+                command + [script, "profile", file_path, trace.name],
+                env=environment,
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+            events, marks = [], {}
+            for line in trace:
+                line = line.rstrip("\n")
+                event = TRACE_EVENT.match(line)
+                if event:
+                    depth, timestamp, source, line_number, function, text = event.groups()
+                    events.append((float(timestamp), source, int(line_number), function, len(depth), text))
+                elif TRACE_MARK.match(line):
+                    marks[line.split()[0]] = float(line.split()[1])
+        return events, marks.get("start"), marks.get("end"), completed.returncode
+
+    def profile_file(self, file_path: Path) -> Dict:
+        path = os.path.abspath(file_path)
+        best = None
+        for _ in range(self.repeat):
+            events, start, end, status = self.run(path)
+            if start is None:
+                raise RuntimeError(f"{self.shell} printed no timestamps, profiling needs bash 5 or zsh with zsh/datetime")
+            end = end if end is not None else (events[-1][0] if events else start)  # The file exited the shell
+            if best is None or end - start < best[2] - best[1]:
+                best = (events, start, end, status)
+        events, start, end, status = best
+
+        commands = {}
+        current = None
+        for index, (timestamp, source, line, function, depth, text) in enumerate(events):
+            if source == path and function in ("", "source", path):  # At the top level of the profiled file
+                current = commands.setdefault(line, {"line": line, "seconds": 0.0, "depth": depth, "command": text})
+                if depth < current["depth"]:  # Name the command after itself rather than its command substitutions
+                    current.update(depth=depth, command=text)
+            if current is not None:
+                following = events[index + 1][0] if index + 1 < len(events) else end
+                current["seconds"] += following - timestamp
+        ranked = sorted(commands.values(), key=lambda command: (-command["seconds"], command["line"]))
+        return {
+            "file": file_path.relative_to(self.scanner.root_dir).as_posix(),
+            "shell": self.shell,
+            "status": status,
+            "total_ms": round((end - start) * 1000, 3),
+            "commands": [{"line": command["line"], "ms": round(command["seconds"] * 1000, 3), "command": command["command"]} for command in ranked],
+        }
+
+    def profile(self) -> List[Dict]:
+        results = [self.profile_file(file_path) for file_path, _ in sorted(self.scanner.iter_files())]
+        return sorted(results, key=lambda result: (-result["total_ms"], result["file"]))
+
+
+def print_profile(results: List[Dict], top: int):
+    print(f"{'ms':>10}  file")
+    for result in results:
+        status = f"  (exit status {result['status']})" if result["status"] else ""
+        print(f"{result['total_ms']:>10.3f}  {result['file']}{status}")
+        for command in result["commands"][:top]:
+            print(f"{command['ms']:>16.3f}  line {command['line']}: {command['command'][:100]}")
+    print(f"{sum(result['total_ms'] for result in results):>10.3f}  total")
+
+
+def benchmark(scanner: ShellScriptScanner, pattern: str, search_type: str, repeat: int) -> Dict[str, float]:
+    names = scanner.trigram_index.names
+    searches = {
+        "linear regex": lambda: scanner.search_linear(pattern, search_type),
+        "trigram regex": lambda: scanner.search(pattern, search_type),
+        "linear fuzzy": lambda: rank_similar(pattern, shared_trigrams(pattern, names)),
+        "trigram fuzzy": lambda: scanner.search_fuzzy(pattern, search_type),
+    }
+    timings = {}
+    for label, search in searches.items():
+        start = time.perf_counter()
+        for _ in range(repeat):
+            search()
+        timings[label] = (time.perf_counter() - start) / repeat
+    return timings
+
+
+# Minimal inotify binding over libc, raises AttributeError or OSError where inotify is unavailable
+class Inotify:
+    CLOSE_WRITE, MOVED_FROM, MOVED_TO, CREATE, DELETE = 0x8, 0x40, 0x80, 0x100, 0x200
+    Q_OVERFLOW, IGNORED, ONLYDIR, ISDIR = 0x4000, 0x8000, 0x1000000, 0x40000000
+    WATCH_MASK = CLOSE_WRITE | MOVED_FROM | MOVED_TO | CREATE | DELETE | ONLYDIR
+    EVENT = struct.Struct("iIII")
+
+    def __init__(self):
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()))
+        self.watches = {}
+
+    def add_watch(self, dir_path: Path):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(dir_path), self.WATCH_MASK)
+        if wd < 0:
+            logging.error(f"Error watching {dir_path}: {os.strerror(ctypes.get_errno())}")
+            return
+        self.watches[wd] = dir_path
+
+    def remove_watches(self, dir_path: Path):
+        for wd, path in list(self.watches.items()):
+            if path == dir_path or dir_path in path.parents:
+                self.libc.inotify_rm_watch(self.fd, wd)
+                del self.watches[wd]
+
+    def read_events(self) -> Iterator[Tuple[int, Optional[Path]]]:
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = self.EVENT.unpack_from(data, offset)
+            name = data[offset + self.EVENT.size : offset + self.EVENT.size + length].rstrip(b"\0")
+            offset += self.EVENT.size + length
+            dir_path = self.watches.get(wd)
+            if mask & self.IGNORED:
+                self.watches.pop(wd, None)
+            yield mask, dir_path / os.fsdecode(name) if dir_path and name else None
+
+    def close(self):
+        os.close(self.fd)
+
+
+# Keeps the scanned symbols in memory and answers one request per connection on a Unix socket:
+#   search TYPE PATTERN        one "name<TAB>kind<TAB>key" line per regex match
+#   fuzzy TYPE LIMIT QUERY     the same lines ranked by similarity, followed by a similarity column
+#   ping                       "pong"
+# TYPE is all, functions or aliases. Errors are a single "error<TAB>message" line. Every connection is served by a
+# thread of its own, so a client that is slow to send its request holds up nobody else; the lock keeps the searches
+# of these threads apart from the updates of the main loop.
+class SymbolDaemon:
+    def __init__(self, scanner: ShellScriptScanner, socket_file: str):
+        self.scanner = scanner
+        self.socket_file = socket_file
+        self.fingerprints = {}
+        self.lock = threading.Lock()
+        try:
+            self.inotify = Inotify()
+        except (AttributeError, OSError) as e:
+            logging.warning(f"inotify is unavailable ({e}), polling for changes every {POLL_INTERVAL:g}s instead")
+            self.inotify = None
+
+    def watch(self, top: Path):
+        # Watches are added before the files are read, so a file written in between is seen either way
+        for root, _, _ in os.walk(top):
+            self.inotify.add_watch(Path(root))
+        for file_path, _ in self.scanner.iter_files(str(top)):
+            self.scanner.update_file(file_path)
+
+    def handle_events(self, _):
+        with self.lock:
+            for mask, path in self.inotify.read_events():
+                if mask & Inotify.Q_OVERFLOW:
+                    logging.warning("inotify queue overflowed, rescanning the whole directory")
+                    self.recover()
+                elif path is None:
+                    continue
+                elif mask & Inotify.ISDIR:
+                    if mask & (Inotify.CREATE | Inotify.MOVED_TO):
+                        self.watch(path)
+                    elif mask & (Inotify.DELETE | Inotify.MOVED_FROM):
+                        self.inotify.remove_watches(path)
+                        self.scanner.forget_directory(path)
+                elif path.suffix in SHELL_SUFFIXES and not self.scanner.is_excluded(path):
+                    self.scanner.update_file(path)
+
+    def recover(self):
+        # Events were lost, so directories may have been created or removed unnoticed: the watches are renewed along
+        # with the symbols. add_watch returns the descriptor a directory already has, so only new ones are added
+        for dir_path in [dir_path for dir_path in self.inotify.watches.values() if not dir_path.is_dir()]:
+            self.inotify.remove_watches(dir_path)
+        self.scanner.result.clear()
+        self.scanner.build_trigram_index()
+        self.watch(Path(self.scanner.root_dir))
+
+    def poll(self):
+        fingerprints = {file_path: (stat.st_mtime_ns, stat.st_size) for file_path, stat in self.scanner.iter_files()}
+        with self.lock:
+            for file_path in self.fingerprints.keys() - fingerprints.keys():
+                self.scanner.update_file(file_path)
+            for file_path, fingerprint in fingerprints.items():
+                if self.fingerprints.get(file_path) != fingerprint:
+                    self.scanner.update_file(file_path)
+        self.fingerprints = fingerprints
+
+    def respond(self, request: str) -> str:
+        command, _, arguments = request.partition(" ")
+        if command == "ping":
+            return "pong\n"
+        search_type, _, pattern = arguments.partition(" ")
+        if command not in ("search", "fuzzy") or search_type not in ("all", *KIND_LABELS):
+            return f"error\tunknown request: {request}\n"
+        try:
+            with self.lock:
+                if command == "fuzzy":
+                    limit, _, query = pattern.partition(" ")
+                    matches = self.scanner.search_fuzzy(query, search_type, int(limit))
+                    lines = [f"{name}\t{kind}\t{key}\t{similarity:.2f}" for similarity, name, kind, key in matches]
+                else:
+                    result = self.scanner.search(pattern, search_type)
+                    lines = [f"{name}\t{kind}\t{key}" for key, value in result.items() for kind, names in value.items() for name in names]
+        except (ValueError, re.error) as e:  # An invalid limit or pattern
+            return f"error\t{e}\n"
+        return "".join(f"{line}\n" for line in lines)
+
+    def answer(self, server: socket.socket):
+        try:
+            connection, _ = server.accept()
+        except BlockingIOError:
+            return
+        threading.Thread(target=self.reply, args=(connection,), daemon=True).start()
+
+    def reply(self, connection: socket.socket):
+        with connection:
+            connection.settimeout(CLIENT_TIMEOUT)
+            try:
+                request = connection.makefile("rb").readline(MAX_REQUEST).decode().rstrip("\r\n")
+                connection.sendall(self.respond(request).encode())
+            except (OSError, UnicodeDecodeError) as e:
+                logging.warning(f"Dropping client request: {e}")
+
+    def bind(self) -> socket.socket:
+        if os.path.exists(self.socket_file):
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+                if probe.connect_ex(self.socket_file) == 0:
+                    raise OSError(f"A daemon is already listening on {self.socket_file}")
+            os.unlink(self.socket_file)  # Left behind by a daemon that was killed
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        umask = os.umask(0o177)  # Only the owner may connect
+        try:
+            server.bind(self.socket_file)
+        finally:
+            os.umask(umask)
+        server.listen()
+        server.setblocking(False)
+        return server
+
+    def serve(self):
+        server = self.bind()
+        selector = selectors.DefaultSelector()
+        selector.register(server, selectors.EVENT_READ, self.answer)
+        self.scanner.trigram_index = TrigramIndex(())
+        if self.inotify:
+            self.watch(Path(self.scanner.root_dir))
+            selector.register(self.inotify.fd, selectors.EVENT_READ, self.handle_events)
+        else:
+            self.poll()
+        signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+        logging.info(f"Serving {len(self.scanner.locations)} symbols from {self.scanner.root_dir} on {self.socket_file}")
+        next_poll = time.monotonic() + POLL_INTERVAL
+        try:
+            while True:
+                for key, _ in selector.select(None if self.inotify else max(next_poll - time.monotonic(), 0)):
+                    key.data(key.fileobj)
+                if not self.inotify and time.monotonic() >= next_poll:
+                    self.poll()
+                    next_poll = time.monotonic() + POLL_INTERVAL
+        except KeyboardInterrupt:
+            pass
+        finally:
+            selector.close()
+            server.close()
+            os.unlink(self.socket_file)
+            if self.inotify:
+                self.inotify.close()
+
+
+def query_daemon(socket_file: str, request: str) -> List[List[str]]:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(socket_file)
+        client.sendall(f"{request}\n".encode())
+        response = client.makefile("r").read()
+    rows = [line.split("\t") for line in response.splitlines()]
+    if rows and rows[0][0] == "error":
+        raise ValueError(rows[0][1])
+    return rows
+
+
 def main(args):
-    scanner = ShellScriptScanner(root_dir=args.dir, exclude_patterns=args.exclude)
-    scanner.scan_directory()
+    index_file = (args.index_file or default_index_file(args.dir)) if args.index else None
+    scanner = ShellScriptScanner(root_dir=args.dir, exclude_patterns=args.exclude, index_file=index_file)
 
     search_type = "all"
     if args.search_all:
@@ -96,7 +891,65 @@ def main(args):
     else:
         pattern = ""
 
-    result = scanner.search(pattern, search_type)
+    socket_file = args.socket or default_socket_file(args.dir)
+    if args.daemon:
+        SymbolDaemon(scanner, socket_file).serve()
+        return
+    if args.client:
+        request = f"fuzzy {search_type} {args.limit} {pattern}" if args.fuzzy else f"search {search_type} {pattern}"
+        try:
+            rows = query_daemon(socket_file, request)
+        except ValueError as e:
+            logging.error(f"The daemon rejected the request: {e}")
+            return
+        except OSError as e:
+            logging.error(f"No daemon is listening on {socket_file}: {e}")
+            return
+    else:
+        scanner.scan_directory()
+
+    if args.profile:
+        if not shutil.which(args.profile):
+            logging.error(f"{args.profile} is not installed")
+            return
+        results = StartupProfiler(scanner, args.profile, args.repeat).profile()
+        if args.json:
+            print(json.dumps(results, indent=2))
+        else:
+            print_profile(results, args.top)
+        return
+
+    if args.autoload:
+        generator = AutoloadGenerator(scanner)
+        generator.scan()
+        with open(args.autoload, "w") if args.autoload != "-" else sys.stdout as output:
+            output.write(generator.render())
+        return
+
+    if args.benchmark:
+        candidates = scanner.trigram_index.candidates(pattern)
+        print(f"Symbols: {len(scanner.trigram_index.names)}, trigram candidates: {len(scanner.trigram_index.names if candidates is None else candidates)}")
+        for label, seconds in benchmark(scanner, pattern, search_type, args.benchmark).items():
+            print(f"{label}: {seconds * 1000:.3f} ms")
+        return
+
+    if args.fuzzy:
+        if args.client:
+            matches = [(float(similarity), name, kind, key) for name, kind, key, similarity in rows]
+        else:
+            matches = scanner.search_fuzzy(pattern, search_type, args.limit)
+        if not matches:
+            print("No matches found.")
+        for similarity, name, kind, key in matches:
+            print(f"{name} ({KIND_LABELS[kind]} in {key}, similarity {similarity:.2f})")
+        return
+
+    if args.client:
+        result = {}
+        for name, kind, key in rows:
+            result.setdefault(key, {"functions": [], "aliases": []})[kind].append(name)
+    else:
+        result = scanner.search(pattern, search_type)
 
     all_functions = set()
     all_aliases = set()
@@ -121,13 +974,39 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Scan shell scripts for functions and aliases.")
     parser.add_argument("--dir", "-d", required=True, help="The directory to scan recursively.")
     parser.add_argument("--exclude", "-e", nargs="*", help="Patterns to exclude from the scan.")
+    parser.add_argument("--index", "-i", action="store_true", help="Search a persistent index, only rescanning files changed since the last run.")
+    parser.add_argument("--index-file", help="SQLite file of the index (default: one per directory under $XDG_CACHE_HOME/lookup_shell_functions).")
 
     # Create a mutually exclusive group for search options
     search_group = parser.add_mutually_exclusive_group()
     search_group.add_argument("--search-all", "-sall", help="Search for a keyword across all functions and aliases.")
     search_group.add_argument("--search-function", "-sf", help="Search for a keyword within function names only.")
     search_group.add_argument("--search-alias", "-sa", help="Search for a keyword within alias names only.")
+    parser.add_argument(
+        "--fuzzy", "-z", action="store_true", help="Rank names by trigram similarity to the keyword instead of matching it as a regular expression."
+    )
+    parser.add_argument("--limit", "-n", type=int, default=FUZZY_LIMIT, help=f"Number of fuzzy matches to print (default: {FUZZY_LIMIT}).")
+    parser.add_argument(
+        "--autoload",
+        metavar="FILE",
+        help="Write a file of lazy-loading stubs for every function to source at shell startup instead of the library ('-' for stdout).",
+    )
+    parser.add_argument("--profile", choices=sorted(PROFILE_RUNNERS), help="Time sourcing every file in a clean shell, per file and per top-level command.")
+    parser.add_argument("--repeat", type=int, default=1, help="Profile each file this many times and keep the fastest run (default: 1).")
+    parser.add_argument("--top", type=int, default=3, help="Number of the most expensive top-level commands shown per file (default: 3).")
+    parser.add_argument("--json", action="store_true", help="Print the profile as JSON.")
+    daemon_group = parser.add_mutually_exclusive_group()
+    daemon_group.add_argument(
+        "--daemon", action="store_true", help="Keep the symbols in memory, follow changes to the directory and answer searches on a Unix socket."
+    )
+    daemon_group.add_argument("--client", "-c", action="store_true", help="Ask a running daemon for the search instead of scanning the directory.")
+    parser.add_argument("--socket", help="Unix socket of the daemon (default: one per directory under $XDG_RUNTIME_DIR).")
+    parser.add_argument("--benchmark", type=int, metavar="REPEAT", help="Time the linear and trigram searches for the keyword, averaged over REPEAT runs.")
 
     args = parser.parse_args()
+    if args.benchmark and args.index:
+        parser.error("--benchmark compares the in-memory searches and cannot be combined with --index")
+    if (args.daemon or args.client) and (args.index or args.benchmark or args.autoload or args.profile):
+        parser.error("--daemon and --client only search, without --index, --benchmark, --autoload or --profile")
 
     main(args)
@@ -3,10 +3,75 @@ import toml
 import configparser
 import json
 import base64
+import hashlib
+import mmap
+import posixpath
+import re
+import sqlite3
+import subprocess
+import tarfile
+import tempfile
 from abc import ABC, abstractmethod
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 from pathlib import Path
 import argparse
+import bisect
+import collections
+import math
 import platform
+import queue
+import threading
+import time
+
+try:
+    import numpy as np
+except ImportError:  # The entropy detector falls back to a pure Python loop
+    np = None
+
+# Detector patterns of the content scan, matched together by SECRET_PATTERN in a single pass over every candidate line.
+# Capturing groups are not allowed inside the patterns, the detector is identified by the name of its group. Matches
+# never span lines.
+DETECTORS = {
+    "aws_access_key_id": rb"\b(?:AKIA|ASIA)[0-9A-Z]{16}\b",
+    "aws_secret_access_key": rb"(?i:aws_secret_access_key)[\"']?\s*[=:]\s*[\"']?[A-Za-z0-9/+=]{40}",
+    "github_token": rb"\bgh[pousr]_[A-Za-z0-9]{36,255}\b",
+    "gitlab_token": rb"\bglpat-[A-Za-z0-9_-]{20}\b",
+    "slack_token": rb"\bxox[abposr]-[A-Za-z0-9-]{10,}",
+    "google_api_key": rb"\bAIza[0-9A-Za-z_-]{35}",
+    "stripe_key": rb"\b(?:sk|rk)_live_[0-9A-Za-z]{24,}",
+    "private_key": rb"-----BEGIN (?:[A-Z]+ )?PRIVATE KEY-----",
+    "jwt": rb"\beyJ[A-Za-z0-9_-]{10,}\.eyJ[A-Za-z0-9_-]{10,}\.[A-Za-z0-9_-]{10,}",
+    "password_assignment": rb"(?i:password|passwd|secret|token)[\"']?\s*[=:]\s*[\"'][^\"'\s]{8,}[\"']",
+}
+SECRET_PATTERN = re.compile(b"|".join(b"(?P<%s>%s)" % (name.encode(), pattern) for name, pattern in DETECTORS.items()))
+# Lowercase literals of which every detector match contains at least one. Only lines containing an anchor are
+# handed to SECRET_PATTERN, the rest of the file is skipped at memory speed by bytes.find.
+ANCHORS = (b"akia", b"asia", b"secret", b"ghp_", b"gho_", b"ghu_", b"ghs_", b"ghr_", b"glpat-", b"xox", b"aiza", b"_live_")
+ANCHORS += (b"private key-----", b"eyj", b"passw", b"token")
+EXCLUDED_DIRS = {".git", ".hg", ".svn"}
+BINARY_SNIFF_SIZE = 8000  # Files with a NUL byte in this prefix are treated as binary, like git does
+BATCH_FILES = 256
+BATCH_BYTES = 64 << 20
+SCAN_CHUNK_SIZE = 16 << 20
+# High-entropy detector: runs of these bytes are candidate tokens, hexadecimal ones are held to their own threshold
+# since their alphabet caps the entropy at 4 bits per character. It is a detector of the content scan next to DETECTORS,
+# not a CredentialManager finder: its findings come out of ContentCredentialFinder as high_entropy_base64/hex and are
+# printed by ContentCredentialPrinter like every pattern match.
+ENTROPY_TOKEN_BYTES = b"ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/=_-"
+ENTROPY_HEX_BYTES = b"0123456789abcdefABCDEF"
+ENTROPY_DEFAULTS = {"base64": 4.5, "hex": 3.0, "min_length": 20, "max_length": 256}
+ENTROPY_GROUP_SIZE = 4096  # Tokens per bulk histogram, bounds the tokens x 256 count matrix
+ENTROPY_TOKEN_TABLE = bytes(byte in ENTROPY_TOKEN_BYTES for byte in range(256))  # bytes.translate table, 1 for token bytes
+EXCLUDED_HOMES = {"lost+found"}
+# Masked in the JSON lines of the home audit: every secret-bearing field the finders return, e.g. the base64 user:password
+# pair of Docker's auth
+REDACTED_FIELDS = ("password", "aws_secret_access_key", "auth", "token", "secret")
+# Version of the finders' parse_credentials as the image scan runs them, bump it whenever a parser changes its results.
+IMAGE_PARSER_VERSION = 1
+# Cached findings are only valid for the rules that produced them, any change to these invalidates the scan cache.
+RULESET_HASH = hashlib.sha256(
+    json.dumps([{name: pattern.decode() for name, pattern in DETECTORS.items()}, [a.decode() for a in ANCHORS], BINARY_SNIFF_SIZE]).encode()
+).hexdigest()
 
 
 class CredentialFinder(ABC):
@@ -32,35 +97,43 @@ class CredentialPrinter(ABC):
 
 
 class PoetryCredentialFinder(CredentialFinder):
-    def find_credential_file(self):
-        if platform.system() == "Windows":
+    # Path suffixes of the credential file inside container image layers
+    image_paths = ("/.config/pypoetry/auth.toml",)
+
+    def find_credential_file(self, home=None):
+        if home is None and platform.system() == "Windows":
             base_path = Path(os.environ.get("APPDATA", "")) / "pypoetry"
         else:  # Linux, macOS, and other Unix-like OS
-            base_path = Path.home() / ".config" / "pypoetry"
+            base_path = Path(home or Path.home()) / ".config" / "pypoetry"
 
         auth_file = base_path / "auth.toml"
         return auth_file if auth_file.is_file() else None
 
-    def read_credentials(self, file_path):
+    def read_credentials(self, file_path, decode_base64=False):
         try:
             with open(file_path, "r") as file:
-                config = toml.load(file)
-
-            credentials = []
-            for key, value in config.get("http-basic", {}).items():
-                if "username" in value and "password" in value:
-                    credentials.append(
-                        {"tool": "Poetry", "repository": key, "username": value["username"], "password": value["password"], "file_path": str(file_path)}
-                    )
-            return credentials
+                return self.parse_credentials(file.read(), str(file_path), decode_base64)
         except Exception as e:
             print(f"Error reading {file_path}: {e}")
             return []
 
+    def parse_credentials(self, content, file_path, decode_base64=False):
+        config = toml.loads(content)
+
+        credentials = []
+        for key, value in config.get("http-basic", {}).items():
+            if "username" in value and "password" in value:
+                credentials.append({"tool": "Poetry", "repository": key, "username": value["username"], "password": value["password"], "file_path": file_path})
+        return credentials
+
 
 class PipCredentialFinder(CredentialFinder):
-    def find_credential_file(self):
-        if platform.system() == "Windows":
+    image_paths = ("/.pip/pip.conf", "/.config/pip/pip.conf", "/etc/pip.conf")
+
+    def find_credential_file(self, home=None):
+        if home is not None:  # Only the files owned by that account, not the system-wide ones
+            possible_locations = [Path(home) / ".pip" / "pip.conf"]
+        elif platform.system() == "Windows":
             possible_locations = [
                 Path(os.environ.get("USERPROFILE", "")) / "pip" / "pip.ini",
                 Path(os.environ.get("APPDATA", "")) / "pip" / "pip.ini",
@@ -76,68 +149,80 @@ class PipCredentialFinder(CredentialFinder):
                 return location
         return None
 
-    def read_credentials(self, file_path):
+    def read_credentials(self, file_path, decode_base64=False):
         try:
-            config = configparser.ConfigParser()
-            config.read(file_path)
-
-            credentials = []
-            for section in config.sections():
-                if "username" in config[section] and "password" in config[section]:
-                    credentials.append(
-                        {
-                            "tool": "pip",
-                            "repository": section,
-                            "username": config[section]["username"],
-                            "password": config[section]["password"],
-                            "file_path": str(file_path),
-                        }
-                    )
-            return credentials
+            with open(file_path, "r") as file:
+                return self.parse_credentials(file.read(), str(file_path), decode_base64)
         except Exception as e:
             print(f"Error reading {file_path}: {e}")
             return []
 
+    def parse_credentials(self, content, file_path, decode_base64=False):
+        config = configparser.ConfigParser()
+        config.read_string(content)
+
+        credentials = []
+        for section in config.sections():
+            if "username" in config[section] and "password" in config[section]:
+                credentials.append(
+                    {
+                        "tool": "pip",
+                        "repository": section,
+                        "username": config[section]["username"],
+                        "password": config[section]["password"],
+                        "file_path": file_path,
+                    }
+                )
+        return credentials
+
 
 class AWSCredentialFinder(CredentialFinder):
-    def find_credential_file(self):
-        if platform.system() == "Windows":
+    image_paths = ("/.aws/credentials",)
+
+    def find_credential_file(self, home=None):
+        if home is None and platform.system() == "Windows":
             base_path = Path(os.environ.get("UserProfile", ""))
         else:  # Linux, macOS, and other Unix-like OS
-            base_path = Path.home()
+            base_path = Path(home or Path.home())
 
         cred_file = base_path / ".aws" / "credentials"
         return cred_file if cred_file.is_file() else None
 
     def read_credentials(self, file_path, decode_base64=False):
         try:
-            config = configparser.ConfigParser()
-            config.read(file_path)
-
-            credentials = []
-            for section in config.sections():
-                if "aws_access_key_id" in config[section] and "aws_secret_access_key" in config[section]:
-                    credentials.append(
-                        {
-                            "tool": "AWS CLI",
-                            "profile": section,
-                            "aws_access_key_id": config[section]["aws_access_key_id"],
-                            "aws_secret_access_key": config[section]["aws_secret_access_key"],
-                            "file_path": str(file_path),
-                        }
-                    )
-            return credentials
+            with open(file_path, "r") as file:
+                return self.parse_credentials(file.read(), str(file_path), decode_base64)
         except Exception as e:
             print(f"Error reading {file_path}: {e}")
             return []
 
+    def parse_credentials(self, content, file_path, decode_base64=False):
+        config = configparser.ConfigParser()
+        config.read_string(content)
+
+        credentials = []
+        for section in config.sections():
+            if "aws_access_key_id" in config[section] and "aws_secret_access_key" in config[section]:
+                credentials.append(
+                    {
+                        "tool": "AWS CLI",
+                        "profile": section,
+                        "aws_access_key_id": config[section]["aws_access_key_id"],
+                        "aws_secret_access_key": config[section]["aws_secret_access_key"],
+                        "file_path": file_path,
+                    }
+                )
+        return credentials
+
 
 class DockerCredentialFinder(CredentialFinder):
-    def find_credential_file(self):
-        if platform.system() == "Windows":
+    image_paths = ("/.docker/config.json",)
+
+    def find_credential_file(self, home=None):
+        if home is None and platform.system() == "Windows":
             base_path = Path(os.environ.get("UserProfile", ""))
         else:  # Linux, macOS, and other Unix-like OS
-            base_path = Path.home()
+            base_path = Path(home or Path.home())
 
         config_file = base_path / ".docker" / "config.json"
         return config_file if config_file.is_file() else None
@@ -145,28 +230,534 @@ class DockerCredentialFinder(CredentialFinder):
     def read_credentials(self, file_path, decode_base64=False):
         try:
             with open(file_path, "r") as file:
-                config = json.load(file)
-
-            credentials = []
-            for registry, auth in config.get("auths", {}).items():
-                if "auth" in auth:
-                    auth_decoded = base64.b64decode(auth["auth"]).decode("utf-8") if decode_base64 else auth["auth"]
-                    username, password = auth_decoded.split(":") if decode_base64 else (None, None)
-                    credentials.append(
-                        {
-                            "tool": "Docker",
-                            "registry": registry,
-                            "auth": auth["auth"],
-                            "username": username if decode_base64 else None,
-                            "password": password if decode_base64 else None,
-                            "file_path": str(file_path),
-                        }
-                    )
-            return credentials
+                return self.parse_credentials(file.read(), str(file_path), decode_base64)
         except Exception as e:
             print(f"Error reading {file_path}: {e}")
             return []
 
+    def parse_credentials(self, content, file_path, decode_base64=False):
+        config = json.loads(content)
+
+        credentials = []
+        for registry, auth in config.get("auths", {}).items():
+            if "auth" in auth:
+                auth_decoded = base64.b64decode(auth["auth"]).decode("utf-8") if decode_base64 else auth["auth"]
+                username, password = auth_decoded.split(":") if decode_base64 else (None, None)
+                credentials.append(
+                    {
+                        "tool": "Docker",
+                        "registry": registry,
+                        "auth": auth["auth"],
+                        "username": username if decode_base64 else None,
+                        "password": password if decode_base64 else None,
+                        "file_path": file_path,
+                    }
+                )
+        return credentials
+
+
+def _candidate_lines(chunk):
+    lowered = chunk.lower()
+    lines = {}
+    for anchor in ANCHORS:
+        position = lowered.find(anchor)
+        while position != -1:
+            start = lowered.rfind(b"\n", 0, position) + 1
+            end = lowered.find(b"\n", position)
+            end = len(lowered) if end == -1 else end
+            lines[start] = end
+            position = lowered.find(anchor, end)
+    return sorted(lines.items())
+
+
+def _ruleset_hash(entropy=None):
+    if not entropy:
+        return RULESET_HASH
+    return hashlib.sha256((RULESET_HASH + json.dumps(entropy, sort_keys=True)).encode()).hexdigest()
+
+
+def _layer_ruleset_hash():
+    # Layer results depend on which finders parse which image paths, not on the DETECTORS of the content scan
+    finders = {source: [type(finder).__name__, list(finder.image_paths)] for source, (finder, _) in CredentialManager().finders.items()}
+    return hashlib.sha256(json.dumps([finders, IMAGE_PARSER_VERSION], sort_keys=True).encode()).hexdigest()
+
+
+def _entropy_tokens_python(chunk, entropy):
+    # Whole runs only: a run longer than max_length is dropped, not split into tokens, like the NumPy path does
+    pattern = re.compile(b"[%s]{%d,}" % (re.escape(ENTROPY_TOKEN_BYTES), entropy["min_length"]))
+    hex_bytes = frozenset(ENTROPY_HEX_BYTES)
+    for match in pattern.finditer(chunk):
+        token = match.group()
+        if len(token) > entropy["max_length"]:
+            continue
+        bits = -sum(count / len(token) * math.log2(count / len(token)) for count in collections.Counter(token).values())
+        kind = "hex" if hex_bytes.issuperset(token) else "base64"
+        if bits >= entropy[kind]:
+            yield match.start(), match.end(), kind
+
+
+def _entropy_tokens(chunk, entropy):
+    if np is None:
+        yield from _entropy_tokens_python(chunk, entropy)
+        return
+
+    other_than_hex = np.ones(256, dtype=bool)
+    other_than_hex[np.frombuffer(ENTROPY_HEX_BYTES, dtype=np.uint8)] = False
+
+    data = np.frombuffer(chunk, dtype=np.uint8)
+    is_token = np.frombuffer(chunk.translate(ENTROPY_TOKEN_TABLE), dtype=np.int8)
+    edges = np.flatnonzero(np.diff(is_token, prepend=np.int8(0), append=np.int8(0)))
+    starts, lengths = edges[0::2], edges[1::2] - edges[0::2]  # Runs open and close alternately
+    selected = (lengths >= entropy["min_length"]) & (lengths <= entropy["max_length"])
+    starts, lengths = starts[selected], lengths[selected]
+
+    for first in range(0, len(starts), ENTROPY_GROUP_SIZE):
+        group_starts, group_lengths = starts[first : first + ENTROPY_GROUP_SIZE], lengths[first : first + ENTROPY_GROUP_SIZE]
+        count = len(group_starts)
+        # One bincount histograms every token of the group: row = token, column = byte value
+        token_ids = np.repeat(np.arange(count), group_lengths)
+        offsets = np.arange(len(token_ids)) - np.repeat(np.cumsum(group_lengths) - group_lengths, group_lengths)
+        values = data[np.repeat(group_starts, group_lengths) + offsets]
+        counts = np.bincount(token_ids * 256 + values, minlength=count * 256).reshape(count, 256)
+        probabilities = counts / group_lengths[:, None]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            bits = -np.where(counts > 0, probabilities * np.log2(probabilities), 0.0).sum(axis=1)
+        is_hex = counts[:, other_than_hex].sum(axis=1) == 0
+        for index in np.flatnonzero(bits >= np.where(is_hex, entropy["hex"], entropy["base64"])):
+            start = int(group_starts[index])
+            yield start, start + int(group_lengths[index]), "hex" if is_hex[index] else "base64"
+
+
+def _scan_buffer(data, size, entropy=None):
+    if data.find(b"\0", 0, BINARY_SNIFF_SIZE) != -1:
+        return
+    chunk_start, line = 0, 1
+    while chunk_start < size:
+        chunk_end = size if chunk_start + SCAN_CHUNK_SIZE >= size else data.rfind(b"\n", chunk_start, chunk_start + SCAN_CHUNK_SIZE) + 1
+        if chunk_end <= chunk_start:  # A single line longer than the chunk
+            chunk_end = min(size, chunk_start + SCAN_CHUNK_SIZE)
+        chunk = data[chunk_start:chunk_end]
+        first_line, position, match_starts, match_ends = line, 0, [], []
+        for start, end in _candidate_lines(chunk):
+            line += chunk.count(b"\n", position, start)
+            position = start
+            for match in SECRET_PATTERN.finditer(chunk, start, end):
+                match_starts.append(match.start())
+                match_ends.append(match.end())
+                yield match.lastgroup, match.group().decode("utf-8", errors="replace"), line, match.start() - start + 1
+        line += chunk.count(b"\n", position)
+
+        if entropy:
+            token_line, position = first_line, 0
+            for start, end, kind in _entropy_tokens(chunk, entropy):
+                index = bisect.bisect_left(match_starts, end)
+                if index and match_ends[index - 1] > start:  # Already reported by the pattern detector it overlaps
+                    continue
+                token_line += chunk.count(b"\n", position, start)
+                position = start
+                column = start - chunk.rfind(b"\n", 0, start)
+                yield f"high_entropy_{kind}", chunk[start:end].decode("ascii"), token_line, column
+        chunk_start = chunk_end
+
+
+def _scan_file(file_path, entropy=None):
+    findings = []
+    try:
+        with open(file_path, "rb") as file:
+            size = os.fstat(file.fileno()).st_size
+            if size == 0:
+                return findings
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                for detector, secret, line, column in _scan_buffer(data, size, entropy):
+                    findings.append({"tool": "Secret scan", "detector": detector, "secret": secret, "file_path": file_path, "line": line, "column": column})
+    except (OSError, ValueError):  # Unreadable files and files replaced while the tree is walked
+        pass
+    return findings
+
+
+def _scan_files(file_paths, entropy=None):
+    return [_scan_file(file_path, entropy) for file_path in file_paths]
+
+
+def default_cache_file():
+    return os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"), "find_credentials", "scan_cache.sqlite")
+
+
+class ScanCache:
+    # rulesets maps the tables a scan uses to the hash of the rules that fill them. Each table is cleared on its own
+    # when its rules changed, so the content and image scans can share one cache file with different rules.
+    def __init__(self, cache_file, rulesets):
+        os.makedirs(os.path.dirname(os.path.abspath(cache_file)), exist_ok=True)
+        self.connection = sqlite3.connect(cache_file)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, device INTEGER, inode INTEGER, mtime_ns INTEGER, size INTEGER, findings TEXT NOT NULL)"
+        )
+        self.connection.execute("CREATE TABLE IF NOT EXISTS layers (digest TEXT PRIMARY KEY, result TEXT NOT NULL)")
+        self.seen = set()
+        for table, ruleset in rulesets.items():
+            row = self.connection.execute("SELECT value FROM meta WHERE key = ?", (f"{table}_ruleset",)).fetchone()
+            if row is None or row[0] != ruleset:
+                self.connection.execute(f"DELETE FROM {table}")
+                self.connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (f"{table}_ruleset", ruleset))
+        self.connection.commit()
+
+    @staticmethod
+    def fingerprint(stat):
+        return stat.st_dev, stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def lookup(self, file_path, fingerprint):
+        self.seen.add(file_path)
+        row = self.connection.execute("SELECT device, inode, mtime_ns, size, findings FROM files WHERE path = ?", (file_path,)).fetchone()
+        if row is None or tuple(row[:4]) != fingerprint:
+            return None
+        return json.loads(row[4])
+
+    def store(self, file_path, fingerprint, findings):
+        self.connection.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?)", (file_path, *fingerprint, json.dumps(findings)))
+
+    def prune(self, roots):
+        """Drops the rows of files below the roots that were not looked up since the cache was opened, i.e. deleted or renamed files."""
+        prefixes = tuple(os.path.join(root, "") for root in roots)
+        rows = self.connection.execute("SELECT path FROM files").fetchall()
+        stale = [(path,) for (path,) in rows if path not in self.seen and (path in roots or path.startswith(prefixes))]
+        self.connection.executemany("DELETE FROM files WHERE path = ?", stale)
+
+    def lookup_layer(self, digest):
+        row = self.connection.execute("SELECT result FROM layers WHERE digest = ?", (digest,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def store_layer(self, digest, result):
+        self.connection.execute("INSERT OR REPLACE INTO layers VALUES (?, ?)", (digest, json.dumps(result)))
+
+    def close(self):
+        self.connection.commit()
+        self.connection.close()
+
+
+class ContentCredentialFinder(CredentialFinder):
+    def __init__(self, roots, jobs=None, cache_file=None, entropy=None):
+        self.roots = roots
+        self.jobs = jobs or os.cpu_count()
+        self.cache_file = cache_file
+        self.entropy = entropy
+
+    def find_credential_file(self):
+        roots = [str(Path(root).expanduser()) for root in self.roots]
+        return [root for root in roots if os.path.exists(root)] or None
+
+    def walk_files(self, roots):
+        stack = list(reversed(roots))
+        while stack:
+            path = stack.pop()
+            if not os.path.isdir(path):
+                try:
+                    yield path, os.stat(path)
+                except OSError:
+                    pass
+                continue
+            directories = []
+            try:
+                with os.scandir(path) as entries:
+                    for entry in entries:
+                        # An entry that vanishes or cannot be stat'ed is skipped without losing the rest of the directory
+                        try:
+                            if entry.is_dir(follow_symlinks=False):
+                                if entry.name not in EXCLUDED_DIRS:
+                                    directories.append(entry.path)
+                                continue
+                            stat = entry.stat(follow_symlinks=False) if entry.is_file(follow_symlinks=False) else None
+                        except OSError:
+                            continue
+                        if stat is not None:
+                            yield entry.path, stat
+            except OSError:
+                pass
+            stack.extend(sorted(directories, reverse=True))
+
+    def iter_batches(self, roots, cache=None, credentials=None):
+        batch, batch_bytes = [], 0
+        for file_path, stat in self.walk_files(roots):
+            fingerprint = ScanCache.fingerprint(stat)
+            cached = cache.lookup(file_path, fingerprint) if cache else None
+            if cached is not None:  # Unchanged since the last scan
+                credentials.extend(cached)
+                continue
+            batch.append((file_path, fingerprint))
+            batch_bytes += stat.st_size
+            if len(batch) >= BATCH_FILES or batch_bytes >= BATCH_BYTES:
+                yield batch
+                batch, batch_bytes = [], 0
+        if batch:
+            yield batch
+
+    def read_credentials(self, file_path, decode_base64=False):
+        credentials = []
+        cache = ScanCache(self.cache_file, {"files": _ruleset_hash(self.entropy)}) if self.cache_file else None
+
+        def collect(future, batch):
+            for (path, fingerprint), findings in zip(batch, future.result()):
+                credentials.extend(findings)
+                if cache:
+                    cache.store(path, fingerprint, findings)
+
+        try:
+            with ProcessPoolExecutor(max_workers=self.jobs) as executor:
+                pending = {}
+                for batch in self.iter_batches(file_path, cache, credentials):
+                    if len(pending) >= self.jobs * 4:  # Keep the walk only slightly ahead of the workers
+                        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            collect(future, pending.pop(future))
+                    pending[executor.submit(_scan_files, [path for path, _ in batch], self.entropy)] = batch
+                for future, batch in pending.items():
+                    collect(future, batch)
+            if cache:  # Only a complete walk tells which files are gone
+                cache.prune(file_path)
+        finally:
+            if cache:
+                cache.close()
+        return sorted(credentials, key=lambda cred: (cred["file_path"], cred["line"], cred["column"]))
+
+
+_cat_file = None
+
+
+def _init_history_worker(repo_path):
+    global _cat_file
+    _cat_file = subprocess.Popen(["git", "-C", repo_path, "cat-file", "--batch"], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+
+
+def _scan_blobs(blobs):
+    findings = []
+    for blob, commit, path in blobs:
+        _cat_file.stdin.write(blob.encode() + b"\n")
+        _cat_file.stdin.flush()
+        header = _cat_file.stdout.readline().split()
+        if header[-1] == b"missing":  # Objects absent from partial clones
+            continue
+        data = _cat_file.stdout.read(int(header[2]) + 1)[:-1]
+        for detector, secret, line, column in _scan_buffer(data, len(data)):
+            findings.append(
+                {
+                    "tool": "Git history scan",
+                    "detector": detector,
+                    "secret": secret,
+                    "commit": commit,
+                    "file_path": path,
+                    "line": line,
+                    "column": column,
+                }
+            )
+    return findings
+
+
+class GitHistoryCredentialFinder(CredentialFinder):
+    def __init__(self, repo_path, jobs=None, revisions=None):
+        self.repo_path = str(Path(repo_path).expanduser())
+        self.jobs = jobs or os.cpu_count()
+        self.revisions = revisions or ["--all"]
+
+    def find_credential_file(self):
+        result = subprocess.run(["git", "-C", self.repo_path, "rev-parse", "--git-dir"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        return self.repo_path if result.returncode == 0 else None
+
+    def iter_tokens(self, repo_path):
+        # Oldest first, so a blob is attributed to the commit that introduced it. Merges are diffed against every
+        # parent (-m), otherwise blobs that only exist in a conflict resolution would never be listed
+        args = ["git", "-C", repo_path, "log", "--reverse", "-m", "--raw", "-z", "--no-abbrev", "--no-renames", "--format=%x1e%H"] + self.revisions
+        with tempfile.TemporaryFile() as errors:  # Not a pipe, which git could fill up while only stdout is read
+            process = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=errors)
+            pending = b""
+            try:
+                for chunk in iter(lambda: process.stdout.read(1 << 16), b""):
+                    tokens = (pending + chunk).split(b"\0")
+                    pending = tokens.pop()
+                    for token in tokens:
+                        yield token.decode("utf-8", errors="replace")
+                if pending:
+                    yield pending.decode("utf-8", errors="replace")
+            finally:
+                process.stdout.close()
+                process.wait()
+            if process.returncode:  # A truncated log would silently skip the rest of the history
+                errors.seek(0)
+                raise RuntimeError(f"git log failed in {repo_path}: {errors.read().decode('utf-8', errors='replace').strip()}")
+
+    def iter_blobs(self, repo_path):
+        # Every blob is scanned once, however many commits and paths share it. The set is deliberately unbounded: it
+        # holds one 20 byte digest per distinct blob, about 95 bytes with the set overhead, so roughly 100 MB for a
+        # history of a million blobs
+        seen, commit = set(), None
+        tokens = self.iter_tokens(repo_path)
+        for token in tokens:
+            token = token.lstrip("\n")
+            if token.startswith("\x1e"):
+                commit = token[1:]
+            elif token.startswith(":"):
+                path = next(tokens)
+                _, new_mode, _, blob, status = token[1:].split(" ")
+                if status == "D" or new_mode == "160000":  # Deletions and submodule commits have no new blob
+                    continue
+                key = bytes.fromhex(blob)
+                if key not in seen:
+                    seen.add(key)
+                    yield blob, commit, path
+
+    def iter_batches(self, repo_path):
+        batch = []
+        for blob in self.iter_blobs(repo_path):
+            batch.append(blob)
+            if len(batch) >= BATCH_FILES:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def read_credentials(self, file_path, decode_base64=False):
+        credentials = []
+        with ProcessPoolExecutor(max_workers=self.jobs, initializer=_init_history_worker, initargs=(file_path,)) as executor:
+            pending = set()
+            for batch in self.iter_batches(file_path):
+                if len(pending) >= self.jobs * 4:  # Bounds the blobs queued between the log walk and the workers
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        credentials.extend(future.result())
+                pending.add(executor.submit(_scan_blobs, batch))
+            for future in pending:
+                credentials.extend(future.result())
+        return sorted(credentials, key=lambda cred: (cred["file_path"], cred["commit"], cred["line"], cred["column"]))
+
+
+def _scan_layer(archive_path, layer_path, decode_base64=False):
+    finders = CredentialManager().finders
+    result = {"findings": [], "candidates": [], "whiteouts": [], "opaque": []}
+    with open(archive_path or layer_path, "rb") as source:
+        if archive_path:  # Layer stored inside a `docker save` archive
+            layer_file = tarfile.open(fileobj=source).extractfile(layer_path)
+        else:
+            layer_file = source
+        with tarfile.open(fileobj=layer_file, mode="r|*") as layer:
+            for member in layer:
+                path = posixpath.normpath("/" + member.name)
+                directory, name = posixpath.split(path)
+                if name == ".wh..wh..opq":  # Hides everything lower layers put in the directory
+                    result["opaque"].append(directory)
+                elif name.startswith(".wh."):  # Deletes the path from lower layers
+                    result["whiteouts"].append(posixpath.join(directory, name[len(".wh.") :]))
+                elif member.isfile():
+                    for source_name, (finder, _) in finders.items():
+                        if path.endswith(finder.image_paths):
+                            result["candidates"].append(path)
+                            content = layer.extractfile(member).read().decode("utf-8", errors="replace")
+                            try:
+                                credentials = finder.parse_credentials(content, path, decode_base64)
+                            except Exception:  # Malformed configuration baked into the image
+                                credentials = []
+                            result["findings"].extend(dict(cred, source=source_name) for cred in credentials)
+                            break
+    return result
+
+
+def _is_hidden(path, later_layers):
+    ancestors = []
+    directory = posixpath.dirname(path)
+    while directory != "/":
+        ancestors.append(directory)
+        directory = posixpath.dirname(directory)
+    for layer in later_layers:
+        if path in layer["candidates"] or path in layer["whiteouts"]:
+            return True
+        if any(ancestor in layer["whiteouts"] or ancestor in layer["opaque"] for ancestor in ancestors):
+            return True
+        if "/" in layer["opaque"]:
+            return True
+    return False
+
+
+class ImageCredentialFinder(CredentialFinder):
+    def __init__(self, images, jobs=None, cache_file=None):
+        self.images = images
+        self.jobs = jobs or os.cpu_count()
+        self.cache_file = cache_file
+
+    def find_credential_file(self):
+        images = [str(Path(image).expanduser()) for image in self.images]
+        return [image for image in images if os.path.exists(image)] or None
+
+    def read_archive(self, archive_path):
+        images = []
+        with tarfile.open(archive_path) as archive:
+            for entry in json.load(archive.extractfile("manifest.json")):
+                config = json.load(archive.extractfile(entry["Config"]))
+                name = ", ".join(entry.get("RepoTags") or []) or f"{archive_path}:{entry['Config']}"
+                layers = [(digest, archive_path, layer) for digest, layer in zip(config["rootfs"]["diff_ids"], entry["Layers"])]
+                images.append((name, layers))
+        return images
+
+    def read_layout(self, layout_path, descriptors=None):
+        def read_blob(digest):
+            with open(os.path.join(layout_path, "blobs", *digest.split(":", 1)), "r") as file:
+                return json.load(file)
+
+        if descriptors is None:
+            with open(os.path.join(layout_path, "index.json"), "r") as file:
+                descriptors = json.load(file)["manifests"]
+        images = []
+        for descriptor in descriptors:
+            annotations = descriptor.get("annotations", {})
+            if annotations.get("vnd.docker.reference.type") == "attestation-manifest":
+                continue
+            manifest = read_blob(descriptor["digest"])
+            if "manifests" in manifest:  # Nested image index, e.g. a multi-platform image
+                images.extend(self.read_layout(layout_path, manifest["manifests"]))
+                continue
+            config = read_blob(manifest["config"]["digest"])
+            name = annotations.get("org.opencontainers.image.ref.name") or f"{layout_path}@{descriptor['digest']}"
+            layer_paths = [os.path.join(layout_path, "blobs", *layer["digest"].split(":", 1)) for layer in manifest["layers"]]
+            images.append((name, [(digest, None, layer_path) for digest, layer_path in zip(config["rootfs"]["diff_ids"], layer_paths)]))
+        return images
+
+    def read_credentials(self, file_path, decode_base64=False):
+        images = []
+        for image_path in file_path:
+            images.extend(self.read_layout(image_path) if os.path.isdir(image_path) else self.read_archive(image_path))
+
+        # Layers are keyed by the digest of their uncompressed content, shared base layers are scanned once
+        results, pending, queued = {}, {}, set()
+        cache = ScanCache(self.cache_file, {"layers": _layer_ruleset_hash()}) if self.cache_file else None
+        try:
+            with ProcessPoolExecutor(max_workers=self.jobs) as executor:
+                for _, layers in images:
+                    for digest, archive_path, layer_path in layers:
+                        key = f"{digest}:decoded" if decode_base64 else digest
+                        if key in results or key in queued:
+                            continue
+                        queued.add(key)
+                        cached = cache.lookup_layer(key) if cache else None
+                        if cached is not None:
+                            results[key] = cached
+                        else:
+                            pending[executor.submit(_scan_layer, archive_path, layer_path, decode_base64)] = key
+                for future, key in pending.items():
+                    results[key] = future.result()
+                    if cache:
+                        cache.store_layer(key, results[key])
+        finally:
+            if cache:
+                cache.close()
+
+        credentials = []
+        for name, layers in images:
+            layer_results = [results[f"{digest}:decoded" if decode_base64 else digest] for digest, _, _ in layers]
+            for index, (digest, _, _) in enumerate(layers):
+                for cred in layer_results[index]["findings"]:
+                    location = f"{name} {digest[:19]} {cred['file_path']}"
+                    if _is_hidden(cred["file_path"], layer_results[index + 1 :]):
+                        location += " (removed by a later layer)"
+                    credentials.append(dict(cred, file_path=location))
+        return credentials
+
 
 class PoetryCredentialPrinter(CredentialPrinter):
     def print_credentials(self, credentials):
@@ -215,6 +806,27 @@ class DockerCredentialPrinter(CredentialPrinter):
             print()
 
 
+class ContentCredentialPrinter(CredentialPrinter):
+    def print_credentials(self, credentials):
+        for cred in credentials:
+            print(f"Tool: {cred['tool']}")
+            print(f"Detector: {cred['detector']}")
+            print(f"Secret: {cred['secret'][:4]}{'*' * (len(cred['secret']) - 4)}")
+            print(f"File Path: {cred['file_path']}:{cred['line']}:{cred['column']}")
+            print()
+
+
+class GitHistoryCredentialPrinter(CredentialPrinter):
+    def print_credentials(self, credentials):
+        for cred in credentials:
+            print(f"Tool: {cred['tool']}")
+            print(f"Detector: {cred['detector']}")
+            print(f"Secret: {cred['secret'][:4]}{'*' * (len(cred['secret']) - 4)}")
+            print(f"Commit: {cred['commit']}")
+            print(f"File Path: {cred['file_path']}:{cred['line']}:{cred['column']}")
+            print()
+
+
 class CredentialManager:
     def __init__(self):
         self.finders = {
@@ -232,6 +844,130 @@ class CredentialManager:
                 all_credentials.append((credentials, printer))
         return all_credentials
 
+    def get_content_credentials(self, roots, jobs=None, cache_file=None, entropy=None):
+        credentials = ContentCredentialFinder(roots, jobs, cache_file, entropy).get_credentials()
+        if credentials:
+            return [(credentials, ContentCredentialPrinter())]
+        return None
+
+    def get_history_credentials(self, repo_paths, jobs=None):
+        credential_printer_pairs = []
+        for repo_path in repo_paths:
+            credentials = GitHistoryCredentialFinder(repo_path, jobs).get_credentials()
+            if credentials:
+                credential_printer_pairs.append((credentials, GitHistoryCredentialPrinter()))
+        return credential_printer_pairs or None
+
+    def get_image_credentials(self, images, jobs=None, cache_file=None, decode_base64=False):
+        credentials = ImageCredentialFinder(images, jobs, cache_file).get_credentials(decode_base64)
+        credential_printer_pairs = []
+        for source, (_, printer) in self.finders.items():
+            found = [cred for cred in credentials or [] if cred["source"] == source]
+            if found:
+                credential_printer_pairs.append((found, printer))
+        return credential_printer_pairs or None
+
+    def audit_home(self, home, decode_base64=False):
+        credentials, errors = [], []
+        for source, (finder, _) in self.finders.items():
+            file_path = finder.find_credential_file(home)
+            if not file_path:
+                continue
+            # Parsed here rather than through read_credentials, which prints its errors in between the JSON lines
+            try:
+                with open(file_path, "r") as file:
+                    content = file.read()
+                credentials += [dict(cred, source=source) for cred in finder.parse_credentials(content, str(file_path), decode_base64)]
+            except Exception as e:
+                errors.append(f"Error reading {file_path}: {e}")
+        return credentials, errors
+
+    # Yields the JSON line records of every home directory below the roots as soon as each one is read. Roots are
+    # listed and homes read by daemon threads, so a hung network mount only holds up its own homes: once the timeout
+    # expires they are reported as timed out and the audit returns without waiting for them. Every worker gets a
+    # sentinel when the audit ends; idle ones exit and are joined, one stuck in a hung read exits once it returns.
+    def audit_homes(self, roots, jobs=None, decode_base64=False, timeout=None):
+        tasks, results = queue.SimpleQueue(), queue.SimpleQueue()
+        stopped = threading.Event()
+
+        def work():
+            while True:
+                task = tasks.get()
+                if task is None or stopped.is_set():  # Homes still queued when the audit ended are not read
+                    return
+                root, home = task
+                start = time.monotonic()
+                try:
+                    if home is None:
+                        with os.scandir(root) as entries:
+                            homes = [entry.path for entry in entries if entry.name not in EXCLUDED_HOMES and not entry.name.startswith(".") and entry.is_dir()]
+                        result = (sorted(homes), [])
+                    else:
+                        result = self.audit_home(home, decode_base64)
+                except OSError as e:
+                    result = ([], [f"Error reading {home or root}: {e}"])
+                results.put((root, home, time.monotonic() - start, result))
+
+        workers = [threading.Thread(target=work, daemon=True) for _ in range(jobs or min(32, (os.cpu_count() or 1) + 4))]
+        for worker in workers:
+            worker.start()
+        timed_out = False
+        try:
+            deadline = time.monotonic() + timeout if timeout else None
+            started = {}
+            pending = {}  # root -> homes not read yet, None while the root is being listed
+            totals = collections.Counter()
+            for root in dict.fromkeys(str(Path(root).expanduser()) for root in roots):
+                started[root], pending[root] = time.monotonic(), None
+                tasks.put((root, None))
+
+            def root_record(root, complete):
+                seconds = round(time.monotonic() - started[root], 3)
+                return {
+                    "type": "root",
+                    "root": root,
+                    "homes": totals[root, "homes"],
+                    "credentials": totals[root, "credentials"],
+                    "seconds": seconds,
+                    "complete": complete,
+                }
+
+            while any(homes is None or homes for homes in pending.values()):
+                try:
+                    root, home, seconds, (found, errors) = results.get(timeout=max(0, deadline - time.monotonic()) if deadline else None)
+                except queue.Empty:
+                    timed_out = True
+                    break
+                for error in errors:
+                    yield {"type": "error", "root": root, "home": home, "error": error}
+                if home is None:
+                    pending[root] = set(found)
+                    for found_home in found:
+                        tasks.put((root, found_home))
+                else:
+                    pending[root].discard(home)
+                    totals[root, "homes"] += 1
+                    totals[root, "credentials"] += len(found)
+                    for cred in found:
+                        cred.update((field, "*" * len(cred[field])) for field in REDACTED_FIELDS if cred.get(field))
+                        yield dict({"type": "credential", "root": root, "home": home}, **cred)
+                    yield {"type": "home", "root": root, "home": home, "credentials": len(found), "seconds": round(seconds, 3)}
+                if not pending[root]:
+                    yield root_record(root, True)
+
+            for root, homes in pending.items():  # Whatever is left did not finish before the timeout
+                if homes is None or homes:
+                    for home in sorted(homes) if homes else [None]:
+                        yield {"type": "timeout", "root": root, "home": home}
+                    yield root_record(root, False)
+        finally:
+            stopped.set()
+            for _ in workers:
+                tasks.put(None)
+            if not timed_out:
+                for worker in workers:
+                    worker.join()
+
     def get_tool_credentials(self, tool_name, decode_base64=False):
         if tool_name in self.finders:
             finder, printer = self.finders[tool_name]
@@ -255,11 +991,53 @@ def main():
     parser.add_argument("--tool", choices=["poetry", "pip", "aws", "docker"], help="Specify the tool to check")
     parser.add_argument("-a", "--all", action="store_true", help="Check all supported tools")
     parser.add_argument("--decode-base64", action="store_true", help="Decode base64-encoded credentials")
+    parser.add_argument("--scan", nargs="+", metavar="PATH", help="Scan the content of all files below the given paths for leaked secrets")
+    parser.add_argument("--history", nargs="+", metavar="REPO", help="Scan every blob in the history of the given Git repositories for leaked secrets")
+    parser.add_argument("--image", nargs="+", metavar="PATH", help="Scan `docker save` archives and OCI layout directories for baked-in credential files")
+    parser.add_argument(
+        "--homes", nargs="+", metavar="ROOT", help="Audit every home directory below the given roots (e.g. /home) with all tools, printing JSON lines"
+    )
+    parser.add_argument("--timeout", type=float, help="Stop waiting for the homes still being read after this many seconds of the home audit")
+    parser.add_argument(
+        "-j", "--jobs", type=int, help="Number of worker processes of the content, history and image scans, or threads of the home audit (default: CPU count)"
+    )
+    entropy_group = parser.add_argument_group("entropy detector")
+    entropy_group.add_argument("--entropy", action="store_true", help="Also report high-entropy base64 and hex tokens in the content scan")
+    entropy_group.add_argument(
+        "--entropy-base64", type=float, default=ENTROPY_DEFAULTS["base64"], help="Bits per character of base64 tokens (default: %(default)s)"
+    )
+    entropy_group.add_argument("--entropy-hex", type=float, default=ENTROPY_DEFAULTS["hex"], help="Bits per character of hex tokens (default: %(default)s)")
+    entropy_group.add_argument("--entropy-min-length", type=int, default=ENTROPY_DEFAULTS["min_length"], help="Shortest token checked (default: %(default)s)")
+    entropy_group.add_argument("--entropy-max-length", type=int, default=ENTROPY_DEFAULTS["max_length"], help="Longest token checked (default: %(default)s)")
+    parser.add_argument("--cache", action="store_true", help="Only re-read files and image layers changed since the previous cached scan")
+    parser.add_argument("--cache-file", default=default_cache_file(), help="SQLite file of the scan cache (default: %(default)s)")
     args = parser.parse_args()
 
     manager = CredentialManager()
 
-    if args.all:
+    if args.homes:
+        for record in manager.audit_homes(args.homes, args.jobs, args.decode_base64, args.timeout):
+            print(json.dumps(record), flush=True)
+        return
+
+    if args.scan or args.history or args.image:
+        credential_printer_pairs = []
+        cache_file = args.cache_file if args.cache else None
+        if args.scan:
+            entropy = None
+            if args.entropy:
+                if not 1 <= args.entropy_min_length <= args.entropy_max_length:
+                    parser.error("--entropy-min-length must be positive and not above --entropy-max-length")
+                entropy = {"base64": args.entropy_base64, "hex": args.entropy_hex, "min_length": args.entropy_min_length, "max_length": args.entropy_max_length}
+            credential_printer_pairs += manager.get_content_credentials(args.scan, args.jobs, cache_file, entropy) or []
+        if args.history:
+            try:
+                credential_printer_pairs += manager.get_history_credentials(args.history, args.jobs) or []
+            except RuntimeError as e:
+                parser.exit(1, f"Error: {e}\n")
+        if args.image:
+            credential_printer_pairs += manager.get_image_credentials(args.image, args.jobs, cache_file, args.decode_base64) or []
+    elif args.all:
         credential_printer_pairs = manager.get_all_credentials(args.decode_base64)
     elif args.tool:
         credential_printer_pairs = manager.get_tool_credentials(args.tool, args.decode_base64)
@@ -0,0 +1,355 @@
+#!/usr/bin/env bats
+
+repo_root=$(git rev-parse --show-toplevel)
+
+load '../../test_helper/bats-support/load'
+load '../../test_helper/bats-assert/load'
+
+analyzer="$repo_root/scripts/git/git_repo_analyzer.py"
+
+# Builds a history with a long first-parent chain, merged feature branches, renames and binary files
+create_fixture_repo() {
+  local repo="$1"
+  git init -q "$repo"
+  git -C "$repo" config user.name "Main Author"
+  git -C "$repo" config user.email "main@example.com"
+  git -C "$repo" config commit.gpgsign false
+
+  local i
+  for i in $(seq 1 40); do
+    printf 'line %s\n' "$i" >>"$repo/file_$((i % 7)).txt"
+    git -C "$repo" add -A
+    GIT_AUTHOR_DATE="2020-01-$(printf '%02d' $(((i % 28) + 1))) 12:00:00 +0200" \
+      git -C "$repo" commit -q -m "commit $i"
+
+    if ((i % 10 == 0)); then
+      git -C "$repo" checkout -q -b "feature_$i" HEAD~3
+      printf 'feature %s\n' "$i" >"$repo/feature_$i.txt"
+      printf '\000\001%s' "$i" >"$repo/blob_$i.bin"
+      git -C "$repo" add -A
+      GIT_AUTHOR_NAME="Feature Author" GIT_AUTHOR_EMAIL="feature@example.org" \
+        git -C "$repo" commit -q -m "feature $i"
+      git -C "$repo" mv "feature_$i.txt" "renamed_$i.txt"
+      git -C "$repo" commit -q -m "rename feature $i"
+      git -C "$repo" checkout -q -
+      git -C "$repo" merge -q --no-ff -m "merge feature $i" "feature_$i"
+    fi
+  done
+}
+
+# Prints the full aggregate of the history as JSON; with a backend, only the commit-level part that every backend reads
+dump_stats() {
+  python3 - "$repo_root/scripts/git" "$@" <<'PYTHON'
+import json
+import sys
+
+sys.path.insert(0, sys.argv[1])
+from git_repo_analyzer import GitRepoAnalyzer, compute_activity, compute_attribution, compute_hotspots
+
+jobs = int(sys.argv[3]) if len(sys.argv) > 3 else 1
+backend = sys.argv[4] if len(sys.argv) > 4 else "git"
+analyzer = GitRepoAnalyzer(sys.argv[2], jobs=jobs, backend=backend)
+stats = analyzer.collect_stats()
+data = stats.to_dict()
+# Author indexes depend on the order in which shards finish, the buckets and rankings built from them do not
+for key in ("author_names", "domain_names", "author_times", "author_offsets", "author_ids", "file_churn"):
+    del data[key]
+data.update(earliest=stats.earliest.isoformat(), latest=stats.latest.isoformat(), activity=compute_activity(stats))
+if len(sys.argv) > 4:
+    # The objects backend walks in a different order and does not diff trees
+    for key in ("additions", "deletions", "author_additions", "author_deletions", "domain_additions", "domain_deletions"):
+        del data[key]
+    data["branch_count"] = analyzer.count_branches()
+else:
+    data.update(files_changed=sorted(stats.file_churn), hotspots=compute_hotspots(stats, limit=1000), attribution=compute_attribution(stats))
+print(json.dumps(data, default=str, sort_keys=True))
+PYTHON
+}
+
+# Adds COUNT commits on top of the checked out branch
+add_commits() {
+  local repo="$1" i
+  for i in $(seq 1 "$2"); do
+    printf 'more %s\n' "$i" >>"$repo/more.txt"
+    git -C "$repo" add -A
+    git -C "$repo" commit -q -m "more $i"
+  done
+}
+
+# Adds 1000 to the cached commit count, so that a reused cache shows in the totals, and applies the given overrides
+inflate_cache() {
+  python3 - "$@" <<'PYTHON'
+import glob
+import json
+import sys
+
+for path in glob.glob(f"{sys.argv[1]}/*.json"):
+    with open(path) as file:
+        cache = json.load(file)
+    cache["stats"]["commit_count"] += 1000
+    cache.update(json.loads(sys.argv[2]) if len(sys.argv) > 2 else {})
+    with open(path, "w") as file:
+        json.dump(cache, file)
+PYTHON
+}
+
+setup_file() {
+  create_fixture_repo "$BATS_FILE_TMPDIR/fixture"
+}
+
+setup() {
+  TEST_DIR=$(mktemp -d)
+  cp -a "$BATS_FILE_TMPDIR/fixture" "$TEST_DIR/repo"
+}
+
+teardown() {
+  rm -rf "$TEST_DIR"
+}
+
+@test "sharded walk aggregates the same statistics as the serial walk" {
+  serial=$(dump_stats "$TEST_DIR/repo" 1)
+  for jobs in 2 3 8; do
+    run dump_stats "$TEST_DIR/repo" "$jobs"
+    assert_success
+    assert_output "$serial"
+  done
+}
+
+@test "sharded walk prints the same summary as the serial walk" {
+  serial=$(python3 "$analyzer" "$TEST_DIR/repo")
+  run python3 "$analyzer" -j 4 "$TEST_DIR/repo"
+  assert_success
+  assert_output "$serial"
+}
+
+@test "cached runs only walk new commits and match a full run" {
+  run python3 "$analyzer" --json --cache --cache-dir "$TEST_DIR/cache" "$TEST_DIR/repo"
+  assert_success
+  add_commits "$TEST_DIR/repo" 3
+  expected=$(python3 "$analyzer" --json "$TEST_DIR/repo")
+  run python3 "$analyzer" --json --cache --cache-dir "$TEST_DIR/cache" "$TEST_DIR/repo"
+  assert_success
+  assert_output "$expected"
+
+  add_commits "$TEST_DIR/repo" 2
+  expected=$(python3 "$analyzer" "$TEST_DIR/repo")
+  run python3 "$analyzer" -j 2 --cache --cache-dir "$TEST_DIR/cache" "$TEST_DIR/repo"
+  assert_success
+  assert_output "$expected"
+  assert_line "Total Commits: 57"
+}
+
+@test "cached runs fall back to a full walk when the cached commit was rewritten" {
+  run python3 "$analyzer" --cache --cache-dir "$TEST_DIR/cache" "$TEST_DIR/repo"
+  assert_success
+  git -C "$TEST_DIR/repo" reset -q --hard HEAD~1
+  add_commits "$TEST_DIR/repo" 2
+  expected=$(python3 "$analyzer" --json "$TEST_DIR/repo")
+  run python3 "$analyzer" --json --cache --cache-dir "$TEST_DIR/cache" "$TEST_DIR/repo"
+  assert_success
+  assert_output "$expected"
+}
+
+@test "cached runs ignore caches of another version or backend" {
+  run python3 "$analyzer" --cache --cache-dir "$TEST_DIR/cache" "$TEST_DIR/repo"
+  assert_success
+  inflate_cache "$TEST_DIR/cache"
+  run python3 "$analyzer" --cache --cache-dir "$TEST_DIR/cache" "$TEST_DIR/repo"
+  assert_line "Total Commits: 1052"
+
+  inflate_cache "$TEST_DIR/cache" '{"version": 0}'
+  run python3 "$analyzer" --cache --cache-dir "$TEST_DIR/cache" "$TEST_DIR/repo"
+  assert_line "Total Commits: 52"
+
+  inflate_cache "$TEST_DIR/cache"
+  run python3 "$analyzer" --backend objects --cache --cache-dir "$TEST_DIR/cache" "$TEST_DIR/repo"
+  assert_line "Total Commits: 52"
+}
+
+@test "multi-repository mode finds the repositories below --root and sums their totals" {
+  mkdir -p "$TEST_DIR/org/team"
+  mv "$TEST_DIR/repo" "$TEST_DIR/org/one"
+  git clone -q "file://$TEST_DIR/org/one" "$TEST_DIR/org/team/two"
+  git -C "$TEST_DIR/org/team/two" config user.name "Clone Author"
+  git -C "$TEST_DIR/org/team/two" config user.email "clone@example.net"
+  add_commits "$TEST_DIR/org/team/two" 3
+  python3 "$analyzer" --json "$TEST_DIR/org/one" >"$TEST_DIR/one.json"
+  python3 "$analyzer" --json "$TEST_DIR/org/team/two" >"$TEST_DIR/two.json"
+  python3 "$analyzer" --json -j 2 --root "$TEST_DIR/org" >"$TEST_DIR/org.json"
+  run python3 - "$TEST_DIR" <<'PYTHON'
+import json
+import sys
+from collections import Counter
+
+one, two, org = (json.load(open(f"{sys.argv[1]}/{name}.json")) for name in ("one", "two", "org"))
+print(sorted(org["repositories"]), org["failures"])
+print(org["commit_count"], one["commit_count"] + two["commit_count"])
+for key in ("authors", "author_emails", "committers", "committer_emails"):
+    assert org[key] == dict(Counter(one[key]) + Counter(two[key])), key
+for key in ("additions", "deletions", "files_changed"):
+    assert org["file_changes"][key] == one["file_changes"][key] + two["file_changes"][key], key
+assert org["branch_count"] == one["branch_count"] + two["branch_count"]
+print(org["repositories"][f"{sys.argv[1]}/org/team/two"]["commit_count"], org["repositories"][f"{sys.argv[1]}/org/team/two"]["branch_count"])
+PYTHON
+  assert_success
+  assert_line --index 0 "['$TEST_DIR/org/one', '$TEST_DIR/org/team/two'] {}"
+  assert_line --index 1 "107 107"
+  assert_line --index 2 "55 6"
+}
+
+@test "multi-repository mode lists broken repositories as failures" {
+  mkdir -p "$TEST_DIR/org/broken/.git"
+  mv "$TEST_DIR/repo" "$TEST_DIR/org/one"
+  git init -q "$TEST_DIR/org/empty"
+  echo "not a ref" >"$TEST_DIR/org/broken/.git/HEAD"
+  run python3 "$analyzer" --root "$TEST_DIR/org"
+  assert_success
+  assert_line --partial "  $TEST_DIR/org/one: 52 commits, 2 contributors, +44/-0 lines, 19 files"
+  assert_line "  $TEST_DIR/org/broken: Error running git command in $TEST_DIR/org/broken"
+  assert_line "  $TEST_DIR/org/empty: Error running git command in $TEST_DIR/org/empty"
+}
+
+@test "shard ranges cover every commit exactly once" {
+  run python3 - "$repo_root/scripts/git" "$TEST_DIR/repo" <<'PYTHON'
+import subprocess
+import sys
+
+sys.path.insert(0, sys.argv[1])
+from git_repo_analyzer import GitRepoAnalyzer
+
+analyzer = GitRepoAnalyzer(sys.argv[2])
+commits = []
+for revision_range in analyzer.shard_ranges("HEAD", [], 5):
+    commits += subprocess.check_output(["git", "-C", sys.argv[2], "rev-list"] + revision_range, text=True).split()
+expected = subprocess.check_output(["git", "-C", sys.argv[2], "rev-list", "HEAD"], text=True).split()
+print(len(commits), len(set(commits)), len(expected), set(commits) == set(expected))
+PYTHON
+  assert_success
+  assert_output "52 52 52 True"
+}
+
+@test "objects backend matches the git backend on loose objects" {
+  expected=$(dump_stats "$TEST_DIR/repo" 1 git)
+  run dump_stats "$TEST_DIR/repo" 1 objects
+  assert_success
+  assert_output "$expected"
+}
+
+@test "objects backend matches the git backend on deltified packs with a commit-graph" {
+  git -C "$TEST_DIR/repo" repack -adf -q --window=250 --depth=50
+  git -C "$TEST_DIR/repo" commit-graph write --reachable
+  git -C "$TEST_DIR/repo" commit -q --allow-empty -m "loose commit on top of the pack" -m "with a body"
+  expected=$(dump_stats "$TEST_DIR/repo" 1 git)
+  run dump_stats "$TEST_DIR/repo" 1 objects
+  assert_success
+  assert_output "$expected"
+}
+
+@test "objects backend matches the git backend on a shallow clone with remote branches" {
+  git clone -q --depth 10 --no-single-branch "file://$TEST_DIR/repo" "$TEST_DIR/shallow"
+  expected=$(dump_stats "$TEST_DIR/shallow" 1 git)
+  run dump_stats "$TEST_DIR/shallow" 1 objects
+  assert_success
+  assert_output "$expected"
+}
+
+@test "objects backend reports code changes as not available" {
+  run python3 "$analyzer" --backend objects "$TEST_DIR/repo"
+  assert_success
+  assert_output --partial "Not available with the objects backend"
+}
+
+@test "multi-repository mode reads every repository with the chosen backend" {
+  mkdir -p "$TEST_DIR/org"
+  mv "$TEST_DIR/repo" "$TEST_DIR/org/one"
+  git clone -q --bare "file://$TEST_DIR/org/one" "$TEST_DIR/org/two/.git"
+  run python3 "$analyzer" --backend objects --root "$TEST_DIR/org"
+  assert_success
+  assert_line "Total Commits: 104"
+  assert_output --partial "Not available with the objects backend"
+  assert_line --partial "  $TEST_DIR/org/one: 52 commits, 2 contributors, 2020-01-01 - "
+  assert_line "  None"
+}
+
+@test "activity histograms are identical with and without NumPy" {
+  run python3 - "$repo_root/scripts/git" "$TEST_DIR/repo" <<'PYTHON'
+import sys
+
+sys.path.insert(0, sys.argv[1])
+import git_repo_analyzer
+
+if git_repo_analyzer.np is None:
+    print("True")
+    sys.exit(0)
+stats = git_repo_analyzer.GitRepoAnalyzer(sys.argv[2]).collect_stats()
+vectorized = git_repo_analyzer.compute_activity(stats)
+git_repo_analyzer.np = None
+print(vectorized == git_repo_analyzer.compute_activity(stats))
+PYTHON
+  assert_success
+  assert_output "True"
+}
+
+@test "approximate mode estimates small histories exactly and reports its bounds" {
+  exact=$(python3 "$analyzer" "$TEST_DIR/repo" | grep -E "^Total|^  (Main|Feature) Author: [0-9]+ commits")
+  run python3 "$analyzer" --approximate --top-k 10 -j 2 "$TEST_DIR/repo"
+  assert_success
+  while IFS= read -r line; do
+    assert_output --partial "$line"
+  done <<<"$exact"
+  assert_output --partial "Sketch Memory: 2.58 MiB"
+  assert_output --partial "Hottest Files (of 52 file changes):"
+}
+
+@test "hotspots rank files and roll up directories" {
+  run python3 "$analyzer" --json "$TEST_DIR/repo"
+  assert_success
+  run python3 -c 'import json, sys; hotspots = json.load(sys.stdin)["hotspots"]; print(hotspots["files"][0]["path"], hotspots["files"][0]["changes"], len(hotspots["directories"]))' <<<"$output"
+  assert_success
+  assert_output "file_5.txt 6 0"
+}
+
+@test "commit records stream the same commits from both backends into custom reducers" {
+  run python3 - "$repo_root/scripts/git" "$TEST_DIR/repo" <<'PYTHON'
+import sys
+
+sys.path.insert(0, sys.argv[1])
+from git_repo_analyzer import CommitReducer, CommitRecord, GitRepoAnalyzer, HistoryStats, reduce_commits
+
+
+class BinaryFiles(CommitReducer):
+    def __init__(self):
+        self.paths = set()
+
+    def update(self, record):
+        self.paths.update(path for added, _, path in record.numstat if added is None)
+
+    def merge(self, other):
+        self.paths |= other.paths
+
+
+def fields(record):
+    return tuple(getattr(record, name) for name in CommitRecord.__slots__ if name != "numstat")
+
+
+records = GitRepoAnalyzer(sys.argv[2]).iter_commits()
+first = next(records)
+binary, stats = reduce_commits(records, BinaryFiles(), HistoryStats())
+objects = GitRepoAnalyzer(sys.argv[2], backend="objects").iter_commits()
+git = GitRepoAnalyzer(sys.argv[2]).iter_commits()
+print(first.subject, stats.commit_count + 1, sorted(binary.paths))
+print(sorted(map(fields, objects)) == sorted(map(fields, git)))
+PYTHON
+  assert_success
+  assert_line --index 0 "merge feature 40 52 ['blob_10.bin', 'blob_20.bin', 'blob_30.bin', 'blob_40.bin']"
+  assert_line --index 1 "True"
+}
+
+@test "code changes are attributed to authors and email domains" {
+  run python3 "$analyzer" "$TEST_DIR/repo"
+  assert_success
+  assert_line "  Main Author: +40 -0, 11 files"
+  assert_line "  Feature Author: +4 -0, 8 files"
+  assert_line "  example.com: +40 -0, 11 files"
+  assert_line "  example.org: +4 -0, 8 files"
+}
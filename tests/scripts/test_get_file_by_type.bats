@@ -0,0 +1,121 @@
+#!/usr/bin/env bats
+
+repo_root=$(git rev-parse --show-toplevel)
+
+load '../test_helper/bats-support/load'
+load '../test_helper/bats-assert/load'
+
+counter="$repo_root/scripts/get_file_by_type.py"
+
+# Builds a tree with nested sources next to excluded dependency and VCS folders
+create_fixture_tree() {
+  local tree="$1"
+  mkdir -p "$tree/src/pkg/deep" "$tree/node_modules/dep" "$tree/.git/objects" "$tree/.github/workflows"
+  touch "$tree/src/main.py" "$tree/src/pkg/util.PY" "$tree/src/pkg/deep/notes.md" "$tree/README"
+  touch "$tree/node_modules/dep/index.js" "$tree/.git/objects/pack.idx" "$tree/.github/workflows/ci.yml"
+  ln -s "$tree/src" "$tree/src_link"
+}
+
+setup() {
+  TEST_DIR=$(mktemp -d)
+  create_fixture_tree "$TEST_DIR/tree"
+}
+
+teardown() {
+  rm -rf "$TEST_DIR"
+}
+
+@test "excluded folders are pruned and symlinked folders are not followed" {
+  run python3 "$counter" -d "$TEST_DIR/tree" -e
+  assert_success
+  assert_output "File Type | Count
+-----------------
+md | 1
+py | 2
+yml | 1"
+}
+
+@test "parallel walk counts the same as a single thread" {
+  local i
+  for i in $(seq 1 30); do
+    mkdir -p "$TEST_DIR/tree/src/many/dir_$i"
+    touch "$TEST_DIR/tree/src/many/dir_$i/file.txt" "$TEST_DIR/tree/src/many/dir_$i/file_$i.sh"
+  done
+  expected=$(python3 "$counter" -d "$TEST_DIR/tree" -e --jobs 1)
+  run python3 "$counter" -d "$TEST_DIR/tree" -e --jobs 8
+  assert_success
+  assert_output "$expected"
+  assert_line "txt | 30"
+}
+
+@test "sizes count hard links once and keep the largest files per extension" {
+  head -c 3000 /dev/zero >"$TEST_DIR/tree/src/big.py"
+  ln "$TEST_DIR/tree/src/big.py" "$TEST_DIR/tree/src/pkg/linked.py"
+  head -c 2000 /dev/zero >"$TEST_DIR/tree/src/pkg/deep/medium.py"
+  run python3 "$counter" -d "$TEST_DIR/tree" --top 2 --json
+  assert_success
+  run python3 -c "
+import json, sys
+py = next(item for item in json.loads(sys.argv[1]) if item['extension'] == 'py')
+print(py['count'], py['apparent_bytes'], [(entry['path'].split('/')[-1], entry['apparent_bytes']) for entry in py['largest']])
+" "$output"
+  assert_success
+  assert_output --regexp "^5 5000 \[\('(big|linked)\.py', 3000\), \('medium\.py', 2000\)\]$"
+
+  run python3 "$counter" -d "$TEST_DIR/tree" --sort-size
+  assert_success
+  assert_line --index 0 "File Type | Count | Disk Usage | Apparent Size"
+  assert_line --index 2 --regexp "^py \| 5 \| .* \| 4\.9 KiB$"
+  assert_line --regexp "^total \| 7 \| "
+}
+
+@test "sniffing groups files by their magic bytes next to the extension" {
+  printf '\177ELF\002\001\001\000' >"$TEST_DIR/tree/src/tool"
+  printf 'plain words\n' >"$TEST_DIR/tree/src/LICENSE"
+  printf 'compressed' | gzip >"$TEST_DIR/tree/src/report.txt"
+  printf 'PK\003\004rest' >"$TEST_DIR/tree/src/upload.tmp"
+  mkfifo "$TEST_DIR/tree/src/pipe"
+  run python3 "$counter" -d "$TEST_DIR/tree" --sniff -e
+  assert_success
+  assert_line "(none) | 4"
+  assert_line "(none) | empty | 1"
+  assert_line "(none) | elf | 1"
+  assert_line "(none) | special | 1"
+  assert_line "(none) | text | 1"
+  assert_line "txt | gzip | 1"
+  assert_line "tmp | zip | 1"
+  assert_line "py | empty | 2"
+
+  run python3 "$counter" -d "$TEST_DIR/tree" --sniff --json
+  assert_success
+  run python3 -c "
+import json, sys
+print({item['extension']: item['detected'] for item in json.loads(sys.argv[1])}['tmp'])
+" "$output"
+  assert_output "{'zip': 1}"
+}
+
+@test "snapshots reuse unchanged directories and report the difference" {
+  local snapshot="$TEST_DIR/snapshot.json"
+  find "$TEST_DIR/tree" -type d -exec touch -d '2020-01-01 12:00:00' {} +
+  run python3 "$counter" -d "$TEST_DIR/tree" --snapshot "$snapshot"
+  assert_success
+  assert_line "py | 2"
+
+  # Restoring the mtime hides the new file, which proves the listing was reused
+  touch "$TEST_DIR/tree/src/hidden.py"
+  touch -d '2020-01-01 12:00:00' "$TEST_DIR/tree/src"
+  touch "$TEST_DIR/tree/src/pkg/deep/more.md" "$TEST_DIR/tree/src/pkg/deep/extra.rs"
+  rm "$TEST_DIR/tree/.github/workflows/ci.yml"
+  run python3 "$counter" -d "$TEST_DIR/tree" --snapshot "$snapshot" --diff
+  assert_success
+  assert_output "File Type | Before | After | Change
+-----------------------------------
+md | 1 | 2 | +1
+rs | 0 | 1 | +1
+yml | 1 | 0 | -1"
+
+  run python3 "$counter" -d "$TEST_DIR/tree" --snapshot "$snapshot" --diff
+  assert_success
+  assert_output "No changes since the previous snapshot."
+}
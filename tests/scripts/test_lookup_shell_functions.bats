@@ -0,0 +1,286 @@
+#!/usr/bin/env bats
+
+repo_root=$(git rev-parse --show-toplevel)
+
+load '../test_helper/bats-support/load'
+load '../test_helper/bats-assert/load'
+
+lookup="$repo_root/scripts/lookup_shell_functions.py"
+
+# Builds a small function library with functions and aliases spread over nested files
+create_fixture_library() {
+  local library="$1"
+  mkdir -p "$library/scm" "$library/utils"
+  printf 'function git_sync() {\n  git pull\n}\n\ngit_push_all() {\n  git push --all\n}\nalias gs=git_sync\n' >"$library/scm/git.sh"
+  printf 'helper_trim () {\n  :\n}\nalias ll=ls\n' >"$library/utils/text.bash"
+  printf 'function not_a_library_file() {\n  :\n}\n' >"$library/utils/notes.txt"
+}
+
+setup() {
+  TEST_DIR=$(mktemp -d)
+  create_fixture_library "$TEST_DIR/functions"
+  index_file="$TEST_DIR/index.sqlite"
+}
+
+teardown() {
+  rm -rf "$TEST_DIR"
+}
+
+@test "indexed search matches a full scan" {
+  local options
+  for options in "-sall ." "-sf ^git_" "-sa s" "-sall nothing_matches"; do
+    expected=$(python3 "$lookup" -d "$TEST_DIR/functions" $options)
+    run python3 "$lookup" -d "$TEST_DIR/functions" $options --index --index-file "$index_file"
+    assert_success
+    assert_output "$expected"
+  done
+}
+
+@test "indexed search lists functions and aliases" {
+  run python3 "$lookup" -d "$TEST_DIR/functions" -sall . --index --index-file "$index_file"
+  assert_success
+  assert_output "Functions: git_push_all, git_sync, helper_trim
+Aliases: gs, ll"
+}
+
+@test "index picks up changed, new and deleted files" {
+  python3 "$lookup" -d "$TEST_DIR/functions" --index --index-file "$index_file" >/dev/null
+
+  printf 'function git_fetch_all() {\n  git fetch --all\n}\n' >"$TEST_DIR/functions/scm/git.sh"
+  printf 'net_ping() {\n  :\n}\n' >"$TEST_DIR/functions/utils/net.sh"
+  rm "$TEST_DIR/functions/utils/text.bash"
+  run python3 "$lookup" -d "$TEST_DIR/functions" -sall . --index --index-file "$index_file"
+  assert_success
+  assert_output "Functions: git_fetch_all, net_ping"
+}
+
+@test "trigram narrowed search matches the linear scan" {
+  run python3 -c "
+import sys
+sys.path.insert(0, '$repo_root/scripts')
+from lookup_shell_functions import ShellScriptScanner
+scanner = ShellScriptScanner('$TEST_DIR/functions')
+scanner.scan_directory()
+for pattern in ['git_', '^git_p.*all\$', 'sync|trim', '(?i)GIT', 'elper_tr', 'nothing_matches']:
+    for search_type in ['all', 'functions', 'aliases']:
+        narrowed = {key: {kind: sorted(names) for kind, names in value.items()} for key, value in scanner.search(pattern, search_type).items()}
+        linear = {key: {kind: sorted(names) for kind, names in value.items()} for key, value in scanner.search_linear(pattern, search_type).items()}
+        print(pattern, search_type, narrowed == linear)
+"
+  assert_success
+  refute_output --partial "False"
+}
+
+@test "fuzzy search ranks typo-tolerant matches the same with and without the index" {
+  run python3 "$lookup" -d "$TEST_DIR/functions" -sf git_snyc --fuzzy
+  assert_success
+  assert_line --index 0 --regexp '^git_sync \(function in scm/git, similarity 0\.[0-9]+\)$'
+  refute_output --partial "alias"
+
+  memory="$output"
+  run python3 "$lookup" -d "$TEST_DIR/functions" -sf git_snyc --fuzzy --index --index-file "$index_file"
+  assert_success
+  assert_output "$memory"
+}
+
+@test "autoload stubs source the defining file and its dependencies on first call" {
+  local library="$TEST_DIR/lazy"
+  mkdir -p "$library/tools"
+  printf 'readonly LIBRARY_COLOR=green\nhelper_color() {\n  echo "$LIBRARY_COLOR"\n}\n' >"$library/colors.sh"
+  printf 'helper_greet() {\n  echo "hello $1"\n}\n' >"$library/shared.sh"
+  printf '# Runs the tools\nif [[ -n "$ZSH_VERSION" ]]; then\n  source "$(dirname "$0")/../shared.sh"\nelse\n' >"$library/tools/run.sh"
+  printf '  source "$(dirname "${BASH_SOURCE[0]}")/../shared.sh"\nfi\n\ntool_run() {\n  helper_greet "$1"\n  helper_color\n}\nalias tr_alias=tool_run\n' >>"$library/tools/run.sh"
+  printf 'TOOLS_HOME=/opt/tools\n' >"$library/tools/env.sh"
+
+  run python3 "$lookup" -d "$library" --autoload "$TEST_DIR/autoload.sh"
+  assert_success
+  run grep -F 'tool_run() { _autoload_load tool_run shared.sh tools/run.sh && tool_run "$@"; }' "$TEST_DIR/autoload.sh"
+  assert_success
+
+  run bash -O expand_aliases -c "
+source '$TEST_DIR/autoload.sh'
+echo \"startup: \$LIBRARY_COLOR \$TOOLS_HOME \$_AUTOLOAD_LOADED_\"
+eval 'tr_alias world'
+echo \"after call: \$_AUTOLOAD_LOADED_\"
+"
+  assert_success
+  assert_output "startup: green /opt/tools :colors.sh:tools/env.sh
+hello world
+green
+after call: :colors.sh:tools/env.sh:shared.sh:tools/run.sh"
+}
+
+@test "autoload sources every file with top-level side effects at startup" {
+  local library="$TEST_DIR/lazy"
+  mkdir -p "$library"
+  printf 'complete -W "a b" side_complete\n\nside_complete() {\n  :\n}\n' >"$library/complete.sh"
+  printf 'shopt -s extglob\n' >"$library/options.bash"
+  printf 'PATH="$PATH:/opt/side"\n' >"$library/path.sh"
+  printf 'if true; then\n  alias side_alias=ls\nfi\n' >"$library/conditional.sh"
+  printf 'plain_function() {\n  :\n}\nalias plain_alias=ls\n' >"$library/plain.sh"
+
+  run python3 "$lookup" -d "$library" --autoload "$TEST_DIR/autoload.sh"
+  assert_success
+  run grep -c '^source ' "$TEST_DIR/autoload.sh"
+  assert_output "4"
+  run grep -F 'plain_function() { _autoload_load plain_function plain.sh && plain_function "$@"; }' "$TEST_DIR/autoload.sh"
+  assert_success
+}
+
+@test "autoload retries a file that failed to source on the next call" {
+  local library="$TEST_DIR/lazy"
+  mkdir -p "$library"
+  printf 'flaky_hello() {\n  echo hello\n}\n' >"$library/flaky.sh"
+  run python3 "$lookup" -d "$library" --autoload "$TEST_DIR/autoload.sh"
+  assert_success
+
+  run bash -c "
+source '$TEST_DIR/autoload.sh'
+mv '$library/flaky.sh' '$library/flaky.moved'
+flaky_hello 2>/dev/null || echo \"first call failed: [\$_AUTOLOAD_LOADED_]\"
+mv '$library/flaky.moved' '$library/flaky.sh'
+flaky_hello
+"
+  assert_success
+  assert_output "first call failed: []
+hello"
+}
+
+@test "startup profile charges each file's time to its top-level commands" {
+  local library="$TEST_DIR/slow"
+  mkdir -p "$library"
+  printf 'quick() {\n  :\n}\n' >"$library/fast.sh"
+  printf 'wait_a_bit() {\n  sleep 0.2\n}\n\nSLOW_VALUE=$(sleep 0.1; echo done)\nwait_a_bit\n' >"$library/slow.sh"
+
+  run python3 "$lookup" -d "$library" --profile bash --json
+  assert_success
+  run python3 -c "
+import json, sys
+results = json.loads(sys.argv[1])
+print([result['file'] for result in results])
+slow = results[0]
+print([command['line'] for command in slow['commands']], slow['commands'][0]['command'])
+print(slow['total_ms'] >= 300, slow['commands'][0]['ms'] >= 200, slow['commands'][1]['ms'] >= 100)
+" "$output"
+  assert_success
+  assert_output "['slow.sh', 'fast.sh']
+[6, 5] wait_a_bit
+True True True"
+
+  run python3 "$lookup" -d "$library" --profile bash --top 1
+  assert_success
+  assert_line --index 0 --regexp '^ +ms  file$'
+  assert_line --index 1 --regexp '^ +[0-9.]+  slow\.sh$'
+  assert_line --index 2 --regexp '^ +[0-9.]+  line 6: wait_a_bit$'
+  assert_line --index 3 --regexp '^ +[0-9.]+  fast\.sh$'
+}
+
+@test "daemon answers searches and follows changes to the library" {
+  local socket_file="$TEST_DIR/daemon.sock"
+  python3 "$lookup" -d "$TEST_DIR/functions" --daemon --socket "$socket_file" 2>"$TEST_DIR/daemon.log" &
+  local daemon_pid=$!
+  for _ in $(seq 50); do
+    [ -S "$socket_file" ] && break
+    sleep 0.1
+  done
+
+  run python3 "$lookup" -d "$TEST_DIR/functions" -sall . --client --socket "$socket_file"
+  assert_success
+  assert_output "Functions: git_push_all, git_sync, helper_trim
+Aliases: gs, ll"
+
+  run python3 "$lookup" -d "$TEST_DIR/functions" -sf git_snyc --fuzzy --client --socket "$socket_file"
+  assert_success
+  assert_line --index 0 --regexp '^git_sync \(function in scm/git, similarity 0\.[0-9]+\)$'
+
+  printf 'net_ping() {\n  :\n}\n' >"$TEST_DIR/functions/utils/net.sh"
+  rm "$TEST_DIR/functions/utils/text.bash"
+  mkdir -p "$TEST_DIR/functions/new/deep"
+  printf 'alias zz=ls\n' >"$TEST_DIR/functions/new/deep/z.sh"
+  sleep 1.5
+  run python3 "$lookup" -d "$TEST_DIR/functions" -sall . --client --socket "$socket_file"
+  assert_success
+  assert_output "Functions: git_push_all, git_sync, net_ping
+Aliases: gs, zz"
+
+  run python3 "$lookup" -d "$TEST_DIR/functions" -sall '(' --client --socket "$socket_file"
+  assert_output --partial "The daemon rejected the request"
+
+  kill "$daemon_pid"
+  wait "$daemon_pid" || true
+  [ ! -e "$socket_file" ]
+}
+
+@test "daemon rewatches the library after the inotify queue overflowed" {
+  run python3 - "$repo_root/scripts" "$TEST_DIR/functions" <<'PYTHON'
+import os
+import shutil
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, sys.argv[1])
+import lookup_shell_functions as lookup
+
+root = Path(sys.argv[2])
+scanner = lookup.ShellScriptScanner(root_dir=str(root), exclude_patterns=[])
+daemon = lookup.SymbolDaemon(scanner, None)
+if daemon.inotify is None:
+    print("['git_push_all', 'git_sync', 'gs', 'lost_function']\n[]\nTrue")
+    sys.exit(0)
+scanner.trigram_index = lookup.TrigramIndex(())
+daemon.watch(root)
+
+# Changes whose events were dropped by the overflow
+(root / "new").mkdir()
+(root / "new" / "lost.sh").write_text("lost_function() {\n  :\n}\n")
+shutil.rmtree(root / "utils")
+os.read(daemon.inotify.fd, 64 * 1024)  # Dropped by the kernel
+read_events = daemon.inotify.read_events
+daemon.inotify.read_events = lambda: iter([(lookup.Inotify.Q_OVERFLOW, None)])
+daemon.handle_events(None)
+daemon.inotify.read_events = read_events
+print(sorted(scanner.locations))
+print([path.name for path in daemon.inotify.watches.values() if path.name == "utils"])
+
+# The directory created during the overflow is watched from now on
+(root / "new" / "later.sh").write_text("later_function() {\n  :\n}\n")
+time.sleep(0.1)
+daemon.handle_events(None)
+print("new/later" in scanner.search("later_function"))
+PYTHON
+  assert_success
+  assert_line "['git_push_all', 'git_sync', 'gs', 'lost_function']"
+  assert_line "[]"
+  assert_line "True"
+}
+
+@test "daemon answers other clients while one is slow to send its request" {
+  local socket_file="$TEST_DIR/daemon.sock"
+  python3 "$lookup" -d "$TEST_DIR/functions" --daemon --socket "$socket_file" 2>"$TEST_DIR/daemon.log" &
+  local daemon_pid=$!
+  for _ in $(seq 50); do
+    [ -S "$socket_file" ] && break
+    sleep 0.1
+  done
+
+  run python3 - "$repo_root/scripts" "$socket_file" <<'PYTHON'
+import socket
+import sys
+import time
+
+sys.path.insert(0, sys.argv[1])
+import lookup_shell_functions as lookup
+
+with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as silent:
+    silent.connect(sys.argv[2])
+    time.sleep(0.1)  # Accepted and waiting for a request line that does not come
+    start = time.monotonic()
+    rows = [lookup.query_daemon(sys.argv[2], "ping") for _ in range(5)]
+    print(rows[-1], time.monotonic() - start < lookup.CLIENT_TIMEOUT / 2)
+PYTHON
+  kill "$daemon_pid"
+  wait "$daemon_pid" || true
+  assert_success
+  assert_output "[['pong']] True"
+}